@@ -0,0 +1,24 @@
+# Step 1/3 of moving the user location from text to numeric columns:
+# add nullable numeric columns next to the text ones.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0013_userauth_last_login_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userauth',
+            name='location_latitude_num',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userauth',
+            name='location_longitude_num',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
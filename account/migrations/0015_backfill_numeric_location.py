@@ -0,0 +1,44 @@
+# Step 2/3: copy the text location into the numeric columns.
+# Runs outside a single transaction in primary key ordered batches, every
+# batch commits on its own. Only rows whose numeric columns are still empty
+# are picked up, so an interrupted run simply continues where it stopped.
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 2000
+
+
+def to_float(value, limit):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if -limit <= number <= limit else None
+
+
+def backfill(apps, schema_editor):
+    UserAuth = apps.get_model('account', 'UserAuth')
+    pending = UserAuth.objects.filter(location_latitude_num__isnull=True).exclude(location_latitude='')
+    last_pk = 0
+    while True:
+        batch = list(pending.filter(pk__gt=last_pk).order_by('pk').only('pk', 'location_latitude', 'location_longitude')[:BATCH_SIZE])
+        if not batch:
+            break
+        for user in batch:
+            user.location_latitude_num = to_float(user.location_latitude, 90)
+            user.location_longitude_num = to_float(user.location_longitude, 180)
+        with transaction.atomic():
+            UserAuth.objects.bulk_update(batch, ['location_latitude_num', 'location_longitude_num'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('account', '0014_userauth_numeric_location'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
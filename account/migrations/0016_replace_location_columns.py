@@ -0,0 +1,36 @@
+# Step 3/3: drop the text columns, give the numeric ones their names and
+# index them for bounding-box range scans.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0015_backfill_numeric_location'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='userauth',
+            name='location_latitude',
+        ),
+        migrations.RemoveField(
+            model_name='userauth',
+            name='location_longitude',
+        ),
+        migrations.RenameField(
+            model_name='userauth',
+            old_name='location_latitude_num',
+            new_name='location_latitude',
+        ),
+        migrations.RenameField(
+            model_name='userauth',
+            old_name='location_longitude_num',
+            new_name='location_longitude',
+        ),
+        migrations.AddIndex(
+            model_name='userauth',
+            index=models.Index(fields=['role', 'is_online', 'location_latitude', 'location_longitude'], name='account_use_role_1c5560_idx'),
+        ),
+    ]
@@ -8,6 +8,10 @@ from account.manager import UserManager #import from account apps
 class UserAuth(AbstractBaseUser,PermissionsMixin):
     class Meta:
         verbose_name_plural = "User"
+        indexes = [
+            # bounding-box lookups of online drivers around a point
+            models.Index(fields=["role", "is_online", "location_latitude", "location_longitude"]),
+        ]
     ROLE_CHOICES = (
         ('customer', 'Customer'),
         ('driver', 'Driver'),
@@ -20,8 +24,8 @@ class UserAuth(AbstractBaseUser,PermissionsMixin):
     phone_number = models.CharField(max_length=20, blank=True)
     account_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     address = models.TextField(blank=True)
-    location_latitude = models.CharField(max_length=255,blank=True)
-    location_longitude = models.CharField(max_length=255,blank=True)
+    location_latitude = models.FloatField(blank=True, null=True)
+    location_longitude = models.FloatField(blank=True, null=True)
     vehicle = models.CharField(max_length=20, blank=True)
     vehicle_registration_number = models.CharField(max_length=20, blank=True)
     driving_license_number = models.CharField(max_length=20, blank=True)
@@ -14,6 +14,7 @@ import uuid
 from django.db.models import Sum, Count
 from datetime import timedelta
 from customer_portal.models import DeliveryRequest as Order
+from driver_portal.locations import driver_index, update_driver_position
 
 
 def get_tokens_for_user(user):
@@ -316,10 +317,11 @@ class UpdateUserProfileView(APIView):
 
         # Update other fields
         for field in ['name', 'phone_number', 'address', 'vehicle', 'vehicle_registration_number', 'driving_license_number','location_latitude','location_longitude','is_online']:
-            if request.data.get(field) is not None:
-                setattr(user, field, request.data.get(field))
+            if serializer.validated_data.get(field) is not None:
+                setattr(user, field, serializer.validated_data.get(field))
 
         user.save()
+        update_driver_position(user)
         serializer = UserProfileSerializer(user)
         return Response({"status":"success","data": serializer.data}, status=200)
 
@@ -333,6 +335,7 @@ class DeleteUserView(APIView):
         except UserAuth.DoesNotExist:
             return Response({"status":"error","message":"User not found"}, status=404)
         user.delete()
+        driver_index.remove(user_id)
         return Response({"status":"success","message":"User deleted successfully"}, status=200)
     
 
@@ -367,10 +370,11 @@ class UpdateSelfUserProfileView(APIView):
 
         # Update other fields
         for field in ['name', 'phone_number', 'address', 'vehicle', 'vehicle_registration_number', 'driving_license_number','location_latitude','location_longitude']:
-            if request.data.get(field) is not None:
-                setattr(user, field, request.data.get(field))
+            if serializer.validated_data.get(field) is not None:
+                setattr(user, field, serializer.validated_data.get(field))
 
         user.save()
+        update_driver_position(user)
         serializer = UserProfileSerializer(user)
         return Response({"status":"success","data": serializer.data}, status=200)
 
@@ -1,3 +1,7 @@
 from django.contrib import admin
+from .models import EtaModel, OutboxEvent, Sequence
 
 # Register your models here.
+admin.site.register(EtaModel)
+admin.site.register(Sequence)
+admin.site.register(OutboxEvent)
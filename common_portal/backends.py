@@ -0,0 +1,270 @@
+import math
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .eta import get_eta_model
+from .geo import haversine, haversine_matrix
+
+Route = namedtuple('Route', ['distance_km', 'duration_minutes', 'source', 'approximate'])
+
+
+class RoutingError(Exception):
+    pass
+
+
+class BackendUnavailable(RoutingError):
+    """The backend itself is failing (timeout, outage, quota), not just this route"""
+    pass
+
+
+class BaseRoutingBackend:
+    """
+    Interface every routing backend implements.
+    route() returns a Route or raises RoutingError, it must give up after ``timeout`` seconds.
+    """
+    name = 'base'
+    approximate = False
+
+    def route(self, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, timeout=None):
+        raise NotImplementedError
+
+    def matrix(self, origins, destinations, timeout=None):
+        """
+        Routes from every origin to every destination, both lists of (lat, lng).
+        Returns a len(origins) x len(destinations) list of lists, a cell is None
+        when that pair can't be routed.
+        """
+        rows = []
+        for origin in origins:
+            row = []
+            for destination in destinations:
+                try:
+                    row.append(self.route(origin[0], origin[1], destination[0], destination[1], timeout=timeout))
+                except BackendUnavailable:
+                    raise
+                except RoutingError:
+                    row.append(None)
+            rows.append(row)
+        return rows
+
+
+class GoogleRoutingBackend(BaseRoutingBackend):
+    """
+    Driving distance and time from the Google Distance Matrix API.
+    Requests share one keep-alive session, matrix() splits the work into
+    tiles within the API limits and fetches them concurrently.
+    """
+    name = 'google'
+    url = "https://maps.googleapis.com/maps/api/distancematrix/json"
+    max_origins = 25
+    max_destinations = 25
+    max_elements = 100
+
+    def __init__(self, workers=None):
+        self.workers = workers or settings.ROUTING_MATRIX_WORKERS
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount("https://", adapter)
+
+    def _request(self, origins, destinations, timeout):
+        if not settings.GOOGLE_MAPS_API_KEY:
+            raise BackendUnavailable("GOOGLE_MAPS_API_KEY is not configured")
+        params = {
+            "origins": "|".join(f"{lat},{lng}" for lat, lng in origins),
+            "destinations": "|".join(f"{lat},{lng}" for lat, lng in destinations),
+            "units": "metric",
+            "mode": "driving",  # realistic driving distance and time
+            "key": settings.GOOGLE_MAPS_API_KEY,
+        }
+        try:
+            response = self.session.get(self.url, params=params, timeout=timeout or settings.ROUTING_LATENCY_BUDGET)
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise BackendUnavailable(f"Google API error: {e}")
+
+        if data.get("status") != "OK" or len(data.get("rows", [])) != len(origins):
+            raise BackendUnavailable(f"Google API status: {data.get('status')}")
+        return [[self._parse_element(element) for element in row["elements"]] for row in data["rows"]]
+
+    def _parse_element(self, element):
+        if element.get("status") != "OK":
+            return None
+        distance_km = round(element["distance"]["value"] / 1000, 2)  # meters -> km
+        duration_minutes = round(element["duration"]["value"] / 60)  # seconds -> minutes
+        return Route(distance_km, duration_minutes, self.name, self.approximate)
+
+    def route(self, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, timeout=None):
+        route = self._request([(pickup_lat, pickup_lng)], [(dropoff_lat, dropoff_lng)], timeout)[0][0]
+        if route is None:
+            raise RoutingError("Google API found no route")
+        return route
+
+    def tiles(self, n_origins, n_destinations):
+        """(row_start, row_end, col_start, col_end) blocks that fit in one request"""
+        if not n_origins or not n_destinations:
+            return
+        # Spread destinations evenly so the last column of tiles isn't a sliver.
+        max_cols = min(self.max_destinations, self.max_elements)
+        cols = math.ceil(n_destinations / math.ceil(n_destinations / max_cols))
+        rows = min(n_origins, self.max_origins, max(self.max_elements // cols, 1))
+        for row_start in range(0, n_origins, rows):
+            for col_start in range(0, n_destinations, cols):
+                yield row_start, min(row_start + rows, n_origins), col_start, min(col_start + cols, n_destinations)
+
+    def matrix(self, origins, destinations, timeout=None):
+        """
+        Every tile gets what is left of one shared ``timeout``, tiles still
+        queued when it runs out are left as None for the next backend.
+        """
+        result = [[None] * len(destinations) for _ in origins]
+        tiles = list(self.tiles(len(origins), len(destinations)))
+        if not tiles:
+            return result
+        deadline = time.monotonic() + (settings.ROUTING_MATRIX_TIMEOUT if timeout is None else timeout)
+
+        def fetch(tile):
+            row_start, row_end, col_start, col_end = tile
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return tile, []
+            return tile, self._request(origins[row_start:row_end], destinations[col_start:col_end], remaining)
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(tiles))) as pool:
+            for (row_start, _, col_start, _), block in pool.map(fetch, tiles):
+                for i, row in enumerate(block):
+                    result[row_start + i][col_start:col_start + len(row)] = row
+        return result
+
+
+class HaversineRoutingBackend(BaseRoutingBackend):
+    """
+    Network-free estimate: great-circle distance times a road detour factor,
+    travel time from an average speed plus a fixed overhead for parking/handover.
+    Once an ETA model is trained (train_eta_model) its road factor and
+    travel times are used instead, unless ``use_model`` is off.
+    """
+    name = 'haversine'
+    approximate = True
+
+    def __init__(self, road_factor=None, speed_kmh=None, overhead_minutes=None, use_model=None):
+        self.road_factor = road_factor or settings.ROUTING_ROAD_FACTOR
+        self.speed_kmh = speed_kmh or settings.ROUTING_AVERAGE_SPEED_KMH
+        self.overhead_minutes = settings.ROUTING_OVERHEAD_MINUTES if overhead_minutes is None else overhead_minutes
+        self.use_model = settings.ETA_MODEL_ENABLED if use_model is None else use_model
+
+    def _calibration(self, lat, lng):
+        """(road factor, (a, b) of minutes = a + b * road_km) for trips from (lat, lng)"""
+        model = get_eta_model() if self.use_model else None
+        if model is None:
+            return self.road_factor, (self.overhead_minutes, 60 / self.speed_kmh)
+        return model.road_factor or self.road_factor, model.fit(lat, lng) or (self.overhead_minutes, 60 / self.speed_kmh)
+
+    def route(self, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, timeout=None):
+        try:
+            straight_km = float(haversine(float(pickup_lat), float(pickup_lng), float(dropoff_lat), float(dropoff_lng)))
+        except (TypeError, ValueError) as e:
+            raise RoutingError(f"Invalid coordinates: {e}")
+        road_factor, (a, b) = self._calibration(float(pickup_lat), float(pickup_lng))
+        distance_km = round(straight_km * road_factor, 2)
+        duration_minutes = round(a + b * distance_km)
+        return Route(distance_km, duration_minutes, self.name, self.approximate)
+
+    def matrix(self, origins, destinations, timeout=None):
+        if not origins or not destinations:
+            return [[] for _ in origins]
+        origins = np.asarray(origins, dtype=np.float64)
+        destinations = np.asarray(destinations, dtype=np.float64)
+        calibration = [self._calibration(lat, lng) for lat, lng in origins.tolist()]
+        road_factors = np.array([[road_factor] for road_factor, _ in calibration])
+        a = np.array([[fit[0]] for _, fit in calibration])
+        b = np.array([[fit[1]] for _, fit in calibration])
+        distances = np.round(haversine_matrix(origins[:, 0], origins[:, 1], destinations[:, 0], destinations[:, 1]) * road_factors, 2)
+        durations = np.round(a + b * distances)
+        return [
+            [Route(float(d), int(t), self.name, self.approximate) for d, t in zip(distance_row, duration_row)]
+            for distance_row, duration_row in zip(distances, durations)
+        ]
+
+
+class FallbackRoutingBackend(BaseRoutingBackend):
+    """
+    Tries each backend in order within one latency budget.
+    A backend that fails is skipped for ROUTING_FAILURE_COOLDOWN seconds,
+    so an outage costs one timeout and not one per request.
+    """
+    name = 'fallback'
+
+    def __init__(self, backends, budget=None, cooldown=None):
+        self.backends = backends
+        self.budget = budget or settings.ROUTING_LATENCY_BUDGET
+        self.cooldown = settings.ROUTING_FAILURE_COOLDOWN if cooldown is None else cooldown
+        self._skip_until = {}
+        self._lock = threading.Lock()
+
+    def route(self, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, timeout=None):
+        deadline = time.monotonic() + (self.budget if timeout is None else timeout)
+        errors = []
+        for backend in self.backends:
+            now = time.monotonic()
+            remaining = deadline - now
+            if not backend.approximate:
+                # Network backends need time left and must not be cooling down.
+                if remaining <= 0 or self._skip_until.get(backend.name, 0) > now:
+                    continue
+            try:
+                return backend.route(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, timeout=max(remaining, 0.1))
+            except BackendUnavailable as e:
+                errors.append(f"{backend.name}: {e}")
+                self._cool_down(backend)
+            except RoutingError as e:
+                errors.append(f"{backend.name}: {e}")
+        raise RoutingError("; ".join(errors) or "No routing backend available")
+
+    def matrix(self, origins, destinations, timeout=None):
+        """Cells a backend can't route are filled by the next one"""
+        deadline = time.monotonic() + (settings.ROUTING_MATRIX_TIMEOUT if timeout is None else timeout)
+        result = [[None] * len(destinations) for _ in origins]
+        for backend in self.backends:
+            rows = sorted({i for i, row in enumerate(result) for cell in row if cell is None})
+            if not rows:
+                break
+            cols = sorted({j for i in rows for j, cell in enumerate(result[i]) if cell is None})
+            now = time.monotonic()
+            remaining = deadline - now
+            if not backend.approximate:
+                if remaining <= 0 or self._skip_until.get(backend.name, 0) > now:
+                    continue
+            try:
+                block = backend.matrix([origins[i] for i in rows], [destinations[j] for j in cols], timeout=max(remaining, 0.1))
+            except BackendUnavailable:
+                self._cool_down(backend)
+                continue
+            for bi, i in enumerate(rows):
+                for bj, j in enumerate(cols):
+                    if result[i][j] is None:
+                        result[i][j] = block[bi][bj]
+        return result
+
+    def _cool_down(self, backend):
+        with self._lock:
+            self._skip_until[backend.name] = time.monotonic() + self.cooldown
+
+
+_routing_backend = None
+
+
+def get_routing_backend():
+    """The configured ROUTING_BACKENDS chained in a FallbackRoutingBackend"""
+    global _routing_backend
+    if _routing_backend is None:
+        backends = [import_string(path)() for path in settings.ROUTING_BACKENDS]
+        _routing_backend = FallbackRoutingBackend(backends)
+    return _routing_backend
@@ -0,0 +1,265 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class DistanceCache:
+    """
+    Two-tier cache for (distance_km, duration_minutes) lookups.
+
+    A small in-process LRU sits in front of the shared Django cache
+    (Redis in production) so repeated lookups inside one worker never
+    leave the process. Keys are built from coordinates rounded to
+    DISTANCE_CACHE_PRECISION decimals (4 ~= 11 m), so the same trip
+    requested from slightly different GPS fixes shares one entry.
+
+    Concurrent lookups for the same key share a single computation:
+    threads in this process wait on the first caller, and other
+    processes back off on a short-lived lock key in the shared cache.
+    Nobody waits longer than ROUTING_LATENCY_BUDGET for it.
+
+    Hit and miss counts are kept in-process and added to the shared
+    counters every DISTANCE_CACHE_STATS_INTERVAL seconds, so a local hit
+    costs no round trip.
+    """
+
+    KEY_PREFIX = "distance"
+
+    def __init__(self, alias="distance", timeout=None, max_entries=None, precision=None):
+        self.alias = alias
+        self.timeout = timeout if timeout is not None else settings.DISTANCE_CACHE_TIMEOUT
+        self.max_entries = max_entries if max_entries is not None else settings.DISTANCE_CACHE_MAX_ENTRIES
+        self.precision = precision if precision is not None else settings.DISTANCE_CACHE_PRECISION
+        self.lock_timeout = settings.DISTANCE_CACHE_LOCK_TIMEOUT
+        self.wait_timeout = min(self.lock_timeout, settings.ROUTING_LATENCY_BUDGET)
+
+        self._local = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> threading.Event
+        self.hits = 0
+        self.misses = 0
+        self._unreported = {'hits': 0, 'misses': 0}
+        self._reported_at = time.monotonic()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def make_key(self, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng):
+        coords = (pickup_lat, pickup_lng, dropoff_lat, dropoff_lng)
+        quantized = ",".join(f"{round(float(c), self.precision):.{self.precision}f}" for c in coords)
+        return f"{self.KEY_PREFIX}:{quantized}"
+
+    # ---- in-process LRU ----
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def _local_set(self, key, value):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.timeout, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    # ---- shared tier (errors never break a lookup) ----
+    def _shared_get(self, key):
+        try:
+            return self.shared.get(key)
+        except Exception:
+            return None
+
+    def _shared_set(self, key, value):
+        try:
+            self.shared.set(key, value, self.timeout)
+        except Exception:
+            pass
+
+    def _shared_add_lock(self, key):
+        try:
+            return self.shared.add(f"{key}:lock", 1, self.lock_timeout)
+        except Exception:
+            return True
+
+    def _shared_release_lock(self, key):
+        try:
+            self.shared.delete(f"{key}:lock")
+        except Exception:
+            pass
+
+    def _count(self, hits=0, misses=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self._unreported['hits'] += hits
+            self._unreported['misses'] += misses
+            due = time.monotonic() - self._reported_at >= settings.DISTANCE_CACHE_STATS_INTERVAL
+        if due:
+            self.report_stats()
+
+    def report_stats(self):
+        """Add the counts since the last report to the shared counters"""
+        with self._lock:
+            deltas = self._unreported
+            self._unreported = {'hits': 0, 'misses': 0}
+            self._reported_at = time.monotonic()
+        try:
+            for name, delta in deltas.items():
+                if delta:
+                    self._shared_incr(f"{self.KEY_PREFIX}:stats:{name}", delta)
+                    deltas[name] = 0
+        except Exception as e:
+            logger.warning("Reporting distance cache stats failed: %s", e)
+            # Kept for the next report
+            with self._lock:
+                for name, delta in deltas.items():
+                    self._unreported[name] += delta
+
+    def _shared_incr(self, counter, delta):
+        # incr() is atomic but raises when the counter does not exist yet,
+        # add() only creates it when no other process did meanwhile.
+        try:
+            self.shared.incr(counter, delta)
+        except ValueError:
+            self.shared.add(counter, 0, None)
+            self.shared.incr(counter, delta)
+
+    def get(self, key):
+        value = self._local_get(key)
+        if value is not None:
+            return value
+        value = self._shared_get(key)
+        if value is not None:
+            self._local_set(key, value)
+        return value
+
+    def set(self, key, value):
+        self._local_set(key, value)
+        self._shared_set(key, value)
+
+    def get_many(self, keys):
+        """Cached values for ``keys`` as a dict, counting a hit or miss per key"""
+        keys = list(keys)
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._local_get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            try:
+                shared = self.shared.get_many(missing)
+            except Exception:
+                shared = {}
+            for key, value in shared.items():
+                self._local_set(key, value)
+                found[key] = value
+        self._count(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def set_many(self, values):
+        for key, value in values.items():
+            self._local_set(key, value)
+        try:
+            self.shared.set_many(values, self.timeout)
+        except Exception:
+            pass
+
+    def get_or_compute(self, key, compute, should_cache=None, wait=None):
+        """
+        Return the cached value for ``key`` or call ``compute()`` once.
+
+        ``should_cache(value)`` decides whether a computed value is stored;
+        by default anything but None is. ``wait`` caps the seconds spent
+        waiting on another caller computing the same key.
+        """
+        wait = self.wait_timeout if wait is None else min(wait, self.wait_timeout)
+        value = self.get(key)
+        if value is not None:
+            self._count(hits=1)
+            return value
+
+        with self._lock:
+            event = self._inflight.get(key)
+            owner = event is None
+            if owner:
+                event = self._inflight[key] = threading.Event()
+
+        if not owner:
+            # Another thread is already computing this key.
+            event.wait(max(wait, 0))
+            value = self.get(key)
+            if value is not None:
+                self._count(hits=1)
+                return value
+            self._count(misses=1)
+            return compute()
+
+        try:
+            locked = self._shared_add_lock(key)
+            if not locked:
+                # Another process is computing it, give it a moment.
+                deadline = time.monotonic() + wait
+                while time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    value = self._shared_get(key)
+                    if value is not None:
+                        self._local_set(key, value)
+                        self._count(hits=1)
+                        return value
+
+            self._count(misses=1)
+            try:
+                value = compute()
+                if value is not None and (should_cache is None or should_cache(value)):
+                    self.set(key, value)
+                return value
+            finally:
+                if locked:
+                    self._shared_release_lock(key)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def stats(self):
+        self.report_stats()
+        shared_hits = shared_misses = None
+        try:
+            shared_hits = self.shared.get(f"{self.KEY_PREFIX}:stats:hits")
+            shared_misses = self.shared.get(f"{self.KEY_PREFIX}:stats:misses")
+        except Exception:
+            pass
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "local_entries": len(self._local),
+            "shared_hits": shared_hits,
+            "shared_misses": shared_misses,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+            self.hits = 0
+            self.misses = 0
+            self._unreported = {'hits': 0, 'misses': 0}
+
+
+distance_cache = DistanceCache()
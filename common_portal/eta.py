@@ -0,0 +1,195 @@
+"""
+Travel time model trained on completed deliveries.
+
+Minutes from pickup to drop are fitted as ``a + b * road_km`` per bucket of
+(pickup zone, hour of week). Buckets with too few deliveries fall back to the
+zone, then the hour of week, then the global fit, so a prediction is a handful
+of dict lookups. The model also learns how far the live Google durations are
+off (``calibration``) and the ratio of road to straight-line km
+(``road_factor``) used by the local routing backend.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .geo import KM_PER_DEGREE_LAT, haversine
+
+LEVELS = ('zone_hour', 'zone', 'hour', 'global')
+
+
+def zone_key(lat, lng, zone_deg):
+    return f"{int(lat // zone_deg)}:{int(lng // zone_deg)}"
+
+
+def hour_key(when, hour_bucket):
+    when = timezone.localtime(when) if timezone.is_aware(when) else when
+    return str((when.weekday() * 24 + when.hour) // hour_bucket)
+
+
+def _fit(km, minutes):
+    """(a, b) of minutes = a + b * km, a plain pace when the distances barely vary"""
+    if len(km) >= 3 and np.ptp(km) > 0.5:
+        b, a = np.polyfit(km, minutes, 1)
+        if b > 0 and a >= 0:
+            return [float(a), float(b)]
+    return [0.0, float(np.median(minutes / np.maximum(km, 0.1)))]
+
+
+class EtaPredictor:
+    def __init__(self, params):
+        self.params = params
+        self.zone_deg = params['zone_deg']
+        self.hour_bucket = params['hour_bucket']
+        self.road_factor = params.get('road_factor')
+        self.levels = params['levels']
+
+    def _keys(self, lat, lng, when):
+        zone = zone_key(lat, lng, self.zone_deg)
+        hour = hour_key(when or timezone.now(), self.hour_bucket)
+        return {'zone_hour': f"{zone}|{hour}", 'zone': zone, 'hour': hour, 'global': ''}
+
+    def _lookup(self, field, lat, lng, when):
+        keys = self._keys(lat, lng, when)
+        for level in LEVELS:
+            bucket = self.levels[level].get(keys[level])
+            if bucket is not None and bucket.get(field) is not None:
+                return bucket[field]
+        return None
+
+    def fit(self, lat, lng, when=None):
+        """(a, b) of minutes = a + b * road_km for trips starting at (lat, lng)"""
+        return self._lookup('fit', lat, lng, when)
+
+    def predict(self, road_km, lat, lng, when=None):
+        """Minutes for road_km starting at (lat, lng), None without any fit"""
+        fit = self.fit(lat, lng, when)
+        if fit is None:
+            return None
+        return fit[0] + fit[1] * road_km
+
+    def calibrate(self, minutes, lat, lng, when=None):
+        """A live routing duration corrected by how far such durations were off"""
+        factor = self._lookup('calibration', lat, lng, when)
+        return minutes * factor if factor else minutes
+
+
+def _bucketize(keys, km, minutes, estimates, min_samples):
+    buckets = {}
+    groups = {}
+    for index, key in enumerate(keys):
+        groups.setdefault(key, []).append(index)
+    for key, rows in groups.items():
+        if len(rows) < min_samples:
+            continue
+        rows = np.asarray(rows)
+        bucket = {'n': len(rows), 'fit': _fit(km[rows], minutes[rows]), 'calibration': None}
+        with_estimate = rows[~np.isnan(estimates[rows])]
+        if len(with_estimate) >= min_samples:
+            bucket['calibration'] = float(np.median(minutes[with_estimate] / np.maximum(estimates[with_estimate], 1)))
+        buckets[key] = bucket
+    return buckets
+
+
+def train(rows, zone_km=None, hour_bucket=None, min_samples=None):
+    """
+    Fit the model parameters from delivery rows of
+    (pickup_lat, pickup_lng, drop_lat, drop_lng, road_km, estimated_minutes, picked_up_at, delivered_at,
+    approximate, live_minutes). road_km and estimated_minutes may be None.
+    ``approximate`` tells whether they are the local estimate, the road factor
+    is only learned from live routes (False). The calibration is fitted
+    against live_minutes, the live duration before any calibration, as
+    estimated_minutes already has the previous model's applied.
+    """
+    zone_deg = (zone_km or settings.ETA_MODEL_ZONE_KM) / KM_PER_DEGREE_LAT
+    hour_bucket = hour_bucket or settings.ETA_MODEL_HOUR_BUCKET
+    min_samples = min_samples or settings.ETA_MODEL_MIN_SAMPLES
+
+    rows = list(rows)
+    data = np.array([
+        [row[0], row[1], row[2], row[3],
+         np.nan if row[4] is None else float(row[4]),
+         np.nan if len(row) < 10 or row[9] is None else float(row[9]),
+         (row[7] - row[6]).total_seconds() / 60,
+         1.0 if len(row) > 8 and row[8] is False else 0.0]
+        for row in rows
+    ], dtype=np.float64).reshape(-1, 8)
+    live = data[:, 7] == 1
+    straight = haversine(data[:, 0], data[:, 1], data[:, 2], data[:, 3])
+
+    # Road km over straight km, of live routes only: local estimates are
+    # straight km times whatever factor was in use when they were made.
+    road = data[:, 4]
+    ratio = road / np.maximum(straight, 0.01)
+    measured = live & ~np.isnan(road) & (straight > 0.2) & (ratio >= 1) & (ratio < 3)
+    road_factor = float(np.median(ratio[measured])) if measured.sum() >= min_samples else None
+
+    km = np.where(np.isnan(road), straight * (road_factor or settings.ROUTING_ROAD_FACTOR), road)
+    minutes = data[:, 6]
+    # Drop deliveries that were left open or marked delivered by mistake.
+    speed = km / np.maximum(minutes, 0.01) * 60
+    keep = (minutes >= 1) & (minutes <= settings.ETA_MODEL_MAX_MINUTES) & (speed <= 120)
+    data, km, minutes = data[keep], km[keep], minutes[keep]
+    estimates = data[:, 5]  # live durations, None for local estimates
+
+    zones = [zone_key(lat, lng, zone_deg) for lat, lng in data[:, :2]]
+    hours = [hour_key(row[6], hour_bucket) for row, kept in zip(rows, keep) if kept]
+    levels = {
+        'zone_hour': _bucketize([f"{z}|{h}" for z, h in zip(zones, hours)], km, minutes, estimates, min_samples),
+        'zone': _bucketize(zones, km, minutes, estimates, min_samples),
+        'hour': _bucketize(hours, km, minutes, estimates, min_samples),
+        'global': _bucketize([''] * len(km), km, minutes, estimates, 1) if len(km) else {},
+    }
+    return {
+        'zone_deg': zone_deg,
+        'hour_bucket': hour_bucket,
+        'road_factor': road_factor,
+        'levels': levels,
+    }, int(keep.sum())
+
+
+def evaluate(params, rows):
+    """Mean absolute error in minutes of the model on delivery rows (see train)"""
+    predictor = EtaPredictor(params)
+    road_factor = predictor.road_factor or settings.ROUTING_ROAD_FACTOR
+    errors = []
+    for row in rows:
+        actual = (row[7] - row[6]).total_seconds() / 60
+        km = float(row[4]) if row[4] is not None else float(haversine(row[0], row[1], row[2], row[3])) * road_factor
+        predicted = predictor.predict(km, row[0], row[1], row[6])
+        if predicted is not None:
+            errors.append(abs(predicted - actual))
+    return float(np.mean(errors)) if errors else None
+
+
+_predictor = None
+_loaded_id = None
+_checked_at = 0
+
+
+def get_eta_model():
+    """
+    The newest trained EtaPredictor, or None before the first training.
+    The database is checked for a newer model every ETA_MODEL_RELOAD_SECONDS.
+    """
+    global _predictor, _loaded_id, _checked_at
+    if time.monotonic() - _checked_at < settings.ETA_MODEL_RELOAD_SECONDS:
+        return _predictor
+    _checked_at = time.monotonic()
+    from .models import EtaModel
+
+    try:
+        latest = EtaModel.objects.order_by('-id').values_list('id', flat=True).first()
+        if latest != _loaded_id:
+            _predictor = EtaPredictor(EtaModel.objects.get(id=latest).params) if latest else None
+            _loaded_id = latest
+    except DatabaseError:
+        pass
+    return _predictor
+
+
+def reset_eta_model():
+    global _checked_at
+    _checked_at = 0
@@ -0,0 +1,81 @@
+"""
+Vectorized geo helpers, every function takes scalars or NumPy arrays of
+decimal degrees and works on whole arrays at once.
+"""
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = 111.32
+
+
+def _radians(*values):
+    return [np.radians(np.asarray(value, dtype=np.float64)) for value in values]
+
+
+def valid_coordinates(lat, lng):
+    """True where lat is within [-90, 90] and lng within [-180, 180], never for NaN or inf"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    return np.isfinite(lat) & np.isfinite(lng) & (np.abs(lat) <= 90) & (np.abs(lng) <= 180)
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km, element-wise with NumPy broadcasting"""
+    lat1, lng1, lat2, lng2 = _radians(lat1, lng1, lat2, lng2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_matrix(lats1, lngs1, lats2, lngs2):
+    """
+    Distance in km from every point of the first set to every point of the second.
+    Returns an array of shape (len(lats1), len(lats2)).
+    """
+    lat1, lng1, lat2, lng2 = _radians(lats1, lngs1, lats2, lngs2)
+    lat1, lng1 = lat1[:, None], lng1[:, None]
+    a = np.sin((lat2 - lat1) / 2) ** 2
+    a += np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    np.clip(a, 0.0, 1.0, out=a)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a, out=a), out=a)
+
+
+def bearing(lat1, lng1, lat2, lng2):
+    """Initial bearing in degrees (0 = north, clockwise), element-wise"""
+    lat1, lng1, lat2, lng2 = _radians(lat1, lng1, lat2, lng2)
+    dlng = lng2 - lng1
+    x = np.sin(dlng) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlng)
+    return (np.degrees(np.arctan2(x, y)) + 360.0) % 360.0
+
+
+def bearing_matrix(lats1, lngs1, lats2, lngs2):
+    """Bearing in degrees from every point of the first set to every point of the second"""
+    lats1, lngs1 = np.asarray(lats1, dtype=np.float64)[:, None], np.asarray(lngs1, dtype=np.float64)[:, None]
+    return bearing(lats1, lngs1, lats2, lngs2)
+
+
+def angle_difference(a, b):
+    """Smallest absolute difference between two bearings in degrees (0..180)"""
+    diff = np.abs(np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64)) % 360.0
+    return np.minimum(diff, 360.0 - diff)
+
+
+def bounding_box(lat, lng, radius_km):
+    """
+    (min_lat, max_lat, min_lng, max_lng) of a box containing the circle of
+    ``radius_km`` around each point. Good for a cheap index range filter
+    before an exact haversine check.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    dlat = np.asarray(radius_km, dtype=np.float64) / KM_PER_DEGREE_LAT
+    # Longitude degrees shrink towards the poles, never divide by ~0.
+    cos_lat = np.maximum(np.cos(np.radians(lat)), 1e-6)
+    dlng = np.minimum(dlat / cos_lat, 180.0)
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+
+def within_radius(lats, lngs, lat, lng, radius_km):
+    """Boolean mask of the points within ``radius_km`` of (lat, lng), and their distances"""
+    distances = haversine(lats, lngs, lat, lng)
+    return distances <= radius_km, distances
@@ -0,0 +1,151 @@
+"""
+Short, non-guessable IDs that cannot collide.
+
+Every ID comes from a counter value n: the counter is split into tiers of
+equal digit count (900000 six digit IDs, then 9000000 seven digit ones,
+...) and n's position in its tier is run through a keyed Feistel
+permutation of that tier. A permutation never maps two values to the same
+ID, so uniqueness needs no lookup, and consecutive orders still get
+unrelated looking IDs. The domain of a tier is not a power of two, so the
+Feistel network works on the next even bit width and cycle-walks: it is
+applied again until the value falls back inside the tier.
+
+Counters are Sequence rows handed out in blocks of ORDER_ID_BLOCK_SIZE, so
+one UPDATE serves a whole block and IDs cost no query otherwise. Values of
+a block a process did not use are skipped, never reused.
+
+ORDER_ID_KEY must never change once IDs were issued with it, new IDs
+would collide with existing ones otherwise. It is a setting of its own
+rather than derived from SECRET_KEY, which gets rotated.
+"""
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F
+
+from .models import Sequence
+
+ROUNDS = 4
+
+
+class FeistelPermutation:
+    """Keyed bijection of range(size) onto itself"""
+
+    def __init__(self, size, key, rounds=ROUNDS):
+        self.size = size
+        self.half_bits = max((size - 1).bit_length() + 1, 2) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        self.round_hashes = [
+            hashlib.blake2b(key=hashlib.sha256(key + bytes([number])).digest(), digest_size=8)
+            for number in range(rounds)
+        ]
+
+    def _encrypt(self, value):
+        left, right = value >> self.half_bits, value & self.half_mask
+        for round_hash in self.round_hashes:
+            digest = round_hash.copy()
+            digest.update(right.to_bytes(8, 'little'))
+            left, right = right, left ^ (int.from_bytes(digest.digest(), 'little') & self.half_mask)
+        return (left << self.half_bits) | right
+
+    def __call__(self, value):
+        if not 0 <= value < self.size:
+            raise ValueError(f"{value} is outside 0..{self.size - 1}")
+        # Cycle walking: the walk from a value inside the range always comes
+        # back inside it, and stays a bijection of the range.
+        value = self._encrypt(value)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+
+class IdFormat:
+    """Maps counter values to decimal IDs of at least ``min_digits`` digits"""
+
+    def __init__(self, key, min_digits=6):
+        self.key = key.encode() if isinstance(key, str) else key
+        self.min_digits = min_digits
+        self._permutations = {}
+
+    def tier_start(self, digits):
+        """First counter value of the tier of ``digits`` digit IDs"""
+        return 10 ** (digits - 1) - 10 ** (self.min_digits - 1)
+
+    def tier(self, value):
+        """(digits, position in the tier) of a counter value"""
+        digits = self.min_digits
+        while value >= self.tier_start(digits + 1):
+            digits += 1
+        return digits, value - self.tier_start(digits)
+
+    def _permutation(self, digits):
+        permutation = self._permutations.get(digits)
+        if permutation is None:
+            size = 9 * 10 ** (digits - 1)
+            permutation = self._permutations[digits] = FeistelPermutation(size, self.key + digits.to_bytes(1, 'little'))
+        return permutation
+
+    def __call__(self, value):
+        digits, position = self.tier(value)
+        return str(10 ** (digits - 1) + self._permutation(digits)(position))
+
+
+def allocate(name, count):
+    """Reserve ``count`` values of a sequence. Returns the first one."""
+    with transaction.atomic():
+        # The UPDATE locks the row, so the value read after it is ours.
+        if not Sequence.objects.filter(name=name).update(next_value=F('next_value') + count):
+            Sequence.objects.get_or_create(name=name)
+            Sequence.objects.filter(name=name).update(next_value=F('next_value') + count)
+        return Sequence.objects.values_list('next_value', flat=True).get(name=name) - count
+
+
+class IdGenerator:
+    """IDs from a named sequence, allocated a block at a time per process"""
+
+    def __init__(self, sequence, key=None, min_digits=6, block_size=None):
+        self.sequence = sequence
+        self._key = key
+        self.min_digits = min_digits
+        self._block_size = block_size
+        self._format = None
+        self._next = self._end = 0
+        self._lock = threading.Lock()
+
+    @property
+    def format(self):
+        # Built on first use, settings are not ready at import time
+        if self._format is None:
+            key = self._key or settings.ORDER_ID_KEY
+            if not key:
+                raise ImproperlyConfigured("ORDER_ID_KEY must be set to issue order IDs")
+            self._format = IdFormat(key, self.min_digits)
+        return self._format
+
+    def values(self, count):
+        """``count`` counter values, allocating new blocks as needed"""
+        taken = []
+        with self._lock:
+            while len(taken) < count:
+                if self._next >= self._end:
+                    block = max(self._block_size or settings.ORDER_ID_BLOCK_SIZE, count - len(taken))
+                    self._next = allocate(self.sequence, block)
+                    self._end = self._next + block
+                end = min(self._end, self._next + count - len(taken))
+                taken.extend(range(self._next, end))
+                self._next = end
+        return taken
+
+    def next_id(self):
+        return self.format(self.values(1)[0])
+
+    def next_ids(self, count):
+        return [self.format(value) for value in self.values(count)]
+
+    def reset(self):
+        """Drop the rest of the current block, e.g. after the sequence was moved"""
+        with self._lock:
+            self._next = self._end = 0
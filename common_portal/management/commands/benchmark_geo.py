@@ -0,0 +1,59 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from common_portal.geo import haversine_matrix
+from common_portal.utils import calculate_distance
+
+
+class Command(BaseCommand):
+    help = "Compare the vectorized haversine matrix with the scalar calculate_distance."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10000, help="Points on each side, the matrix is size x size.")
+        parser.add_argument('--chunk', type=int, default=500, help="Rows per vectorized block, bounds memory use.")
+        parser.add_argument('--sample', type=int, default=200000, help="Pairs timed with the scalar function.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        size = options['size']
+        chunk = options['chunk']
+        rng = np.random.default_rng(options['seed'])
+
+        # Points scattered over a city sized area (Chattogram)
+        drivers = np.column_stack([rng.uniform(22.25, 22.45, size), rng.uniform(91.75, 91.90, size)])
+        orders = np.column_stack([rng.uniform(22.25, 22.45, size), rng.uniform(91.75, 91.90, size)])
+        pairs = size * size
+
+        # ---- vectorized, full matrix in row blocks ----
+        start = time.perf_counter()
+        nearest = np.empty(size)
+        for row in range(0, size, chunk):
+            block = haversine_matrix(drivers[row:row + chunk, 0], drivers[row:row + chunk, 1], orders[:, 0], orders[:, 1])
+            nearest[row:row + chunk] = block.min(axis=1)
+        vector_seconds = time.perf_counter() - start
+
+        # ---- scalar, timed on a sample and extrapolated ----
+        sample = min(options['sample'], pairs)
+        rows = rng.integers(0, size, sample)
+        cols = rng.integers(0, size, sample)
+        sample_drivers = drivers[rows].tolist()
+        sample_orders = orders[cols].tolist()
+        start = time.perf_counter()
+        scalar = [calculate_distance(d[0], d[1], o[0], o[1]) for d, o in zip(sample_drivers, sample_orders)]
+        scalar_sample_seconds = time.perf_counter() - start
+        scalar_seconds = scalar_sample_seconds / sample * pairs
+
+        # calculate_distance rounds to 2 decimals, compare at that precision
+        vector = haversine_matrix(drivers[rows[:1000], 0], drivers[rows[:1000], 1], orders[cols[:1000], 0], orders[cols[:1000], 1]).diagonal()
+        max_error = float(np.max(np.abs(np.round(vector, 2) - np.array(scalar[:1000]))))
+
+        self.stdout.write(f"Matrix: {size} x {size} = {pairs:,} pairs")
+        self.stdout.write(f"Vectorized: {vector_seconds:.2f}s ({pairs / vector_seconds:,.0f} pairs/s)")
+        self.stdout.write(
+            f"Scalar: {scalar_seconds:.2f}s extrapolated from {sample:,} pairs in {scalar_sample_seconds:.2f}s "
+            f"({sample / scalar_sample_seconds:,.0f} pairs/s)"
+        )
+        self.stdout.write(f"Max difference: {max_error:.4f} km")
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {scalar_seconds / vector_seconds:.1f}x"))
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from common_portal.outbox import drain, purge
+
+
+class Command(BaseCommand):
+    help = "Carry out queued side effects of order changes (notifications, earnings, ...)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain what is due now and exit.")
+        parser.add_argument('--interval', type=float, default=None, help="Seconds between polls while idle.")
+        parser.add_argument('--batch', type=int, default=None, help="Events per transaction.")
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or settings.OUTBOX_POLL_INTERVAL
+        last_purge = 0
+        while True:
+            # Full batches are followed by the next one right away
+            processed, failed = drain(options['batch'])
+            if processed or failed:
+                self.stdout.write(f"{processed} events processed, {failed} failed")
+            if time.monotonic() - last_purge >= 3600:
+                last_purge = time.monotonic()
+                purged = purge()
+                if purged:
+                    self.stdout.write(f"{purged} old events purged")
+            if processed + failed >= (options['batch'] or settings.OUTBOX_BATCH_SIZE):
+                continue
+            if options['once']:
+                break
+            time.sleep(interval)
@@ -0,0 +1,70 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from common_portal import eta
+from common_portal.models import EtaModel
+from customer_portal.models import DeliveryRequest
+
+
+class Command(BaseCommand):
+    help = "Train the ETA model from the pickup and delivery times of delivered orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help="Only learn from deliveries of the last N days.")
+        parser.add_argument('--holdout', type=float, default=0.2, help="Share of the newest deliveries kept aside to measure the error.")
+        parser.add_argument('--zone-km', type=float, default=None)
+        parser.add_argument('--hour-bucket', type=int, default=None)
+        parser.add_argument('--min-samples', type=int, default=None)
+        parser.add_argument('--dry-run', action='store_true', help="Report the error without saving the model.")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        rows = list(DeliveryRequest.objects.filter(
+            status='delivered', delivered_at__gte=since,
+            picked_up_at__isnull=False, delivered_at__isnull=False,
+            pickup_location_lat__isnull=False, pickup_location_long__isnull=False,
+            delivery_location_lat__isnull=False, delivery_location_long__isnull=False,
+        ).order_by('delivered_at').values_list(
+            'pickup_location_lat', 'pickup_location_long', 'delivery_location_lat', 'delivery_location_long',
+            'distance_km', 'estimated_time_minutes', 'picked_up_at', 'delivered_at', 'estimates_approximate',
+            'estimated_live_minutes',
+        ))
+        if not rows:
+            self.stdout.write(self.style.WARNING("No delivered orders with pickup and delivery times, nothing to train on."))
+            return
+        fit_options = {'zone_km': options['zone_km'], 'hour_bucket': options['hour_bucket'], 'min_samples': options['min_samples']}
+
+        # Error on the newest deliveries with a model that never saw them
+        split = int(len(rows) * (1 - options['holdout']))
+        error = None
+        if 0 < split < len(rows):
+            params, _ = eta.train(rows[:split], **fit_options)
+            error = eta.evaluate(params, rows[split:])
+            baseline = [abs(row[5] - (row[7] - row[6]).total_seconds() / 60) for row in rows[split:] if row[5] is not None]
+            self.stdout.write(f"Held-out deliveries: {len(rows) - split}")
+            if error is not None:
+                self.stdout.write(f"Model error: {error:.1f} min")
+            if baseline:
+                self.stdout.write(f"Stored estimate error: {sum(baseline) / len(baseline):.1f} min")
+
+        params, samples = eta.train(rows, **fit_options)
+        predictor = eta.EtaPredictor(params)
+        start = time.perf_counter()
+        for row in rows[:1000]:
+            predictor.predict(5.0, row[0], row[1], row[6])
+        latency = (time.perf_counter() - start) / min(len(rows), 1000) * 1e6
+        buckets = {level: len(params['levels'][level]) for level in eta.LEVELS}
+        self.stdout.write(f"Trained on {samples} of {len(rows)} deliveries, buckets: {buckets}")
+        road_factor = params['road_factor']
+        self.stdout.write(f"Road factor: {road_factor:.2f}" if road_factor else f"Road factor: not enough data, keeping {settings.ROUTING_ROAD_FACTOR}")
+        self.stdout.write(f"Prediction latency: {latency:.1f} us")
+
+        if options['dry_run']:
+            return
+        model = EtaModel.objects.create(params=params, samples=samples, mean_absolute_error=error)
+        eta.reset_eta_model()
+        self.stdout.write(self.style.SUCCESS(f"Saved {model}"))
@@ -1,3 +1,53 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
+
+
+class EtaModel(models.Model):
+    """
+    Trained travel time model, see common_portal.eta. The newest row is the
+    one in use, older rows are kept for comparison.
+    """
+    params = models.JSONField()
+    samples = models.PositiveIntegerField(default=0)
+    mean_absolute_error = models.FloatField(blank=True, null=True)  # minutes, on held-out deliveries
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"EtaModel {self.id} ({self.samples} samples)"
+
+
+class Sequence(models.Model):
+    """
+    Named counter handed out in blocks, see common_portal.ids. next_value is
+    the first value no process has taken yet.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Sequence {self.name} ({self.next_value})"
+
+
+class OutboxEvent(models.Model):
+    """
+    Side effect of a database change (a notification, an earning, ...),
+    written in the same transaction as the change and carried out later by
+    the drain_outbox command, see common_portal.outbox.
+    """
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)  # not retried before
+    processed_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'available_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"OutboxEvent {self.id} {self.kind}"
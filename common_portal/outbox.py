@@ -0,0 +1,107 @@
+"""
+Transactional outbox.
+
+Requests only write their status change and, in the same transaction, an
+OutboxEvent per side effect (notification, earning, ...). Either both are
+committed or neither, so no side effect is lost and none is sent for a
+change that was rolled back. The drain_outbox command carries the events
+out in batches, each in its own savepoint. A failed event is retried with
+exponential backoff and given up after OUTBOX_MAX_ATTEMPTS, it stays in the
+table with its last error.
+
+Events are delivered at least once: a push can be repeated when a worker
+dies after sending it but before marking the event processed.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register the function carrying out events of ``kind``, it gets the payload"""
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+def enqueue(kind, **payload):
+    """Add an event, call it inside the transaction of the change it belongs to"""
+    return OutboxEvent.objects.create(kind=kind, payload=payload)
+
+
+def enqueue_many(kind, payloads):
+    return OutboxEvent.objects.bulk_create([OutboxEvent(kind=kind, payload=payload) for payload in payloads])
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(settings.OUTBOX_RETRY_SECONDS * 2 ** (attempts - 1), 3600))
+
+
+def drain(batch_size=None):
+    """
+    Carry out one batch of due events, oldest first.
+    Returns (processed, failed).
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    now = timezone.now()
+    processed, failed = [], 0
+    with transaction.atomic():
+        # SKIP LOCKED lets several drainers share the table on databases that have it
+        events = list(OutboxEvent.objects.select_for_update(skip_locked=True).filter(
+            processed_at__isnull=True, available_at__lte=now, attempts__lt=settings.OUTBOX_MAX_ATTEMPTS,
+        ).order_by('id')[:batch_size])
+        for event in events:
+            function = HANDLERS.get(event.kind)
+            try:
+                if function is None:
+                    raise LookupError(f"No handler for {event.kind} events")
+                with transaction.atomic():
+                    function(event.payload)
+            except Exception as e:
+                failed += 1
+                event.attempts += 1
+                event.last_error = f"{type(e).__name__}: {e}"
+                event.available_at = now + retry_delay(event.attempts)
+                event.save(update_fields=['attempts', 'last_error', 'available_at'])
+            else:
+                processed.append(event.id)
+        OutboxEvent.objects.filter(id__in=processed).update(processed_at=timezone.now())
+    return len(processed), failed
+
+
+def purge(days=None):
+    """Delete events processed more than ``days`` ago. Returns the number deleted."""
+    cutoff = timezone.now() - timedelta(days=days or settings.OUTBOX_KEEP_DAYS)
+    return OutboxEvent.objects.filter(processed_at__lt=cutoff).delete()[0]
+
+
+@handler('notification')
+def send_notification(payload):
+    from notifications.utils import create_notification
+
+    create_notification(payload['title'], payload['message'], payload.get('data'), payload['recipient_ids'])
+
+
+@handler('driver_earning')
+def record_driver_earning(payload):
+    from driver_portal.models import DriverEarningHistory
+
+    # A retried event must not pay twice
+    if not DriverEarningHistory.objects.filter(delivery_id=payload['delivery_id']).exists():
+        DriverEarningHistory.objects.create(
+            driver_id=payload['driver_id'], delivery_id=payload['delivery_id'], amount=payload['amount']
+        )
+
+
+@handler('simplify_track')
+def simplify_delivery_track(payload):
+    from customer_portal.tracks import simplify_track
+
+    simplify_track(payload['order_id'])
@@ -0,0 +1,54 @@
+import time
+
+from django.conf import settings
+
+try:
+    import redis
+except ImportError:  # in-process fallbacks are used without it
+    redis = None
+
+_client = None
+_retry_at = 0
+
+
+def get_redis():
+    """
+    Shared Redis client for application data (spatial index, presence, ...),
+    or None while Redis is unreachable. Reconnection is retried every
+    REDIS_RETRY_INTERVAL seconds so callers can fall back cheaply meanwhile.
+    """
+    global _client, _retry_at
+    if _client is not None:
+        return _client
+    if redis is None or time.monotonic() < _retry_at:
+        return None
+    try:
+        client = redis.Redis.from_url(
+            settings.REDIS_DATA_URL,
+            decode_responses=True,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+        client.ping()
+    except Exception:
+        _retry_at = time.monotonic() + settings.REDIS_RETRY_INTERVAL
+        return None
+    _client = client
+    return _client
+
+
+def reset_redis():
+    """Drop the client after a connection error, the next call reconnects"""
+    global _client, _retry_at
+    _client = None
+    _retry_at = time.monotonic() + settings.REDIS_RETRY_INTERVAL
+
+
+def redis_failed(error):
+    """
+    Call from the except clause around a Redis command. Only a lost
+    connection drops the client, an error of the command itself (a bad
+    coordinate, a wrong type) falls back for that call alone.
+    """
+    if redis is None or isinstance(error, (redis.ConnectionError, redis.TimeoutError)):
+        reset_redis()
@@ -0,0 +1,260 @@
+import math
+import threading
+from heapq import nsmallest
+
+from django.conf import settings
+
+from .redis_client import get_redis, redis_failed
+
+KM_PER_DEGREE = 111.32
+EARTH_DIAMETER_KM = 2 * 6371.0
+
+
+class GridIndex:
+    """
+    In-process point index on a fixed lat/lng grid.
+    Points are bucketed into cells of ``cell_km``; queries only look at the
+    rings of cells around the query point, so cost depends on local density,
+    not on the total number of points.
+    """
+
+    def __init__(self, cell_km=None):
+        self.cell_deg = (cell_km or settings.SPATIAL_INDEX_CELL_KM) / KM_PER_DEGREE
+        self._cells = {}  # (row, col) -> set(member)
+        self._points = {}  # member -> (lat, lng, cell, lat_rad, lng_rad, cos_lat)
+        self._bounds = None  # (min_row, max_row, min_col, max_col) of every cell ever used
+        self._lock = threading.Lock()
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, member):
+        return member in self._points
+
+    def update(self, member, lat, lng):
+        cell = self._cell(lat, lng)
+        with self._lock:
+            previous = self._points.get(member)
+            if previous is not None and previous[2] != cell:
+                self._discard(member, previous[2])
+            lat_rad, lng_rad = math.radians(lat), math.radians(lng)
+            self._points[member] = (lat, lng, cell, lat_rad, lng_rad, math.cos(lat_rad))
+            self._cells.setdefault(cell, set()).add(member)
+            if self._bounds is None:
+                self._bounds = (cell[0], cell[0], cell[1], cell[1])
+            else:
+                min_row, max_row, min_col, max_col = self._bounds
+                self._bounds = (min(min_row, cell[0]), max(max_row, cell[0]), min(min_col, cell[1]), max(max_col, cell[1]))
+
+    def remove(self, member):
+        with self._lock:
+            previous = self._points.pop(member, None)
+            if previous is not None:
+                self._discard(member, previous[2])
+
+    def _discard(self, member, cell):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(member)
+            if not members:
+                del self._cells[cell]
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._points.clear()
+            self._bounds = None
+
+    def position(self, member):
+        point = self._points.get(member)
+        return (point[0], point[1]) if point else None
+
+    def _ring(self, center, radius):
+        row, col = center
+        if radius == 0:
+            yield center
+            return
+        for c in range(col - radius, col + radius + 1):
+            yield row - radius, c
+            yield row + radius, c
+        for r in range(row - radius + 1, row + radius):
+            yield r, col - radius
+            yield r, col + radius
+
+    def _scan(self, lat, lng, max_radius_km, enough):
+        """
+        Walk rings of cells outwards and collect (distance, member) candidates.
+        Stops once ``enough(candidates, bound_km)`` says no unvisited cell
+        can hold a better point, or past max_radius_km.
+        """
+        center = self._cell(lat, lng)
+        # Cells shrink in km along longitude, use the narrow side as the bound.
+        cell_km = self.cell_deg * KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+        max_rings = int(max_radius_km / cell_km) + 1
+        candidates = []
+        lat_rad, lng_rad = math.radians(lat), math.radians(lng)
+        cos_lat = math.cos(lat_rad)
+        sin, asin, sqrt = math.sin, math.asin, math.sqrt
+        with self._lock:
+            if not self._points:
+                return candidates
+            # Never walk more rings than the populated area spans.
+            min_row, max_row, min_col, max_col = self._bounds
+            span = max(abs(center[0] - min_row), abs(center[0] - max_row), abs(center[1] - min_col), abs(center[1] - max_col))
+            for radius in range(min(max_rings, span) + 1):
+                for cell in self._ring(center, radius):
+                    for member in self._cells.get(cell, ()):
+                        point = self._points[member]
+                        # haversine, inlined: this is the hot loop
+                        a = sin((point[3] - lat_rad) / 2) ** 2 + cos_lat * point[5] * sin((point[4] - lng_rad) / 2) ** 2
+                        distance = EARTH_DIAMETER_KM * asin(sqrt(min(a, 1.0)))
+                        if distance <= max_radius_km:
+                            candidates.append((distance, member))
+                if enough(candidates, radius * cell_km):
+                    break
+        return candidates
+
+    def nearest(self, lat, lng, k, max_radius_km=None):
+        """The k closest members as [(member, distance_km)], closest first"""
+        max_radius_km = max_radius_km or settings.SPATIAL_INDEX_MAX_RADIUS_KM
+
+        def enough(candidates, bound_km):
+            return len(candidates) >= k and nsmallest(k, candidates)[-1][0] <= bound_km
+
+        candidates = self._scan(lat, lng, max_radius_km, enough)
+        return [(member, distance) for distance, member in nsmallest(k, candidates)]
+
+    def within(self, lat, lng, radius_km, limit=None):
+        """Members within radius_km as [(member, distance_km)], closest first"""
+        candidates = self._scan(lat, lng, radius_km, lambda candidates, bound_km: bound_km >= radius_km)
+        candidates = sorted(candidates) if limit is None else nsmallest(limit, candidates)
+        return [(member, distance) for distance, member in candidates]
+
+
+class SpatialIndex:
+    """
+    Point index shared by all workers through Redis GEO commands (a geohash
+    index), with an in-process GridIndex as fallback when Redis is unreachable.
+
+    Writes go to both so the local copy is usable the moment Redis drops out.
+    ``loader`` returns (member, lat, lng) rows from the database and fills the
+    local copy the first time it is read, so a fresh worker without Redis still
+    answers from the last persisted positions.
+    """
+
+    def __init__(self, name, loader=None, cell_km=None):
+        self.key = f"geo:{name}"
+        self.loader = loader
+        self.local = GridIndex(cell_km)
+        self._loaded = loader is None
+
+    def _redis(self):
+        return get_redis()
+
+    def _local(self):
+        if not self._loaded:
+            self._loaded = True
+            for member, lat, lng in self.loader():
+                self.local.update(str(member), lat, lng)
+        return self.local
+
+    def update(self, member, lat, lng):
+        member = str(member)
+        self.local.update(member, lat, lng)
+        client = self._redis()
+        if client is not None:
+            try:
+                client.geoadd(self.key, [lng, lat, member])
+            except Exception as e:
+                redis_failed(e)
+
+    def update_many(self, rows):
+        """update() for many (member, lat, lng) rows in one Redis round trip"""
+        values = []
+        for member, lat, lng in rows:
+            self.local.update(str(member), lat, lng)
+            values.extend([lng, lat, str(member)])
+        client = self._redis()
+        if client is not None and values:
+            try:
+                client.geoadd(self.key, values)
+            except Exception as e:
+                redis_failed(e)
+
+    def remove(self, member):
+        member = str(member)
+        self.local.remove(member)
+        client = self._redis()
+        if client is not None:
+            try:
+                client.zrem(self.key, member)
+            except Exception as e:
+                redis_failed(e)
+
+    def position(self, member):
+        member = str(member)
+        client = self._redis()
+        if client is not None:
+            try:
+                positions = client.geopos(self.key, member)
+                if positions and positions[0]:
+                    lng, lat = positions[0]
+                    return float(lat), float(lng)
+                return None
+            except Exception as e:
+                redis_failed(e)
+        return self._local().position(member)
+
+    def _geosearch(self, lat, lng, radius_km, count):
+        client = self._redis()
+        if client is None:
+            return None
+        try:
+            rows = client.geosearch(
+                self.key, longitude=lng, latitude=lat, radius=radius_km, unit='km',
+                sort='ASC', count=count, withdist=True,
+            )
+        except Exception as e:
+            redis_failed(e)
+            return None
+        return [(member, float(distance)) for member, distance in rows]
+
+    def nearest(self, lat, lng, k, max_radius_km=None):
+        """The k closest members as [(member, distance_km)], closest first"""
+        max_radius_km = max_radius_km or settings.SPATIAL_INDEX_MAX_RADIUS_KM
+        result = self._geosearch(lat, lng, max_radius_km, k)
+        if result is None:
+            result = self._local().nearest(lat, lng, k, max_radius_km)
+        return result
+
+    def within(self, lat, lng, radius_km, limit=None):
+        """Members within radius_km as [(member, distance_km)], closest first"""
+        result = self._geosearch(lat, lng, radius_km, limit)
+        if result is None:
+            result = self._local().within(lat, lng, radius_km, limit)
+        return result
+
+    def rebuild(self, rows):
+        """Replace the whole index with (member, lat, lng) rows"""
+        rows = [(str(member), lat, lng) for member, lat, lng in rows]
+        self.local.clear()
+        for member, lat, lng in rows:
+            self.local.update(member, lat, lng)
+        self._loaded = True
+        client = self._redis()
+        if client is not None:
+            try:
+                pipe = client.pipeline()
+                pipe.delete(self.key)
+                for start in range(0, len(rows), 1000):
+                    values = []
+                    for member, lat, lng in rows[start:start + 1000]:
+                        values.extend([lng, lat, member])
+                    pipe.geoadd(self.key, values)
+                pipe.execute()
+            except Exception as e:
+                redis_failed(e)
+        return len(rows)
@@ -1,3 +1,384 @@
-from django.test import TestCase
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import numpy as np
+import redis
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .backends import BackendUnavailable, FallbackRoutingBackend, GoogleRoutingBackend, HaversineRoutingBackend, Route
+from account.models import UserAuth
+from . import eta, redis_client
+from .cache import DistanceCache
+from .geo import angle_difference, bearing, bounding_box, haversine, haversine_matrix
+from .ids import FeistelPermutation, IdFormat, IdGenerator
+from .models import OutboxEvent
+from .spatial import GridIndex, SpatialIndex
+from .utils import bounding_box_filter, calculate_distance, calculate_distance_matrix
+from .outbox import HANDLERS, drain, enqueue, handler
 
 # Create your tests here.
+
+LOCAL_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "distance": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "distance-tests"},
+}
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class DistanceCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = DistanceCache(max_entries=2)
+        self.addCleanup(self.cache.shared.clear)
+
+    def test_least_recently_used_entry_is_evicted_locally(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual(list(self.cache._local), ['a', 'c'])
+        # Still served from the shared tier
+        self.assertEqual(self.cache.get('b'), 2)
+
+    def test_get_many_reads_the_shared_tier_and_counts(self):
+        self.cache.set_many({'a': 1, 'b': 2})
+        other = DistanceCache(max_entries=2)
+        self.assertEqual(other.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        self.assertEqual((other.hits, other.misses), (2, 1))
+        self.assertEqual(other.stats()['shared_misses'], 1)
+
+    def test_counts_reach_the_shared_tier_in_batches(self):
+        self.cache.set('a', 1)
+        with mock.patch.object(self.cache, '_shared_incr') as incr:
+            for _ in range(50):
+                self.cache.get_or_compute('a', lambda: 1)
+            incr.assert_not_called()
+            self.cache.report_stats()
+        incr.assert_called_once_with('distance:stats:hits', 50)
+
+    def test_failed_report_is_logged_and_kept(self):
+        self.cache.get_many(['a'])
+        with mock.patch.object(self.cache, '_shared_incr', side_effect=ConnectionError), \
+                self.assertLogs('common_portal.cache', 'WARNING'):
+            self.cache.report_stats()
+        self.assertEqual(self.cache.stats()['shared_misses'], 1)
+
+    def test_concurrent_lookups_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 42
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_or_compute('k', compute))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [42] * 8)
+        self.assertEqual(len(calls), 1)
+
+    @override_settings(ROUTING_LATENCY_BUDGET=0.2)
+    def test_waiters_give_up_after_the_routing_budget(self):
+        cache = DistanceCache()
+        release = threading.Event()
+        owner = threading.Thread(target=cache.get_or_compute, args=('k', lambda: release.wait(5) and 1))
+        owner.start()
+        time.sleep(0.05)
+        started = time.monotonic()
+        self.assertEqual(cache.get_or_compute('k', lambda: 2), 2)
+        self.assertLess(time.monotonic() - started, 1)
+        release.set()
+        owner.join()
+
+
+class DownBackend(HaversineRoutingBackend):
+    name = 'down'
+    approximate = False
+
+    def __init__(self):
+        super().__init__(use_model=False)
+        self.calls = 0
+
+    def route(self, *args, timeout=None):
+        self.calls += 1
+        raise BackendUnavailable("timeout")
+
+
+class FallbackRoutingBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.down = DownBackend()
+        self.backend = FallbackRoutingBackend([self.down, HaversineRoutingBackend(use_model=False)], cooldown=60)
+
+    def test_failing_backend_falls_back_and_cools_down(self):
+        route = self.backend.route(22.35, 91.82, 22.37, 91.83)
+        self.assertIsInstance(route, Route)
+        self.assertEqual(route.source, 'haversine')
+        self.backend.route(22.35, 91.82, 22.37, 91.83)
+        self.assertEqual(self.down.calls, 1)
+
+    def test_spent_budget_skips_network_backends(self):
+        self.assertEqual(self.backend.route(22.35, 91.82, 22.37, 91.83, timeout=0).source, 'haversine')
+        self.assertEqual(self.down.calls, 0)
+
+
+class SlowGoogleBackend(GoogleRoutingBackend):
+    def __init__(self):
+        super().__init__(workers=1)
+        self.timeouts = []
+
+    def _request(self, origins, destinations, timeout):
+        self.timeouts.append(timeout)
+        time.sleep(0.2)
+        return [[Route(1.0, 2, self.name, False) for _ in destinations] for _ in origins]
+
+
+@override_settings(CACHES=LOCAL_CACHES, GOOGLE_MAPS_API_KEY=None)
+class DistanceMatrixTests(TestCase):
+    def test_tiles_cover_every_cell_once_within_the_api_limits(self):
+        backend = GoogleRoutingBackend()
+        for n_origins, n_destinations in [(1, 1), (3, 130), (60, 30), (26, 4), (100, 100)]:
+            cells = []
+            for row_start, row_end, col_start, col_end in backend.tiles(n_origins, n_destinations):
+                self.assertLessEqual(row_end - row_start, backend.max_origins)
+                self.assertLessEqual(col_end - col_start, backend.max_destinations)
+                self.assertLessEqual((row_end - row_start) * (col_end - col_start), backend.max_elements)
+                cells += [(i, j) for i in range(row_start, row_end) for j in range(col_start, col_end)]
+            self.assertEqual(sorted(cells), [(i, j) for i in range(n_origins) for j in range(n_destinations)])
+
+    def test_tiles_share_one_deadline(self):
+        backend = SlowGoogleBackend()
+        origins = [(22.3 + i / 100, 91.8) for i in range(3)]
+        destinations = [(22.4, 91.9 + j / 100) for j in range(100)]
+        # Four tiles of 3 x 25 fetched one after the other, 0.2 s each
+        result = backend.matrix(origins, destinations, timeout=0.5)
+        self.assertEqual(len(backend.timeouts), 3)
+        self.assertTrue(all(later < earlier for earlier, later in zip(backend.timeouts, backend.timeouts[1:])))
+        self.assertLessEqual(backend.timeouts[0], 0.5)
+        self.assertIsNotNone(result[0][0])
+        self.assertEqual(result[0][75:], [None] * 25)
+
+    def test_invalid_coordinates_give_no_route(self):
+        result = calculate_distance_matrix([(22.35, 91.82), ('x', 91.8)], [(22.37, 91.83), (float('nan'), 91.8)])
+        self.assertIsNotNone(result[0][0][0])
+        self.assertEqual([result[0][1], result[1][0], result[1][1]], [(None, None)] * 3)
+
+
+class EtaModelTests(SimpleTestCase):
+    def rows(self, count, road_factor, approximate, seed):
+        rng = random.Random(seed)
+        start = datetime(2026, 1, 5, 9, tzinfo=timezone.utc)
+        rows = []
+        for _ in range(count):
+            lat, lng = 22.35 + rng.random() / 100, 91.82 + rng.random() / 100
+            drop_lat, drop_lng = lat + rng.uniform(0.01, 0.08), lng + rng.uniform(0.01, 0.08)
+            km = float(haversine(lat, lng, drop_lat, drop_lng)) * road_factor
+            minutes = 3 + 2 * km
+            # Live durations run 20% short, local ones are off by anything
+            live = None if approximate else round(minutes / 1.2)
+            estimate = round(minutes * 3) if approximate else live
+            rows.append((lat, lng, drop_lat, drop_lng, round(km, 2), estimate, start, start + timedelta(minutes=minutes), approximate, live))
+        return rows
+
+    def test_only_live_routes_are_learned_from(self):
+        # Local estimates made with a road factor an earlier model had learned
+        rows = self.rows(60, 1.5, False, 1) + self.rows(60, 1.2, True, 2)
+        params, samples = eta.train(rows, min_samples=10)
+        self.assertEqual(samples, 120)
+        self.assertAlmostEqual(params['road_factor'], 1.5, places=2)
+        predictor = eta.EtaPredictor(params)
+        self.assertAlmostEqual(predictor.calibrate(10, 22.35, 91.82, rows[0][6]), 12, delta=0.3)
+        self.assertAlmostEqual(predictor.predict(10, 22.35, 91.82, rows[0][6]), 23, delta=0.5)
+        self.assertLess(eta.evaluate(params, rows[:60]), 0.5)
+
+    def test_retraining_keeps_the_calibration(self):
+        rows = self.rows(60, 1.5, False, 4)
+        params, _ = eta.train(rows, min_samples=10)
+        predictor = eta.EtaPredictor(params)
+        # Orders created meanwhile store the calibrated estimate next to the live duration
+        rows = [row[:5] + (round(predictor.calibrate(row[9], row[0], row[1], row[6])),) + row[6:] for row in rows]
+        retrained, _ = eta.train(rows, min_samples=10)
+        factor = params['levels']['global']['']['calibration']
+        self.assertAlmostEqual(factor, 1.2, delta=0.05)
+        self.assertEqual(retrained['levels']['global']['']['calibration'], factor)
+
+    def test_unknown_source_is_not_a_measurement(self):
+        rows = [row[:8] for row in self.rows(30, 1.5, False, 3)]
+        params, _ = eta.train(rows, min_samples=10)
+        self.assertIsNone(params['road_factor'])
+        self.assertIsNone(params['levels']['global']['']['calibration'])
+
+
+class IdTests(SimpleTestCase):
+    def test_feistel_is_a_bijection(self):
+        for size in (1, 2, 7, 90, 1000, 4099):
+            permutation = FeistelPermutation(size, b'key')
+            self.assertEqual(sorted(permutation(value) for value in range(size)), list(range(size)))
+        with self.assertRaises(ValueError):
+            FeistelPermutation(90, b'key')(90)
+
+    @override_settings(ORDER_ID_KEY=None)
+    def test_order_ids_need_their_own_key(self):
+        with self.assertRaises(ImproperlyConfigured):
+            IdGenerator('test').format
+
+    def test_tiers_follow_the_digit_count(self):
+        id_format = IdFormat('key')
+        self.assertEqual(id_format.tier(0), (6, 0))
+        self.assertEqual(id_format.tier(899999), (6, 899999))
+        self.assertEqual(id_format.tier(900000), (7, 0))
+        self.assertEqual(len(id_format(899999)), 6)
+        self.assertEqual(len(id_format(900000)), 7)
+
+    def test_ids_are_unique_across_tiers(self):
+        id_format = IdFormat('key', min_digits=2)
+        ids = [id_format(value) for value in range(990)]
+        self.assertEqual(len(set(ids)), 990)
+        self.assertEqual(sorted(ids[:90], key=int), [str(n) for n in range(10, 100)])
+        self.assertTrue(all(len(order_id) == 3 for order_id in ids[90:]))
+
+
+class GeoTests(SimpleTestCase):
+    points = [(22.35, 91.82), (23.81, 90.41), (-33.87, 151.21), (51.5, -0.12)]
+
+    def test_vectorized_distances_match_the_scalar_formula(self):
+        lats, lngs = np.array(self.points).T
+        pairwise = haversine(lats, lngs, lats[::-1], lngs[::-1])
+        matrix = haversine_matrix(lats, lngs, lats, lngs)
+        self.assertEqual(matrix.shape, (4, 4))
+        for i, (lat1, lng1) in enumerate(self.points):
+            lat2, lng2 = self.points[-1 - i]
+            self.assertAlmostEqual(pairwise[i], calculate_distance(lat1, lng1, lat2, lng2), delta=0.01)
+            for j, (lat2, lng2) in enumerate(self.points):
+                self.assertAlmostEqual(matrix[i, j], calculate_distance(lat1, lng1, lat2, lng2), delta=0.01)
+        np.testing.assert_allclose(np.diag(matrix), 0, atol=1e-9)
+
+    def test_bearings(self):
+        self.assertAlmostEqual(float(bearing(0, 0, 1, 0)), 0, places=6)
+        self.assertAlmostEqual(float(bearing(0, 0, 0, 1)), 90, places=6)
+        self.assertEqual(angle_difference(350, 10), 20)
+
+    def test_bounding_box_contains_the_circle(self):
+        for lat, lng in self.points:
+            min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, 5)
+            angles = np.radians(np.arange(0, 360, 5))
+            # Points 5 km away in every direction, on a flat approximation
+            lats = lat + np.cos(angles) * 4.99 / 111.32
+            lngs = lng + np.sin(angles) * 4.99 / (111.32 * np.cos(np.radians(lat)))
+            self.assertTrue(np.all(haversine(lat, lng, lats, lngs) <= 5.01))
+            self.assertTrue(np.all((min_lat <= lats) & (lats <= max_lat) & (min_lng <= lngs) & (lngs <= max_lng)))
+
+
+class BoundingBoxFilterTests(TestCase):
+    def test_keeps_the_users_around_a_point(self):
+        positions = {'near': (22.36, 91.83), 'edge': (22.35 + 4.9 / 111.32, 91.82), 'far': (22.50, 91.82), 'nowhere': (None, None)}
+        for name, (lat, lng) in positions.items():
+            UserAuth.objects.create_user(email=f'{name}@example.com', password='x', role='driver', location_latitude=lat, location_longitude=lng)
+        users = UserAuth.objects.filter(bounding_box_filter(22.35, 91.82, 5, 'location_latitude', 'location_longitude'))
+        self.assertEqual(sorted(user.email for user in users), ['edge@example.com', 'near@example.com'])
+
+
+class GridIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.points = {f"p{i}": (22.3 + rng.random() * 0.2, 91.7 + rng.random() * 0.2) for i in range(500)}
+        self.index = GridIndex(cell_km=1)
+        for member, (lat, lng) in self.points.items():
+            self.index.update(member, lat, lng)
+
+    def brute_force(self, lat, lng):
+        return sorted((calculate_distance(lat, lng, p_lat, p_lng), member) for member, (p_lat, p_lng) in self.points.items())
+
+    def test_nearest_and_within_match_brute_force(self):
+        for lat, lng in [(22.4, 91.8), (22.31, 91.71), (22.6, 92.0)]:
+            expected = self.brute_force(lat, lng)
+            nearest = self.index.nearest(lat, lng, 5, max_radius_km=100)
+            self.assertEqual([member for member, _ in nearest], [member for _, member in expected[:5]])
+            within = {member for member, _ in self.index.within(lat, lng, 3)}
+            # calculate_distance() rounds to 10 m, leave that margin at the edge
+            self.assertLessEqual({member for distance, member in expected if distance < 2.99}, within)
+            self.assertLessEqual(within, {member for distance, member in expected if distance <= 3.01})
+
+    def test_moves_and_removals(self):
+        self.index.update('p0', 10.0, 10.0)
+        self.assertEqual(self.index.position('p0'), (10.0, 10.0))
+        self.assertEqual(self.index.nearest(10.0, 10.0, 1)[0][0], 'p0')
+        self.index.remove('p0')
+        self.assertNotIn('p0', self.index)
+        self.assertEqual(self.index.nearest(10.0, 10.0, 1), [])
+
+
+class LocalSpatialIndex(SpatialIndex):
+    client = None
+
+    def _redis(self):
+        return self.client
+
+
+class FailingGeoClient:
+    def geosearch(self, *args, **kwargs):
+        raise redis.ResponseError("invalid longitude,latitude pair")
+
+
+class SpatialIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = LocalSpatialIndex('tests', loader=lambda: [(1, 22.35, 91.82), (2, 22.36, 91.83)])
+
+    def test_loader_fills_the_local_fallback(self):
+        self.assertEqual([member for member, _ in self.index.nearest(22.35, 91.82, 2)], ['1', '2'])
+        self.index.remove(1)
+        self.index.update(3, 22.3501, 91.8201)
+        self.assertEqual([member for member, _ in self.index.within(22.35, 91.82, 5)], ['3', '2'])
+        self.assertEqual(self.index.position(3), (22.3501, 91.8201))
+
+    def test_command_errors_do_not_drop_the_connection(self):
+        connected = object()
+        self.addCleanup(setattr, redis_client, '_client', redis_client._client)
+        redis_client._client = connected
+        self.index.client = FailingGeoClient()
+        self.assertEqual(len(self.index.within(22.35, 91.82, 5)), 2)
+        self.assertIs(redis_client._client, connected)
+        redis_client.redis_failed(redis.ConnectionError())
+        self.assertIsNone(redis_client._client)
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.fail = True
+
+        @handler('test_event')
+        def flaky(payload):
+            self.calls.append(payload['value'])
+            if self.fail:
+                raise RuntimeError("down")
+
+        self.addCleanup(HANDLERS.pop, 'test_event')
+
+    def test_failed_events_are_retried_later(self):
+        enqueue('test_event', value=1)
+        self.assertEqual(drain(), (0, 1))
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.attempts, 1)
+        self.assertIn("down", event.last_error)
+        self.assertIsNone(event.processed_at)
+
+        # Backed off, not due yet
+        self.assertEqual(drain(), (0, 0))
+
+        self.fail = False
+        OutboxEvent.objects.update(available_at=event.created_at)
+        self.assertEqual(drain(), (1, 0))
+        self.assertIsNotNone(OutboxEvent.objects.get().processed_at)
+        self.assertEqual(self.calls, [1, 1])
+
+    def test_unknown_kind_fails_without_blocking_others(self):
+        enqueue('no_such_event')
+        enqueue('test_event', value=2)
+        self.fail = False
+        self.assertEqual(drain(), (1, 1))
@@ -3,4 +3,5 @@ from .views import *
 
 urlpatterns = [
     path('dashboard/', UserDashboardView.as_view(), name='dashboard'),
+    path('distance_cache/stats/', DistanceCacheStatsView.as_view(), name='distance_cache_stats'),
 ]
@@ -1,51 +1,177 @@
-import requests
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from django.db.models import Q
+from .backends import RoutingError, get_routing_backend
+from .cache import distance_cache
+from .eta import get_eta_model
+from .geo import bounding_box
 
-def calculate_distance_and_time(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng):
+logger = logging.getLogger(__name__)
+
+
+def calculate_distance_and_time(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, timeout=None, with_route=False):
     """
-    Returns both distance (km) and estimated time (minutes) between two coordinates using Google Distance Matrix API.
+    Returns both distance (km) and estimated time (minutes) between two coordinates.
+    Results are served from the shared distance cache, misses go through the
+    configured routing backends (Google first, local estimate as fallback).
+    Takes at most ``timeout`` seconds (ROUTING_LATENCY_BUDGET by default),
+    waiting on an identical lookup included, the local estimate answers
+    once it is spent.
+    Returns (None, None) only when no backend can handle the coordinates.
+    With ``with_route`` a third value is the Route the result came from, for
+    its ``approximate`` flag and uncalibrated duration.
     """
-    url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-    params = {
-        "origins": f"{pickup_lat},{pickup_lng}",
-        "destinations": f"{dropoff_lat},{dropoff_lng}",
-        "units": "metric",
-        "mode": "driving",  # realistic driving distance and time
-        "key": settings.GOOGLE_MAPS_API_KEY,
-    }
+    budget = settings.ROUTING_LATENCY_BUDGET if timeout is None else timeout
+    deadline = time.monotonic() + budget
+
+    key = _pair_key((pickup_lat, pickup_lng), (dropoff_lat, dropoff_lng))
+    if key is None:
+        return (None, None, None) if with_route else (None, None)
+
+    def compute():
+        try:
+            return get_routing_backend().route(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng, timeout=deadline - time.monotonic())
+        except RoutingError as e:
+            logger.warning("Routing error: %s", e)
+            return None
+
+    # Local estimates are not cached so Google answers the next lookup once it is back.
+    route = distance_cache.get_or_compute(key, compute, should_cache=lambda route: not route.approximate, wait=budget)
+    if route is None:
+        return (None, None, None) if with_route else (None, None)
+    result = (route.distance_km, _calibrated_minutes(route, pickup_lat, pickup_lng))
+    return (*result, route) if with_route else result
+
 
+def _calibrated_minutes(route, lat, lng):
+    """Live durations corrected by the trained ETA model, local estimates already come from it"""
+    model = get_eta_model() if settings.ETA_MODEL_ENABLED and not route.approximate else None
+    if model is None:
+        return route.duration_minutes
+    return round(model.calibrate(route.duration_minutes, float(lat), float(lng)))
+
+
+def _pair_key(origin, destination):
+    """Cache key of a pair, None when a coordinate is not a finite number"""
     try:
-        response = requests.get(url, params=params)
-        data = response.json()
+        if not all(math.isfinite(float(value)) for value in (*origin, *destination)):
+            return None
+        return distance_cache.make_key(origin[0], origin[1], destination[0], destination[1])
+    except (TypeError, ValueError):
+        return None
 
-        if data["status"] == "OK" and data["rows"]:
-            element = data["rows"][0]["elements"][0]
-            if element["status"] == "OK":
-                distance_km = round(element["distance"]["value"] / 1000, 2)  # meters -> km
-                duration_minutes = round(element["duration"]["value"] / 60)  # seconds -> minutes
-                return distance_km, duration_minutes
-    except Exception as e:
-        print(f"Google API error: {e}")
 
-    return None, None
+def calculate_distance_matrix(origins, destinations, timeout=None):
+    """
+    Distance (km) and estimated time (minutes) from every origin to every destination.
+    ``origins`` and ``destinations`` are lists of (lat, lng). Returns a dense
+    len(origins) x len(destinations) list of lists of (distance_km, minutes),
+    (None, None) where a pair can't be routed or has invalid coordinates.
+    Cached pairs are reused, the rest is resolved with as few batched
+    backend calls as possible, within ``timeout`` seconds
+    (ROUTING_MATRIX_TIMEOUT by default), the local estimate fills in after.
+    """
+    keys = [[_pair_key(o, d) for d in destinations] for o in origins]
+    cached = distance_cache.get_many({key for row in keys for key in row if key is not None})
 
+    rows = sorted({i for i, row in enumerate(keys) for key in row if key is not None and key not in cached})
+    cols = sorted({j for i in rows for j, key in enumerate(keys[i]) if key is not None and key not in cached})
+    if rows:
+        block = get_routing_backend().matrix([origins[i] for i in rows], [destinations[j] for j in cols], timeout=timeout)
+        fresh = {}
+        for bi, i in enumerate(rows):
+            for bj, j in enumerate(cols):
+                route = block[bi][bj]
+                if route is not None and keys[i][j] is not None and keys[i][j] not in cached:
+                    cached[keys[i][j]] = route
+                    if not route.approximate:
+                        fresh[keys[i][j]] = route
+        if fresh:
+            distance_cache.set_many(fresh)
 
+    result = []
+    for origin, row in zip(origins, keys):
+        result.append([
+            (cached[key].distance_km, _calibrated_minutes(cached[key], origin[0], origin[1])) if key in cached else (None, None)
+            for key in row
+        ])
+    return result
 
 
-# import math
+def calculate_distance_pairs(pairs, with_route=False):
+    """
+    Distance (km) and estimated time (minutes) of every (origin, destination)
+    pair, as a list of (distance_km, minutes), (None, None) where a pair
+    can't be routed or has invalid coordinates. Uncached pairs are grouped by origin, so orders sharing
+    a pickup cost one matrix row, and the groups are looked up concurrently.
+    With ``with_route`` the tuples carry a third value, the Route the result
+    came from (None when there is no result).
+    """
+    keys = [_pair_key(o, d) for o, d in pairs]
+    cached = distance_cache.get_many({key for key in keys if key is not None})
 
-# def calculate_distance(lat1, lon1, lat2, lon2):
-#     """
-#     Calculate the great-circle distance between two points on the Earth (in km).
-#     Uses the Haversine formula.
-#     """
-#     R = 6371  # Radius of Earth in kilometers
+    groups = {}
+    for (origin, destination), key in zip(pairs, keys):
+        if key is not None and key not in cached:
+            groups.setdefault(tuple(origin), {})[key] = destination
 
-#     lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-#     dlat = lat2 - lat1
-#     dlon = lon2 - lon1
+    def fetch(group):
+        origin, destinations = group
+        row = get_routing_backend().matrix([origin], list(destinations.values()))[0]
+        return dict(zip(destinations, row))
 
-#     a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
-#     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    if groups:
+        fresh = {}
+        with ThreadPoolExecutor(max_workers=min(settings.ROUTING_MATRIX_WORKERS, len(groups))) as pool:
+            for routes in pool.map(fetch, groups.items()):
+                for key, route in routes.items():
+                    if route is not None:
+                        cached[key] = route
+                        if not route.approximate:
+                            fresh[key] = route
+        if fresh:
+            distance_cache.set_many(fresh)
 
-#     return round(R * c, 2)
+    results = [
+        (cached[key].distance_km, _calibrated_minutes(cached[key], origin[0], origin[1])) if key in cached else (None, None)
+        for (origin, _), key in zip(pairs, keys)
+    ]
+    if with_route:
+        results = [(*result, cached.get(key)) for result, key in zip(results, keys)]
+    return results
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate the great-circle distance between two points on the Earth (in km).
+    Uses the Haversine formula.
+    """
+    R = 6371  # Radius of Earth in kilometers
+
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+
+    a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return round(R * c, 2)
+
+
+def bounding_box_filter(lat, lng, radius_km, lat_field, lng_field):
+    """
+    Q filter keeping rows whose (lat_field, lng_field) lie in the box around
+    (lat, lng) that contains the circle of ``radius_km``. Served by the
+    composite coordinate indexes as a range scan, refine with an exact
+    distance check afterwards.
+    """
+    min_lat, max_lat, min_lng, max_lng = (float(value) for value in bounding_box(lat, lng, radius_km))
+    return Q(**{
+        f"{lat_field}__gte": min_lat,
+        f"{lat_field}__lte": max_lat,
+        f"{lng_field}__gte": min_lng,
+        f"{lng_field}__lte": max_lng,
+    })
@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from django.db.models import Sum
 from datetime import date
 from customer_portal.models import DeliveryRequest
+from .cache import distance_cache
 
 class UserDashboardView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -72,3 +73,11 @@ class UserDashboardView(APIView):
             data = {'message': 'Role not recognized'}
 
         return Response({"status": "success", "data": data}, status=200)
+
+
+class DistanceCacheStatsView(APIView):
+    """Hit/miss counters of the distance cache"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({"status": "success", "data": distance_cache.stats()}, status=200)
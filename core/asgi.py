@@ -12,13 +12,17 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from notifications.middleware import JWTAuthMiddleware
 import chat.routing
 import notifications.routing
+import driver_portal.routing
+import customer_portal.routing
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": JWTAuthMiddleware(
         URLRouter(
             chat.routing.websocket_urlpatterns +
-            notifications.routing.websocket_urlpatterns
+            notifications.routing.websocket_urlpatterns +
+            driver_portal.routing.websocket_urlpatterns +
+            customer_portal.routing.websocket_urlpatterns
         )
     ),
 })
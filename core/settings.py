@@ -29,6 +29,19 @@ DEBUG = os.getenv('DEBUG', 'False')
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '').split(',')
 
 GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+
+# Routing backends are tried in order, the local estimator must stay last
+ROUTING_BACKENDS = [
+    'common_portal.backends.GoogleRoutingBackend',
+    'common_portal.backends.HaversineRoutingBackend',
+]
+ROUTING_LATENCY_BUDGET = float(os.getenv('ROUTING_LATENCY_BUDGET', 2.0))  # seconds per lookup
+ROUTING_FAILURE_COOLDOWN = 30  # seconds a failing backend is skipped
+ROUTING_MATRIX_TIMEOUT = float(os.getenv('ROUTING_MATRIX_TIMEOUT', 10.0))  # seconds per batched matrix lookup
+ROUTING_MATRIX_WORKERS = int(os.getenv('ROUTING_MATRIX_WORKERS', 4))  # concurrent matrix requests / pooled connections
+ROUTING_ROAD_FACTOR = float(os.getenv('ROUTING_ROAD_FACTOR', 1.3))  # road km per straight-line km
+ROUTING_AVERAGE_SPEED_KMH = float(os.getenv('ROUTING_AVERAGE_SPEED_KMH', 25))
+ROUTING_OVERHEAD_MINUTES = float(os.getenv('ROUTING_OVERHEAD_MINUTES', 3))
 # Application definition
 
 INSTALLED_APPS = [
@@ -92,6 +105,118 @@ CHANNEL_LAYERS = {
     },
 }
 
+REDIS_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379')
+REDIS_DATA_URL = f"{REDIS_URL}/2"  # spatial index, presence and other live state
+REDIS_SOCKET_TIMEOUT = 0.5  # seconds, live-state lookups fall back in-process after this
+REDIS_RETRY_INTERVAL = 30  # seconds between reconnect attempts
+
+# Spatial index of live positions (drivers, open orders)
+SPATIAL_INDEX_CELL_KM = 1.0  # grid cell size of the in-process fallback index
+SPATIAL_INDEX_MAX_RADIUS_KM = 50  # nearest-neighbour queries never look further
+
+# Batched dispatch (run_dispatch command), off unless enabled
+DISPATCH_ENABLED = os.getenv('DISPATCH_ENABLED', 'False') == 'True'
+DISPATCH_INTERVAL_SECONDS = float(os.getenv('DISPATCH_INTERVAL_SECONDS', 5))
+DISPATCH_MAX_PICKUP_KM = float(os.getenv('DISPATCH_MAX_PICKUP_KM', 10))  # drivers further away are never matched
+DISPATCH_BATCH_LIMIT = 10000  # oldest confirmed orders considered per cycle
+DISPATCH_OPTIMAL_MAX_SIZE = 1000  # larger batches use the greedy solver
+DISPATCH_GREEDY_CANDIDATES = 10  # nearest drivers per order the greedy solver considers
+DISPATCH_GREEDY_ROUNDS = 3  # greedy passes over orders left unmatched
+
+# Order pooling (pool_orders command), off unless enabled
+POOLING_ENABLED = os.getenv('POOLING_ENABLED', 'False') == 'True'
+POOLING_INTERVAL_SECONDS = float(os.getenv('POOLING_INTERVAL_SECONDS', 30))
+POOLING_PICKUP_RADIUS_KM = float(os.getenv('POOLING_PICKUP_RADIUS_KM', 1))  # max distance between pickups in a bundle
+POOLING_MAX_BEARING_DIFF = 30  # degrees between the pickup->drop directions of bundled orders
+POOLING_TIME_WINDOW_MINUTES = 20  # max gap between creation times in a bundle
+POOLING_MAX_BUNDLE_SIZE = 5
+POOLING_BUNDLE_TTL_MINUTES = 10  # open bundles older than this go back to single orders
+POOLING_MAX_ORDER_AGE_MINUTES = 10  # older orders are not pooled (again)
+POOLING_BATCH_LIMIT = 5000  # oldest unbundled orders considered per pass
+
+# Multi-stop route sequencing for drivers
+ROUTE_SEQUENCING_TIME_BUDGET = 0.2  # seconds spent improving a route
+ROUTE_SEQUENCING_MATRIX_TIMEOUT = 1.0  # seconds for the distances between the stops, the local estimate fills in after
+ROUTE_SEQUENCING_RESTARTS = 20  # local searches from random orders after the nearest-neighbour one
+ROUTE_STOP_MINUTES = float(os.getenv('ROUTE_STOP_MINUTES', 3))  # handover time at every stop
+
+# Driver location socket (ws/driver/location/)
+DRIVER_LOCATION_MIN_INTERVAL = 0.5  # seconds, faster reports are dropped
+DRIVER_LOCATION_PUBLISH_INTERVAL = 1  # seconds between pushes of the latest positions to Redis
+DRIVER_LOCATION_FLUSH_INTERVAL = float(os.getenv('DRIVER_LOCATION_FLUSH_INTERVAL', 15))  # seconds between database writes
+DRIVER_LOCATION_FLUSH_BATCH = 1000  # drivers per executemany() call
+
+# Driver presence from location socket heartbeats
+PRESENCE_TTL = 45  # seconds a driver stays online after the last report or heartbeat
+PRESENCE_SYNC_INTERVAL = 60  # seconds between syncs back to UserAuth.is_online
+
+# DeliveryRequest IDs, a keyed permutation of a counter (common_portal.ids)
+ORDER_ID_KEY = os.getenv('ORDER_ID_KEY')  # required, never change once orders exist (so not SECRET_KEY, which gets rotated)
+ORDER_ID_BLOCK_SIZE = 100  # counter values a process reserves per query
+
+# Bulk order import (customer_portal.bulk_import)
+IMPORT_CHUNK_SIZE = 500  # rows validated, routed and inserted together
+IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', 50000))  # rows beyond this are not imported
+
+# Transactional outbox for side effects of order changes (drain_outbox command)
+OUTBOX_BATCH_SIZE = 200  # events per transaction
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 1))  # seconds between polls while the outbox is empty
+OUTBOX_MAX_ATTEMPTS = 10  # failed events are retried with exponential backoff up to this many times
+OUTBOX_RETRY_SECONDS = 5  # delay before the first retry
+OUTBOX_KEEP_DAYS = 7  # processed events are purged after this many days
+
+# Geofences around the pickups and drops of active deliveries
+GEOFENCE_RADIUS_M = float(os.getenv('GEOFENCE_RADIUS_M', 75))  # a driver this close is inside
+GEOFENCE_EXIT_FACTOR = 1.5  # and only leaves beyond radius * factor
+GEOFENCE_REFRESH_INTERVAL = 10  # seconds between rebuilds of the fence table
+GEOFENCE_AUTO_STATUSES = [s for s in os.getenv('GEOFENCE_AUTO_STATUSES', 'on_the_way').split(',') if s]  # applied without asking, others are suggested
+
+# Order tracking socket (ws/order/<id>/track/)
+ORDER_TRACKING_MAX_HZ = float(os.getenv('ORDER_TRACKING_MAX_HZ', 1))  # position updates per second per socket
+
+# GPS tracks of deliveries
+TRACK_MIN_DISTANCE_M = 5  # points closer to the previous one are not stored
+TRACK_SIMPLIFY_TOLERANCE_M = 10  # Douglas-Peucker tolerance once a delivery is delivered
+
+# Live ETA of orders on the way, pushed over the notifications socket
+LIVE_ETA_MIN_INTERVAL = 10  # seconds between recomputations per driver
+LIVE_ETA_ROUTE_INTERVAL = 120  # seconds between full routing lookups per order, scaled in between
+LIVE_ETA_ROUTING_BUDGET = 0.5  # seconds of routing per position report, the local estimate answers after
+LIVE_ETA_FLUSH_BUDGET = 1.0  # seconds of routing for all drivers of one location flush
+LIVE_ETA_MIN_CHANGE_MINUTES = 2  # smaller ETA changes are not pushed
+LIVE_ETA_STATE_TTL = 60 * 60  # seconds the per-driver state is kept after the last report
+
+# Travel time model trained on delivered orders (train_eta_model command)
+ETA_MODEL_ENABLED = os.getenv('ETA_MODEL_ENABLED', 'True') == 'True'
+ETA_MODEL_ZONE_KM = 5  # size of the pickup zones the model is bucketed by
+ETA_MODEL_HOUR_BUCKET = 3  # hours of the week per time bucket
+ETA_MODEL_MIN_SAMPLES = 20  # deliveries a bucket needs, sparser ones use a coarser bucket
+ETA_MODEL_MAX_MINUTES = 240  # longer pickup-to-drop times are treated as bad data
+ETA_MODEL_RELOAD_SECONDS = 60  # how often workers look for a newly trained model
+
+# Distance/ETA cache in front of the Google Distance Matrix API
+DISTANCE_CACHE_TIMEOUT = int(os.getenv('DISTANCE_CACHE_TIMEOUT', 60 * 60 * 24))  # seconds
+DISTANCE_CACHE_MAX_ENTRIES = int(os.getenv('DISTANCE_CACHE_MAX_ENTRIES', 10000))  # in-process LRU size
+DISTANCE_CACHE_PRECISION = int(os.getenv('DISTANCE_CACHE_PRECISION', 4))  # decimals, 4 ~= 11 m
+DISTANCE_CACHE_LOCK_TIMEOUT = 5  # seconds an in-flight lookup holds its lock, others wait at most ROUTING_LATENCY_BUDGET
+DISTANCE_CACHE_STATS_INTERVAL = 10  # seconds between adding a worker's hit/miss counts to the shared counters
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "distance": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": f"{REDIS_URL}/1",
+        "TIMEOUT": DISTANCE_CACHE_TIMEOUT,
+        "OPTIONS": {
+            # a stalled Redis costs a lookup this long, then it is routed as a miss
+            "socket_connect_timeout": REDIS_SOCKET_TIMEOUT,
+            "socket_timeout": REDIS_SOCKET_TIMEOUT,
+        },
+    },
+}
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
@@ -99,6 +224,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {'timeout': 20},  # seconds a writer waits for the lock
+        # On disk, the in-memory test database fails concurrent writers instead of making them wait
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -0,0 +1,68 @@
+"""
+Taking orders, by a driver accepting one, a bundle or a dispatch cycle.
+
+Every claim is a single compare-and-set UPDATE that only matches orders
+that are still confirmed and without a driver. The database applies
+concurrent UPDATEs of a row one after the other and re-checks the WHERE
+clause, so however many drivers accept the same order at once, exactly one
+of them changes the row and everybody else gets 0 rows back. No row is read
+or locked beforehand.
+
+Once its UPDATE matched, a claim locks the driver's row, so claims for the
+same driver commit one after the other and a claim made only if the driver
+is free sees every order the driver won meanwhile.
+"""
+from django.db import transaction
+
+from account.models import UserAuth
+from .feed import pending_order_index
+from .models import DeliveryRequest
+from .transitions import ACTIVE_STATUSES, DRIVER, apply, check, log
+
+ACCEPTABLE_STATUS = 'confirmed'
+
+
+def claimable(**lookup):
+    return DeliveryRequest.objects.filter(status=ACCEPTABLE_STATUS, assign_driver__isnull=True, **lookup)
+
+
+def claim_orders(driver_id, detach_bundle=False, role=DRIVER, remark='', only_if_free=False, **lookup):
+    """
+    Assign every claimable order matching ``lookup`` to the driver and log
+    the transitions. With ``only_if_free`` nothing is claimed while the
+    driver has an active order. Returns the ids of the orders won.
+    """
+    check(ACCEPTABLE_STATUS, 'assigned', role)
+    changes = {'assign_driver_id': driver_id}
+    if detach_bundle:
+        changes['bundle'] = None
+    with transaction.atomic():
+        if not apply(claimable(**lookup), ACCEPTABLE_STATUS, 'assigned', **changes):
+            return []
+        if set(lookup) == {'id'}:
+            order_ids = [str(lookup['id'])]
+        else:
+            order_ids = list(DeliveryRequest.objects.filter(
+                assign_driver_id=driver_id, status='assigned', **lookup
+            ).values_list('id', flat=True))
+        # From here on claims for the driver take turns, this one sees every
+        # order the driver won in a claim that committed first.
+        list(UserAuth.objects.select_for_update().filter(id=driver_id).values_list('id', flat=True))
+        if only_if_free and DeliveryRequest.objects.filter(
+            assign_driver_id=driver_id, status__in=ACTIVE_STATUSES
+        ).exclude(id__in=order_ids).exists():
+            transaction.set_rollback(True)
+            return []
+        log(order_ids, ACCEPTABLE_STATUS, 'assigned', driver_id if role == DRIVER else None, remark)
+    return order_ids
+
+
+def claim_order(order_id, driver_id):
+    """
+    Accept one order for a driver. A bundled order taken on its own leaves
+    its bundle, the rest of the bundle stays on offer. True when this driver won.
+    """
+    won = bool(claim_orders(driver_id, detach_bundle=True, id=order_id))
+    if won:
+        pending_order_index.remove(order_id)
+    return won
@@ -2,4 +2,8 @@ from django.contrib import admin
 from .models import *
 # Register your models here.
 
-admin.site.register(DeliveryRequest)
\ No newline at end of file
+admin.site.register(DeliveryRequest, list_select_related=['customer'])  # __str__ shows the customer
+admin.site.register(DeliveryBundle)
+admin.site.register(DeliveryTrack)
+admin.site.register(OrderTrack)
+admin.site.register(BulkImportJob)
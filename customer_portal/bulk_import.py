@@ -0,0 +1,198 @@
+"""
+Bulk import of orders from CSV or NDJSON uploads.
+
+The upload is read a line at a time and handled in chunks of
+IMPORT_CHUNK_SIZE rows. Each chunk is validated, its distances resolved
+with calculate_distance_pairs (cached, one matrix row per pickup, looked up
+concurrently) and its valid rows inserted with a single bulk_create using
+IDs from the order ID generator. Memory use is bounded by the chunk, not
+by the file. Every data row gets a result in the job, the created order id
+or the reasons it was rejected. A file that turns out unreadable after
+some chunks were inserted leaves a partial job that keeps their results,
+so the client knows not to upload those rows again.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from common_portal.utils import calculate_distance_pairs
+from .models import DeliveryRequest, order_ids, route_fields
+
+TEXT_FIELDS = ['order_id', 'company_name', 'pickup_location', 'delivery_location']
+COORDINATE_FIELDS = {
+    'pickup_location_lat': 90, 'pickup_location_long': 180,
+    'delivery_location_lat': 90, 'delivery_location_long': 180,
+}
+DECIMAL_FIELDS = ['product_weight', 'product_amount']
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+class ImportFileError(Exception):
+    """The upload as a whole can't be read, no row is imported"""
+
+
+def detect_format(file_name, requested=None):
+    if requested:
+        if requested not in FORMATS.values():
+            raise ImportFileError("format must be csv or ndjson")
+        return requested
+    for extension, file_format in FORMATS.items():
+        if file_name.lower().endswith(extension):
+            return file_format
+    raise ImportFileError("Unknown file type, pass format=csv or format=ndjson")
+
+
+def _lines(upload):
+    for number, line in enumerate(upload):
+        try:
+            yield line.decode('utf-8-sig' if number == 0 else 'utf-8')
+        except UnicodeDecodeError:
+            raise ImportFileError("The file must be UTF-8 encoded")
+
+
+def iter_rows(upload, file_format):
+    """(row number, data dict or None, error or None) for every data row"""
+    if file_format == 'csv':
+        reader = csv.DictReader(_lines(upload))
+        if not reader.fieldnames:
+            raise ImportFileError("The file is empty")
+        missing = [field for field in COORDINATE_FIELDS if field not in reader.fieldnames]
+        if missing:
+            raise ImportFileError(f"Missing columns: {', '.join(missing)}")
+        for number, row in enumerate(reader, 1):
+            yield number, row, None
+    else:
+        number = 0
+        for line in _lines(upload):
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                data = json.loads(line)
+            except ValueError:
+                yield number, None, "Invalid JSON"
+                continue
+            if not isinstance(data, dict):
+                yield number, None, "Expected a JSON object"
+                continue
+            yield number, data, None
+
+
+def validate(data):
+    """(model field values, errors) of one row"""
+    fields, errors = {}, {}
+    for field, limit in COORDINATE_FIELDS.items():
+        value = data.get(field)
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            errors[field] = "A number is required."
+            continue
+        if not -limit <= value <= limit:
+            errors[field] = f"Must be between -{limit} and {limit}."
+        fields[field] = value
+    for field in DECIMAL_FIELDS:
+        value = data.get(field)
+        if value is None or str(value).strip() == '':
+            fields[field] = None
+            continue
+        try:
+            value = Decimal(str(value)).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            errors[field] = "A number is required."
+            continue
+        if abs(value) >= 10 ** 8:
+            errors[field] = "Too large."
+        fields[field] = value
+    for field in TEXT_FIELDS:
+        value = str(data.get(field) or '')
+        if len(value) > 255:
+            errors[field] = "At most 255 characters."
+        fields[field] = value
+    fields['description'] = str(data.get('description') or '')
+    return fields, errors
+
+
+def import_chunk(customer, rows):
+    """Validate, route and insert one chunk of rows. Returns their results."""
+    results, valid = [], []
+    for number, data, error in rows:
+        if error is not None:
+            results.append({"row": number, "status": "error", "errors": {"row": error}})
+            continue
+        fields, errors = validate(data)
+        if errors:
+            results.append({"row": number, "status": "error", "errors": errors})
+        else:
+            valid.append((number, fields))
+
+    estimates = calculate_distance_pairs([
+        ((fields['pickup_location_lat'], fields['pickup_location_long']),
+         (fields['delivery_location_lat'], fields['delivery_location_long']))
+        for _, fields in valid
+    ], with_route=True) if valid else []
+
+    routable = []
+    for (number, fields), estimate in zip(valid, estimates):
+        if estimate[0] is None:
+            results.append({"row": number, "status": "error", "errors": {"row": "Unable to calculate distance for the given coordinates."}})
+        else:
+            routable.append((number, fields, estimate))
+
+    now = timezone.now()
+    orders = []
+    for (number, fields, (distance_km, minutes, route)), order_id in zip(routable, order_ids.next_ids(len(routable))):
+        orders.append(DeliveryRequest(
+            id=order_id,
+            customer=customer,
+            distance_km=distance_km,
+            estimated_time_minutes=minutes,
+            estimates_updated_at=now,
+            **route_fields(route),
+            delivery_fee=round(distance_km * customer.default_delivery_fee, 2),  # as in CreateDeliveryRequestView
+            **fields
+        ))
+        results.append({"row": number, "status": "created", "id": order_id, "order_id": fields['order_id']})
+
+    with transaction.atomic():
+        DeliveryRequest.objects.bulk_create(orders)
+    return sorted(results, key=lambda result: result['row'])
+
+
+def run_import(job, upload):
+    """Import the upload into ``job`` and save it. Returns the job."""
+    chunk, results = [], []
+    truncated = False
+    try:
+        for row in iter_rows(upload, job.format):
+            if row[0] > settings.IMPORT_MAX_ROWS:
+                truncated = True
+                break
+            chunk.append(row)
+            if len(chunk) >= settings.IMPORT_CHUNK_SIZE:
+                results.extend(import_chunk(job.customer, chunk))
+                chunk = []
+        if chunk:
+            results.extend(import_chunk(job.customer, chunk))
+    except ImportFileError as e:
+        if results:
+            job.status = 'partial'
+            job.message = f"{e}, only the rows before row {len(results) + 1} were imported"[:255]
+        else:
+            job.status = 'failed'
+            job.message = str(e)
+    else:
+        job.status = 'completed'
+        if truncated:
+            job.message = f"Only the first {settings.IMPORT_MAX_ROWS} rows were imported"
+    job.results = results
+    job.total_rows = len(results)
+    job.created_count = sum(1 for result in results if result['status'] == 'created')
+    job.error_count = job.total_rows - job.created_count
+    job.finished_at = timezone.now()
+    job.save()
+    return job
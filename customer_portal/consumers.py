@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from driver_portal.location_buffer import latest_position
+from driver_portal.locations import driver_index
+from .models import DeliveryRequest
+from .tracking import subscribe, tracking_group, unsubscribe
+
+TRACKABLE_STATUSES = ['assigned', 'picked_up', 'on_the_way']
+
+
+class OrderTrackingConsumer(AsyncWebsocketConsumer):
+    """
+    Live position of the driver of an order, for its customer.
+    Positions are coalesced: only the newest one waits to be sent, at most
+    ORDER_TRACKING_MAX_HZ per socket and never while the previous send is
+    still pending, so a slow client gets fewer updates instead of a queue.
+    """
+    async def connect(self):
+        user = self.scope["user"]
+        self.order_id = self.scope['url_route']['kwargs']['order_id']
+        order = await self.get_order(self.order_id)
+        if user.is_anonymous or order is None or user.id not in (order['customer_id'], order['assign_driver_id']):
+            await self.close()
+            return
+        if order['assign_driver_id'] is None or order['status'] not in TRACKABLE_STATUSES:
+            await self.close()
+            return
+
+        self.driver_id = order['assign_driver_id']
+        self.group_name = tracking_group(self.order_id)
+        self.latest = None
+        self.wakeup = asyncio.Event()
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await database_sync_to_async(subscribe)(self.driver_id, self.order_id)
+        self.sender = asyncio.ensure_future(self.send_positions())
+
+        position = await self.get_position(self.driver_id)
+        if position is not None:
+            await self.send_position({"order_id": self.order_id, "lat": position[0], "lng": position[1], "timestamp": position[2]})
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "sender"):
+            self.sender.cancel()
+            await database_sync_to_async(unsubscribe)(self.driver_id, self.order_id)
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def send_position(self, event):
+        # Replaces a position that was not sent yet, latest wins.
+        self.latest = event
+        self.wakeup.set()
+
+    async def send_positions(self):
+        interval = 1 / settings.ORDER_TRACKING_MAX_HZ
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            event, self.latest = self.latest, None
+            if event is None:
+                continue
+            await self.send(text_data=json.dumps({
+                "order_id": event["order_id"],
+                "lat": event["lat"],
+                "lng": event["lng"],
+                "timestamp": event["timestamp"],
+            }))
+            await asyncio.sleep(interval)
+
+    @database_sync_to_async
+    def get_order(self, order_id):
+        return DeliveryRequest.objects.filter(id=order_id).values('customer_id', 'assign_driver_id', 'status').first()
+
+    @database_sync_to_async
+    def get_position(self, driver_id):
+        position = latest_position(driver_id)
+        if position is None:
+            point = driver_index.position(driver_id)
+            position = (point[0], point[1], None) if point else None
+        return position
@@ -0,0 +1,86 @@
+import base64
+import json
+
+from common_portal.spatial import SpatialIndex
+from .models import DeliveryRequest
+from .serializers import with_details
+
+
+def _pending_order_positions():
+    return DeliveryRequest.objects.filter(
+        status='confirmed', assign_driver__isnull=True, bundle__isnull=True,
+        pickup_location_lat__isnull=False, pickup_location_long__isnull=False,
+    ).values_list('id', 'pickup_location_lat', 'pickup_location_long')
+
+
+# Pickup point of every confirmed order still waiting for a driver
+pending_order_index = SpatialIndex('orders:pending', loader=_pending_order_positions)
+
+
+def sync_pending_order(order):
+    """Add or drop an order from the feed index after its status/driver/bundle changed"""
+    if order.status == 'confirmed' and order.assign_driver_id is None and order.bundle_id is None and order.pickup_location_lat is not None and order.pickup_location_long is not None:
+        pending_order_index.update(order.id, order.pickup_location_lat, order.pickup_location_long)
+    else:
+        pending_order_index.remove(order.id)
+
+
+def rebuild_pending_order_index():
+    return pending_order_index.rebuild(_pending_order_positions())
+
+
+def encode_cursor(distance_km, order_id, rank):
+    raw = json.dumps([round(distance_km, 6), order_id, rank]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """((distance_km, order_id), rank) from a cursor, raises ValueError when it is malformed"""
+    try:
+        distance_km, order_id, rank = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (float(distance_km), str(order_id)), max(int(rank), 0)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def pending_orders_near(lat, lng, radius_km, limit, cursor=None):
+    """
+    One page of confirmed, unassigned, unbundled orders whose pickup lies within
+    radius_km of (lat, lng), closest first.
+    Returns ([(order, distance_km)], next_cursor). Orders that left the
+    confirmed state without the index noticing are dropped from it here.
+
+    The cursor holds the (distance, id) of the last order looked at and its
+    rank, so a page asks the index for only rank + limit hits, more only when
+    stale entries left the page short. A page costs the same however many
+    orders the radius holds.
+    """
+    after, rank = decode_cursor(cursor) if cursor is not None else (None, 0)
+    page = []
+    fetch = rank + limit
+    while True:
+        hits = pending_order_index.within(lat, lng, radius_km, fetch)
+        more = len(hits) >= fetch  # the index may hold further hits
+        rest = [(member, distance) for member, distance in hits if after is None or (round(distance, 6), member) > after]
+        rank = len(hits) - len(rest)
+        while len(page) < limit and rest:
+            chunk, rest = rest[:limit - len(page)], rest[limit - len(page):]
+            orders = with_details(DeliveryRequest.objects.filter(
+                id__in=[member for member, _ in chunk], status='confirmed', assign_driver__isnull=True, bundle__isnull=True
+            ))
+            orders = {order.id: order for order in orders}
+            for member, distance in chunk:
+                if member in orders:
+                    page.append((orders[member], distance))
+                else:
+                    pending_order_index.remove(member)
+            after = (round(chunk[-1][1], 6), chunk[-1][0])
+            rank += len(chunk)
+        if len(page) >= limit or not more:
+            break
+        fetch *= 2
+
+    next_cursor = None
+    if page and (rest or more):
+        next_cursor = encode_cursor(after[0], after[1], rank)
+    return page, next_cursor
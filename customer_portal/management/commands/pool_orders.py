@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from customer_portal.pooling import run_pooling
+
+
+class Command(BaseCommand):
+    help = "Bundle confirmed orders with nearby pickups heading the same way."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run a single pass and exit.")
+        parser.add_argument('--interval', type=float, default=None, help="Seconds between passes.")
+        parser.add_argument('--force', action='store_true', help="Run even when POOLING_ENABLED is off.")
+
+    def handle(self, *args, **options):
+        if not settings.POOLING_ENABLED and not options['force']:
+            self.stdout.write(self.style.WARNING("POOLING_ENABLED is off, nothing to do (use --force to run anyway)."))
+            return
+        interval = options['interval'] or settings.POOLING_INTERVAL_SECONDS
+        while True:
+            started = time.monotonic()
+            stats = run_pooling()
+            if stats['orders'] or stats['dissolved']:
+                self.stdout.write(
+                    f"{stats['orders']} orders, {stats['bundles']} bundles with {stats['bundled_orders']} orders, "
+                    f"{stats['dissolved']} stale bundles dissolved"
+                )
+            if options['once']:
+                break
+            time.sleep(max(interval - (time.monotonic() - started), 0))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from customer_portal.feed import rebuild_pending_order_index
+
+
+class Command(BaseCommand):
+    help = "Reload the spatial index of confirmed orders waiting for a driver."
+
+    def handle(self, *args, **options):
+        count = rebuild_pending_order_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} pending orders."))
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from customer_portal.models import DeliveryRequest
+
+
+class Command(BaseCommand):
+    help = "Recalculate stored distance/ETA for open orders whose estimates are missing or stale."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=60, help="Minutes after which an estimate is stale.")
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=None, help="Stop after this many orders.")
+
+    def handle(self, *args, **options):
+        stale_before = timezone.now() - timedelta(minutes=options['max_age'])
+        orders = (
+            DeliveryRequest.objects
+            .filter(status__in=['pending', 'confirmed', 'assigned'])
+            .filter(Q(estimates_updated_at__isnull=True) | Q(estimates_updated_at__lt=stale_before) | Q(estimated_time_minutes__isnull=True))
+            .order_by('id')
+        )
+        if options['limit']:
+            orders = orders[:options['limit']]
+
+        refreshed = failed = 0
+        for order in orders.iterator(chunk_size=options['batch_size']):
+            if order.refresh_estimates():
+                refreshed += 1
+            else:
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {refreshed} orders, {failed} could not be estimated."))
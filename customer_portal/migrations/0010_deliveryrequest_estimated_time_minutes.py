@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_portal', '0009_remove_deliveryrequest_actual_delivery_time_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryrequest',
+            name='estimated_time_minutes',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliveryrequest',
+            name='estimates_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Step 1/3 of moving the order coordinates from text to numeric columns:
+# add nullable numeric columns next to the text ones.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_portal', '0010_deliveryrequest_estimated_time_minutes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryrequest',
+            name='pickup_location_lat_num',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliveryrequest',
+            name='pickup_location_long_num',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliveryrequest',
+            name='delivery_location_lat_num',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliveryrequest',
+            name='delivery_location_long_num',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
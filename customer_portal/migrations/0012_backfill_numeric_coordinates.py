@@ -0,0 +1,46 @@
+# Step 2/3: copy the text coordinates into the numeric columns.
+# Runs outside a single transaction in primary key ordered batches, every
+# batch commits on its own. Only rows whose numeric columns are still empty
+# are picked up, so an interrupted run simply continues where it stopped.
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 2000
+FIELDS = ['pickup_location_lat', 'pickup_location_long', 'delivery_location_lat', 'delivery_location_long']
+
+
+def to_float(value, limit):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if -limit <= number <= limit else None
+
+
+def backfill(apps, schema_editor):
+    DeliveryRequest = apps.get_model('customer_portal', 'DeliveryRequest')
+    pending = DeliveryRequest.objects.filter(pickup_location_lat_num__isnull=True, delivery_location_lat_num__isnull=True)
+    last_pk = ''
+    while True:
+        batch = list(pending.filter(pk__gt=last_pk).order_by('pk').only('pk', *FIELDS)[:BATCH_SIZE])
+        if not batch:
+            break
+        for order in batch:
+            for field in FIELDS:
+                limit = 90 if field.endswith('_lat') else 180
+                setattr(order, f'{field}_num', to_float(getattr(order, field), limit))
+        with transaction.atomic():
+            DeliveryRequest.objects.bulk_update(batch, [f'{field}_num' for field in FIELDS])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('customer_portal', '0011_deliveryrequest_numeric_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
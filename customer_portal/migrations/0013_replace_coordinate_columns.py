@@ -0,0 +1,54 @@
+# Step 3/3: drop the text columns, give the numeric ones their names and
+# index them for bounding-box range scans.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_portal', '0012_backfill_numeric_coordinates'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='deliveryrequest',
+            name='pickup_location_lat',
+        ),
+        migrations.RemoveField(
+            model_name='deliveryrequest',
+            name='pickup_location_long',
+        ),
+        migrations.RemoveField(
+            model_name='deliveryrequest',
+            name='delivery_location_lat',
+        ),
+        migrations.RemoveField(
+            model_name='deliveryrequest',
+            name='delivery_location_long',
+        ),
+        migrations.RenameField(
+            model_name='deliveryrequest',
+            old_name='pickup_location_lat_num',
+            new_name='pickup_location_lat',
+        ),
+        migrations.RenameField(
+            model_name='deliveryrequest',
+            old_name='pickup_location_long_num',
+            new_name='pickup_location_long',
+        ),
+        migrations.RenameField(
+            model_name='deliveryrequest',
+            old_name='delivery_location_lat_num',
+            new_name='delivery_location_lat',
+        ),
+        migrations.RenameField(
+            model_name='deliveryrequest',
+            old_name='delivery_location_long_num',
+            new_name='delivery_location_long',
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrequest',
+            index=models.Index(fields=['status', 'pickup_location_lat', 'pickup_location_long'], name='customer_po_status_307c3b_idx'),
+        ),
+    ]
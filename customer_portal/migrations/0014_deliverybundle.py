@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_portal', '0013_replace_coordinate_columns'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryBundle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pickup_location_lat', models.FloatField()),
+                ('pickup_location_long', models.FloatField()),
+                ('route_km', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('route_minutes', models.PositiveIntegerField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('accepted', 'Accepted'), ('dissolved', 'Dissolved')], default='open', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('assign_driver', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='assigned_bundles', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='deliveryrequest',
+            name='bundle',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='customer_portal.deliverybundle'),
+        ),
+        migrations.AddIndex(
+            model_name='deliverybundle',
+            index=models.Index(fields=['status', 'pickup_location_lat', 'pickup_location_long'], name='customer_po_status_f27d1e_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_portal', '0014_deliverybundle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryrequest',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliveryrequest',
+            name='picked_up_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
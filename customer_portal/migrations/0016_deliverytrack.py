@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_portal', '0015_deliveryrequest_picked_up_at_delivered_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryTrack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('data', models.BinaryField(default=b'')),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('last_lat', models.IntegerField(default=0)),
+                ('last_lng', models.IntegerField(default=0)),
+                ('last_time', models.IntegerField(default=0)),
+                ('simplified', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('delivery', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='track', to='customer_portal.deliveryrequest')),
+            ],
+        ),
+    ]
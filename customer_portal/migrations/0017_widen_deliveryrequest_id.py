@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:52
+# IDs now come from a permuted counter and grow past 6 digits. Existing
+# random 6 digit IDs could clash with permuted ones of the 6 digit tier, so
+# when there are orders already the counter starts at the 7 digit tier.
+
+from django.db import migrations, models
+
+SEQUENCE = 'delivery_request'
+SEVEN_DIGIT_TIER = 900000  # counter value of the first 7 digit ID, after 900000 six digit ones
+
+
+def start_sequence(apps, schema_editor):
+    DeliveryRequest = apps.get_model('customer_portal', 'DeliveryRequest')
+    Sequence = apps.get_model('common_portal', 'Sequence')
+    start = SEVEN_DIGIT_TIER if DeliveryRequest.objects.exists() else 0
+    Sequence.objects.update_or_create(name=SEQUENCE, defaults={'next_value': start})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common_portal', '0002_sequence'),
+        ('customer_portal', '0016_deliverytrack'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deliveryrequest',
+            name='id',
+            field=models.CharField(editable=False, max_length=12, primary_key=True, serialize=False),
+        ),
+        migrations.RunPython(start_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_portal', '0019_bulkimportjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # New indexes first, the FK indexes they cover are dropped after
+        migrations.AddIndex(
+            model_name='deliveryrequest',
+            index=models.Index(fields=['customer', 'status', 'created_at'], name='order_customer_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrequest',
+            index=models.Index(fields=['assign_driver', 'status', 'created_at'], name='order_driver_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrequest',
+            index=models.Index(fields=['status', 'created_at'], name='order_status_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrequest',
+            index=models.Index(fields=['customer', 'created_at'], name='order_customer_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrequest',
+            index=models.Index(fields=['assign_driver', 'created_at'], name='order_driver_time_idx'),
+        ),
+        migrations.AlterField(
+            model_name='deliveryrequest',
+            name='assign_driver',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='assigned_deliveries', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='deliveryrequest',
+            name='customer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='delivery_requests', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_portal', '0020_order_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryrequest',
+            name='estimates_approximate',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+    ]
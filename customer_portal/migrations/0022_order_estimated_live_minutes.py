@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_portal', '0021_order_estimates_approximate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryrequest',
+            name='estimated_live_minutes',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
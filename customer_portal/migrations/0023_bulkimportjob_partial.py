@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_portal', '0022_order_estimated_live_minutes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bulkimportjob',
+            name='status',
+            field=models.CharField(choices=[('processing', 'Processing'), ('completed', 'Completed'), ('partial', 'Partially completed'), ('failed', 'Failed')], default='processing', max_length=20),
+        ),
+    ]
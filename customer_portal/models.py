@@ -1,22 +1,48 @@
 from django.db import models
 from account.models import UserAuth
 from django.utils import timezone
-import random
+from common_portal.ids import IdGenerator
+from common_portal.utils import calculate_distance_and_time
+
+ORDER_ID_SEQUENCE = 'delivery_request'
+order_ids = IdGenerator(ORDER_ID_SEQUENCE)
+
 
 def generate_unique_id():
     """
-    Generates a unique 6-digit ID.
-    Retries until a unique ID is found in the DeliveryRequest table.
+    Next DeliveryRequest ID, 6 digits while they last and then 7 and more.
+    Unique by construction, see common_portal.ids.
     """
-    while True:
-        rand_id = f"{random.randint(100000, 999999)}"  # 6 digits
-        if not DeliveryRequest.objects.filter(id=rand_id).exists():
-            return rand_id
+    return order_ids.next_id()
+
+
+def route_fields(route):
+    """
+    Where an order's estimate came from. The ETA model learns from live
+    routes only, and calibrates against their duration before calibration.
+    """
+    return {
+        'estimates_approximate': route.approximate,
+        'estimated_live_minutes': None if route.approximate else round(route.duration_minutes),
+    }
+
+
+STATUS_CHOICES = [
+    ('pending', 'Pending'),
+    ('confirmed', 'Confirmed'),
+    ('assigned', 'Assigned'),
+    ('picked_up', 'Picked Up'),
+    ('on_the_way', 'On The Way'),
+    ('delivered', 'Delivered'),
+    ('cancelled', 'Cancelled')
+]
+
 
 class DeliveryRequest(models.Model):
-    id = models.CharField(max_length=6, primary_key=True, editable=False)
+    id = models.CharField(max_length=12, primary_key=True, editable=False)
     customer = models.ForeignKey(
-        UserAuth, on_delete=models.CASCADE, related_name="delivery_requests"
+        UserAuth, on_delete=models.CASCADE, related_name="delivery_requests",
+        db_index=False,  # covered by order_customer_time_idx
     )
     order_id = models.CharField(max_length=255, blank=True)
     company_name = models.CharField(max_length=255, blank=True)
@@ -24,59 +50,185 @@ class DeliveryRequest(models.Model):
     product_weight = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     product_amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     pickup_location = models.CharField(max_length=255, blank=True)
-    pickup_location_lat = models.CharField(max_length=255,blank=True) #example = 22.379916347385546
-    pickup_location_long = models.CharField(max_length=255,blank=True) #example = 91.8307064358106
+    pickup_location_lat = models.FloatField(blank=True, null=True) #example = 22.379916347385546
+    pickup_location_long = models.FloatField(blank=True, null=True) #example = 91.8307064358106
     delivery_location = models.CharField(max_length=255, blank=True)
-    delivery_location_lat = models.CharField(max_length=255,blank=True) #example = 22.379916347385546
-    delivery_location_long = models.CharField(max_length=255,blank=True) #example = 91.8307064358106
+    delivery_location_lat = models.FloatField(blank=True, null=True) #example = 22.379916347385546
+    delivery_location_long = models.FloatField(blank=True, null=True) #example = 91.8307064358106
     distance_km = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    estimated_time_minutes = models.PositiveIntegerField(blank=True, null=True)
+    estimates_updated_at = models.DateTimeField(blank=True, null=True)
+    estimates_approximate = models.BooleanField(blank=True, null=True)  # local estimate instead of a live route, None when unknown
+    estimated_live_minutes = models.PositiveIntegerField(blank=True, null=True)  # live route duration before calibration
+    picked_up_at = models.DateTimeField(blank=True, null=True)
+    delivered_at = models.DateTimeField(blank=True, null=True)
     assign_driver = models.ForeignKey(
-        UserAuth, on_delete=models.SET_NULL, null=True, blank=True, related_name="assigned_deliveries"
+        UserAuth, on_delete=models.SET_NULL, null=True, blank=True, related_name="assigned_deliveries",
+        db_index=False,  # covered by order_driver_time_idx
     )
     delivery_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
-
-    status = models.CharField(
-        max_length=50,
-        choices=[
-            ('pending', 'Pending'),
-            ('confirmed', 'Confirmed'),
-            ('assigned', 'Assigned'),
-            ('picked_up', 'Picked Up'),
-            ('on_the_way', 'On The Way'),
-            ('delivered', 'Delivered'),
-            ('cancelled', 'Cancelled')
-        ],
-        default='pending'
+    bundle = models.ForeignKey(
+        'DeliveryBundle', on_delete=models.SET_NULL, null=True, blank=True, related_name="orders"
     )
+
+    status = models.CharField(max_length=50, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # bounding-box lookups of orders around a point
+            models.Index(fields=["status", "pickup_location_lat", "pickup_location_long"]),
+            # newest-first order lists, see customer_portal.pagination. Lists
+            # of every status need their own index to skip the sort.
+            models.Index(fields=["customer", "status", "created_at"], name="order_customer_list_idx"),
+            models.Index(fields=["assign_driver", "status", "created_at"], name="order_driver_list_idx"),
+            models.Index(fields=["status", "created_at"], name="order_status_list_idx"),
+            models.Index(fields=["customer", "created_at"], name="order_customer_time_idx"),
+            models.Index(fields=["assign_driver", "created_at"], name="order_driver_time_idx"),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.id:
             self.id = generate_unique_id()
+            # A colliding ID must fail, not overwrite the order that has it
+            kwargs['force_insert'] = True
         super().save(*args, **kwargs)
 
+    def has_coordinates(self):
+        coordinates = [self.pickup_location_lat, self.pickup_location_long, self.delivery_location_lat, self.delivery_location_long]
+        return all(value is not None for value in coordinates)
+
+    def refresh_estimates(self, save=True):
+        """
+        Recalculate distance_km and estimated_time_minutes from the stored coordinates.
+        Returns False when no estimate could be made, the stored values are kept then.
+        """
+        if not self.has_coordinates():
+            return False
+        distance_km, estimate_time, route = calculate_distance_and_time(
+            self.pickup_location_lat,
+            self.pickup_location_long,
+            self.delivery_location_lat,
+            self.delivery_location_long,
+            with_route=True
+        )
+        if distance_km is None:
+            return False
+        self.distance_km = distance_km
+        self.estimated_time_minutes = estimate_time
+        self.estimates_updated_at = timezone.now()
+        for field, value in route_fields(route).items():
+            setattr(self, field, value)
+        if save:
+            self.save(update_fields=['distance_km', 'estimated_time_minutes', 'estimates_updated_at', *route_fields(route)])
+        return True
+
     def __str__(self):
         return f"DeliveryRequest {self.order_id or 'N/A'} ({self.id}) by {self.customer.name}"
 
 
-# class OrderTrack(models.Model):
-#     delivery_request = models.ForeignKey(DeliveryRequest, on_delete=models.CASCADE, related_name="tracks")
-#     status = models.CharField(
-#         max_length=20,
-#         choices=[
-#             ('pending', 'Pending'),
-#             ('assigned', 'Assigned'),
-#             ('in_transit', 'In Transit'),
-#             ('delivered', 'Delivered'),
-#             ('cancelled', 'Cancelled')
-#         ],
-#         default='pending'
-#     )
-#     updated_by = models.ForeignKey(UserAuth, on_delete=models.SET_NULL, null=True, blank=True)
-#     location = models.CharField(max_length=255, blank=True)  # optional: track current location
-#     remark = models.TextField(blank=True)
-#     created_at = models.DateTimeField(default=timezone.now)
-
-#     def __str__(self):
-#         return f"{self.delivery_request.order_id} - {self.status}"
\ No newline at end of file
+class DeliveryBundle(models.Model):
+    """
+    Confirmed orders with nearby pickups heading the same way, offered to
+    drivers as one job. Built by the pool_orders command.
+    """
+    assign_driver = models.ForeignKey(
+        UserAuth, on_delete=models.SET_NULL, null=True, blank=True, related_name="assigned_bundles"
+    )
+    pickup_location_lat = models.FloatField()  # centre of the pickups
+    pickup_location_long = models.FloatField()
+    route_km = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    route_minutes = models.PositiveIntegerField(blank=True, null=True)
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('open', 'Open'),
+            ('accepted', 'Accepted'),
+            ('dissolved', 'Dissolved')
+        ],
+        default='open'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "pickup_location_lat", "pickup_location_long"]),
+        ]
+
+    def __str__(self):
+        return f"DeliveryBundle {self.id} ({self.status})"
+
+
+class DeliveryTrack(models.Model):
+    """
+    GPS trace of a delivery as one binary blob, see customer_portal.tracks
+    for the encoding. Points are appended while the delivery is active and
+    simplified once it is delivered.
+    """
+    delivery = models.OneToOneField(DeliveryRequest, on_delete=models.CASCADE, related_name="track")
+    started_at = models.DateTimeField()  # time origin of the encoded points
+    data = models.BinaryField(default=b'')
+    point_count = models.PositiveIntegerField(default=0)
+    # Last point in encoded units, so points can be appended without decoding the blob
+    last_lat = models.IntegerField(default=0)
+    last_lng = models.IntegerField(default=0)
+    last_time = models.IntegerField(default=0)
+    simplified = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"DeliveryTrack {self.delivery_id} ({self.point_count} points)"
+
+
+class BulkImportJob(models.Model):
+    """
+    One upload of orders by a company, see customer_portal.bulk_import.
+    ``results`` holds one entry per data row: the created order id or the errors.
+    """
+    customer = models.ForeignKey(UserAuth, on_delete=models.CASCADE, related_name="import_jobs")
+    file_name = models.CharField(max_length=255, blank=True)
+    format = models.CharField(max_length=10, choices=[('csv', 'CSV'), ('ndjson', 'NDJSON')])
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('processing', 'Processing'),
+            ('completed', 'Completed'),
+            ('partial', 'Partially completed'),
+            ('failed', 'Failed')
+        ],
+        default='processing'
+    )
+    total_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    message = models.CharField(max_length=255, blank=True)  # why a failed or partial job stopped
+    results = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"BulkImportJob {self.id} ({self.created_count}/{self.total_rows})"
+
+
+class OrderTrack(models.Model):
+    """
+    Append-only log of the status changes of an order, one row per
+    transition (see customer_portal.transitions). Rows are never updated.
+    """
+    delivery_request = models.ForeignKey(DeliveryRequest, on_delete=models.CASCADE, related_name="tracks", db_index=False)
+    from_status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    updated_by = models.ForeignKey(UserAuth, on_delete=models.SET_NULL, null=True, blank=True)
+    remark = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # The timeline of an order is one range read of this index
+            models.Index(fields=['delivery_request', 'created_at'], name='ordertrack_order_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.delivery_request_id}: {self.from_status} -> {self.status}"
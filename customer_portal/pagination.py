@@ -0,0 +1,48 @@
+"""
+Keyset pagination of order lists, newest first.
+
+A page is the next ``limit`` rows after the (created_at, id) of the last
+row of the previous page, carried in an opaque cursor. With an index
+ending in created_at the database seeks straight to the cursor instead
+of counting past every earlier row, so a page costs the same however
+many orders the account has.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(created_at, order_id):
+    raw = json.dumps([created_at.isoformat(), order_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """(created_at, order_id) from a cursor, raises ValueError when it is malformed"""
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = parse_datetime(created_at)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if created_at is None:
+        raise ValueError("Invalid cursor")
+    return created_at, str(order_id)
+
+
+def keyset_page(orders, limit, cursor=None):
+    """
+    One page of the orders queryset, newest first.
+    Returns (orders, next_cursor), next_cursor is None on the last page.
+    """
+    orders = orders.order_by('-created_at', '-id')
+    if cursor is not None:
+        created_at, order_id = decode_cursor(cursor)
+        orders = orders.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=order_id))
+    page = list(orders[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1].created_at, page[-1].id)
+    return page, next_cursor
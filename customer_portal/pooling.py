@@ -0,0 +1,201 @@
+"""
+Order pooling: confirmed orders with nearby pickups, drops in the same
+direction and close creation times are grouped into a DeliveryBundle that a
+driver accepts as one job.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from common_portal.geo import angle_difference, bearing, haversine
+from common_portal.utils import bounding_box_filter
+from driver_portal.sequencing import plan_route
+from .acceptance import claim_orders
+from .feed import pending_order_index, sync_pending_order
+from .models import DeliveryBundle, DeliveryRequest
+from .serializers import with_details
+
+
+def load_candidates(limit=None):
+    """
+    Fresh confirmed orders that are not bundled yet. Older orders, including
+    those of dissolved bundles, are left to single acceptance.
+    """
+    cutoff = timezone.now() - timedelta(minutes=settings.POOLING_MAX_ORDER_AGE_MINUTES)
+    orders = DeliveryRequest.objects.filter(
+        status='confirmed', assign_driver__isnull=True, bundle__isnull=True, created_at__gte=cutoff,
+        pickup_location_lat__isnull=False, pickup_location_long__isnull=False,
+        delivery_location_lat__isnull=False, delivery_location_long__isnull=False,
+    ).order_by('created_at')
+    if limit:
+        orders = orders[:limit]
+    return list(orders)
+
+
+def find_clusters(pickups, drops, created, pickup_radius_km=None, max_bearing_diff=None, window_seconds=None, max_size=None):
+    """
+    Group orders into clusters of at least two.
+    ``pickups`` and ``drops`` are (n, 2) arrays of (lat, lng), ``created`` the
+    creation times in seconds, oldest first. Every member of a cluster is
+    compatible with every other one: pickups within pickup_radius_km, drop
+    bearings within max_bearing_diff degrees and created within window_seconds.
+    Returns lists of row indices.
+    """
+    pickup_radius_km = pickup_radius_km or settings.POOLING_PICKUP_RADIUS_KM
+    max_bearing_diff = max_bearing_diff or settings.POOLING_MAX_BEARING_DIFF
+    window_seconds = window_seconds or settings.POOLING_TIME_WINDOW_MINUTES * 60
+    max_size = max_size or settings.POOLING_MAX_BUNDLE_SIZE
+
+    pickups = np.asarray(pickups, dtype=np.float64).reshape(-1, 2)
+    drops = np.asarray(drops, dtype=np.float64).reshape(-1, 2)
+    created = np.asarray(created, dtype=np.float64)
+    directions = bearing(pickups[:, 0], pickups[:, 1], drops[:, 0], drops[:, 1])
+    # Drops next to the pickup have no meaningful direction, they fit any bundle.
+    short = haversine(pickups[:, 0], pickups[:, 1], drops[:, 0], drops[:, 1]) <= pickup_radius_km
+
+    def compatible(row, rows):
+        near = haversine(pickups[row, 0], pickups[row, 1], pickups[rows, 0], pickups[rows, 1]) <= pickup_radius_km
+        same_way = short[row] | short[rows] | (angle_difference(directions[row], directions[rows]) <= max_bearing_diff)
+        in_window = np.abs(created[rows] - created[row]) <= window_seconds
+        return near & same_way & in_window
+
+    free = np.ones(len(pickups), dtype=bool)
+    clusters = []
+    for seed in range(len(pickups)):
+        if not free[seed]:
+            continue
+        free[seed] = False
+        rows = np.nonzero(free)[0]
+        if not len(rows):
+            break
+        rows = rows[compatible(seed, rows)]
+        if not len(rows):
+            continue
+        distances = haversine(pickups[seed, 0], pickups[seed, 1], pickups[rows, 0], pickups[rows, 1])
+        members = [seed]
+        for row in rows[np.argsort(distances, kind='stable')].tolist():
+            if len(members) >= max_size:
+                break
+            if compatible(row, np.array(members)).all():
+                members.append(row)
+        if len(members) > 1:
+            free[members] = False
+            clusters.append(members)
+    return clusters
+
+
+def _plan(orders):
+    """Pickup centre and route of a bundle of ``orders``"""
+    pickup_lat = sum(order.pickup_location_lat for order in orders) / len(orders)
+    pickup_lng = sum(order.pickup_location_long for order in orders) / len(orders)
+    return pickup_lat, pickup_lng, plan_route((pickup_lat, pickup_lng), orders)
+
+
+def create_bundle(orders):
+    """
+    Bundle the given orders. Orders taken or bundled in the meantime are left
+    out and the route is planned again for the rest, the bundle is dropped
+    when fewer than two remain. Returns the bundle or None.
+    """
+    # Done before the transaction, the route may need the routing API.
+    pickup_lat, pickup_lng, route = _plan(orders)
+    with transaction.atomic():
+        bundle = DeliveryBundle.objects.create(
+            pickup_location_lat=pickup_lat,
+            pickup_location_long=pickup_lng,
+            route_km=route["total_km"],
+            route_minutes=round(route["total_minutes"]),
+        )
+        DeliveryRequest.objects.filter(
+            id__in=[order.id for order in orders],
+            status='confirmed', assign_driver__isnull=True, bundle__isnull=True,
+        ).update(bundle=bundle)
+        claimed = set(DeliveryRequest.objects.filter(bundle=bundle).values_list('id', flat=True))
+        if len(claimed) < 2:
+            transaction.set_rollback(True)
+            return None
+    members = [order for order in orders if order.id in claimed]
+    if len(members) < len(orders):
+        bundle.pickup_location_lat, bundle.pickup_location_long, route = _plan(members)
+        bundle.route_km = route["total_km"]
+        bundle.route_minutes = round(route["total_minutes"])
+        bundle.save(update_fields=['pickup_location_lat', 'pickup_location_long', 'route_km', 'route_minutes', 'updated_at'])
+    for order in members:
+        pending_order_index.remove(order.id)
+    return bundle
+
+
+def dissolve_stale_bundles(max_age_minutes=None):
+    """Open bundles nobody accepted in time go back to single orders"""
+    max_age_minutes = max_age_minutes or settings.POOLING_BUNDLE_TTL_MINUTES
+    cutoff = timezone.now() - timedelta(minutes=max_age_minutes)
+    stale = list(DeliveryBundle.objects.filter(status='open', created_at__lt=cutoff).values_list('id', flat=True))
+    if not stale:
+        return 0
+    dissolved = DeliveryBundle.objects.filter(id__in=stale, status='open').update(status='dissolved', updated_at=timezone.now())
+    released = list(DeliveryRequest.objects.filter(bundle_id__in=stale, status='confirmed', assign_driver__isnull=True))
+    DeliveryRequest.objects.filter(id__in=[order.id for order in released]).update(bundle=None)
+    for order in released:
+        order.bundle = None
+        sync_pending_order(order)
+    return dissolved
+
+
+def run_pooling(limit=None):
+    """One pooling pass, returns a dict of counters for logging"""
+    stats = {"dissolved": dissolve_stale_bundles(), "orders": 0, "bundles": 0, "bundled_orders": 0}
+    orders = load_candidates(limit or settings.POOLING_BATCH_LIMIT)
+    stats["orders"] = len(orders)
+    if len(orders) < 2:
+        return stats
+    clusters = find_clusters(
+        [(order.pickup_location_lat, order.pickup_location_long) for order in orders],
+        [(order.delivery_location_lat, order.delivery_location_long) for order in orders],
+        [order.created_at.timestamp() for order in orders],
+    )
+    for members in clusters:
+        bundle = create_bundle([orders[row] for row in members])
+        if bundle is not None:
+            stats["bundles"] += 1
+            stats["bundled_orders"] += bundle.orders.count()
+    return stats
+
+
+def accept_bundle(bundle_id, driver):
+    """
+    Assign every still-open order of the bundle to the driver in one transaction.
+    Returns the assigned orders, or None when the bundle is no longer open.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        taken = DeliveryBundle.objects.filter(id=bundle_id, status='open').update(
+            status='accepted', assign_driver=driver, updated_at=now
+        )
+        if not taken:
+            return None
+        # Orders accepted on their own meanwhile left the bundle, the rest is claimed here.
+        order_ids = claim_orders(driver.id, remark='bundle', bundle_id=bundle_id)
+        if not order_ids:
+            DeliveryBundle.objects.filter(id=bundle_id).update(status='dissolved', assign_driver=None)
+            return None
+    return list(with_details(DeliveryRequest.objects.filter(id__in=order_ids)))
+
+
+def bundles_near(lat, lng, radius_km, limit):
+    """Open bundles whose pickup centre is within radius_km, as [(bundle, distance_km)], closest first"""
+    bundles = list(DeliveryBundle.objects.filter(
+        bounding_box_filter(lat, lng, radius_km, 'pickup_location_lat', 'pickup_location_long'), status='open'
+    ).prefetch_related(Prefetch('orders', queryset=with_details(DeliveryRequest.objects.all()))))
+    if not bundles:
+        return []
+    distances = haversine(
+        lat, lng,
+        [bundle.pickup_location_lat for bundle in bundles],
+        [bundle.pickup_location_long for bundle in bundles],
+    ).tolist()
+    hits = sorted((distance, bundle.id, bundle) for distance, bundle in zip(distances, bundles) if distance <= radius_km)
+    return [(bundle, distance) for distance, _, bundle in hits[:limit]]
@@ -1,7 +1,9 @@
 from rest_framework import serializers
-from .models import DeliveryRequest
+from .models import DeliveryRequest, DeliveryBundle, BulkImportJob
 from account.models import UserAuth
-from common_portal.utils import calculate_distance_and_time
+
+
+CUSTOMER_DETAILS_FIELDS = ["id", "name", "email", "phone_number", "image", "role", "location_latitude", "location_longitude"]
 
 
 class DriverDetailsSerializer(serializers.ModelSerializer):
@@ -13,67 +15,69 @@ class DriverDetailsSerializer(serializers.ModelSerializer):
 class DeliveryRequestSerializer(serializers.ModelSerializer):
     assign_driver_details = DriverDetailsSerializer(source='assign_driver', read_only=True)
     customer_details = serializers.SerializerMethodField()
-    distance_km = serializers.SerializerMethodField()
-    estimated_time_minutes = serializers.SerializerMethodField()
 
     class Meta:
         model = DeliveryRequest
         fields = '__all__'
-        read_only_fields = ['delivery_fee', 'customer', 'status', 'created_at', 'updated_at']
+        read_only_fields = ['delivery_fee', 'customer', 'status', 'distance_km', 'estimated_time_minutes', 'estimates_updated_at', 'estimates_approximate', 'estimated_live_minutes', 'picked_up_at', 'delivered_at', 'created_at', 'updated_at']
 
     def get_customer_details(self, obj):
-        if obj.customer:
+        customer = obj.customer
+        if customer:
             return {
-                "id": obj.customer.id,
-                "name": obj.customer.name,
-                "email": obj.customer.email,
-                "phone_number": obj.customer.phone_number,
-                "image": obj.customer.image.url if obj.customer.image else None,
-                "role": obj.customer.role,
-                "location_latitude": obj.customer.location_latitude,
-                "location_longitude": obj.customer.location_longitude
+                "id": customer.id,
+                "name": customer.name,
+                "email": customer.email,
+                "phone_number": customer.phone_number,
+                "image": customer.image.url if customer.image else None,
+                "role": customer.role,
+                "location_latitude": customer.location_latitude,
+                "location_longitude": customer.location_longitude
             }
         return None
 
-    def get_distance_km(self, obj):
-        if obj.pickup_location_lat and obj.pickup_location_long and obj.delivery_location_lat and obj.delivery_location_long:
-            distance, _ = calculate_distance_and_time(
-                obj.pickup_location_lat,
-                obj.pickup_location_long,
-                obj.delivery_location_lat,
-                obj.delivery_location_long
-            )
-            return distance
-        return None
-
-    def get_estimated_time_minutes(self, obj):
-        if obj.pickup_location_lat and obj.pickup_location_long and obj.delivery_location_lat and obj.delivery_location_long:
-            _, eta = calculate_distance_and_time(
-                obj.pickup_location_lat,
-                obj.pickup_location_long,
-                obj.delivery_location_lat,
-                obj.delivery_location_long
-            )
-            return eta
-        return None
-
     def to_representation(self, instance):
         rep = super().to_representation(instance)
 
-        # Driver details
-        rep["assign_driver_details"] = (
-            DriverDetailsSerializer(instance.assign_driver).data
-            if instance.assign_driver else None
-        )
-
-        # Distance & ETA
-        rep["distance_km"] = self.get_distance_km(instance)
-        rep["estimated_time_minutes"] = self.get_estimated_time_minutes(instance)
+        # Distance & ETA are stored on the order, see DeliveryRequest.refresh_estimates()
+        rep["distance_km"] = float(instance.distance_km) if instance.distance_km is not None else None
 
         return rep
 
 
+def with_details(orders):
+    """
+    Orders queryset joined with the customer and driver columns
+    DeliveryRequestSerializer reads, so a page of any size is one query
+    """
+    return orders.select_related('customer', 'assign_driver').only(
+        *[field.name for field in DeliveryRequest._meta.concrete_fields],
+        *[f"customer__{field}" for field in CUSTOMER_DETAILS_FIELDS],
+        *[f"assign_driver__{field}" for field in DriverDetailsSerializer.Meta.fields],
+    )
+
+
 class DeliveryRequestUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = DeliveryRequest
-        fields = ['assign_driver', 'status']
\ No newline at end of file
+        fields = ['assign_driver', 'status']
+
+
+class DeliveryBundleSerializer(serializers.ModelSerializer):
+    orders = DeliveryRequestSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = DeliveryBundle
+        fields = '__all__'
+
+    def to_representation(self, instance):
+        rep = super().to_representation(instance)
+        rep["route_km"] = float(instance.route_km) if instance.route_km is not None else None
+        return rep
+
+
+class BulkImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BulkImportJob
+        fields = '__all__'
+        read_only_fields = ['customer']
@@ -1,3 +1,410 @@
-from django.test import TestCase
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from account.models import UserAuth
+from common_portal.outbox import drain
+from driver_portal.models import DriverEarningHistory
+from driver_portal.sequencing import plan_route
+from notifications.models import NotificationRecipient
+from .acceptance import claim_order
+from .feed import pending_order_index, rebuild_pending_order_index
+from .models import BulkImportJob, DeliveryRequest
+from .pooling import create_bundle, find_clusters
+from .tracks import SCALE, decode, douglas_peucker, encode
 
 # Create your tests here.
+
+
+def make_order(customer, **fields):
+    fields = {
+        'status': 'confirmed',
+        'pickup_location_lat': 22.35, 'pickup_location_long': 91.82,
+        'delivery_location_lat': 22.37, 'delivery_location_long': 91.83,
+        **fields
+    }
+    return DeliveryRequest.objects.create(customer=customer, **fields)
+
+
+class OrderIdTests(TestCase):
+    def test_colliding_id_does_not_overwrite_an_order(self):
+        customer = UserAuth.objects.create_user(email='customer@example.com', password='x', role='customer')
+        existing = make_order(customer, order_id='first')
+        with mock.patch('customer_portal.models.generate_unique_id', return_value=existing.id):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                make_order(customer, order_id='second')
+        existing.refresh_from_db()
+        self.assertEqual(existing.order_id, 'first')
+
+
+class AcceptDeliveryRequestTests(TestCase):
+    def setUp(self):
+        self.customer = UserAuth.objects.create_user(email='customer@example.com', password='x', role='customer')
+        self.drivers = [
+            UserAuth.objects.create_user(email=f'driver{i}@example.com', password='x', role='driver')
+            for i in range(2)
+        ]
+        self.order = make_order(self.customer)
+
+    def accept(self, driver, order_id):
+        client = APIClient()
+        client.force_authenticate(driver)
+        return client.post(reverse('accept-delivery', args=[order_id]))
+
+    def test_second_driver_gets_conflict(self):
+        self.assertEqual(self.accept(self.drivers[0], self.order.id).status_code, 200)
+        self.assertEqual(self.accept(self.drivers[1], self.order.id).status_code, 409)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.assign_driver, self.drivers[0])
+        self.assertEqual(self.order.status, 'assigned')
+
+    def test_unconfirmed_order_cannot_be_accepted(self):
+        order = make_order(self.customer, status='pending')
+        self.assertEqual(self.accept(self.drivers[0], order.id).status_code, 409)
+        self.assertFalse(claim_order(order.id, self.drivers[0].id))
+
+    def test_missing_order(self):
+        self.assertEqual(self.accept(self.drivers[0], 999999999).status_code, 404)
+
+
+class ConcurrentAcceptTests(TransactionTestCase):
+    """Hundreds of drivers accepting the same order at the same moment"""
+    DRIVERS = 200
+    WORKERS = 32
+
+    def setUp(self):
+        customer = UserAuth.objects.create_user(email='customer@example.com', password='x', role='customer')
+        self.drivers = UserAuth.objects.bulk_create([
+            UserAuth(email=f'driver{i}@example.com', role='driver') for i in range(self.DRIVERS)
+        ])
+        self.order = make_order(customer)
+
+    def test_exactly_one_winner(self):
+        barrier = threading.Barrier(self.WORKERS)
+
+        def accept(args):
+            index, driver = args
+            try:
+                client = APIClient()
+                client.force_authenticate(driver)
+                if index < self.WORKERS:
+                    barrier.wait()  # the first wave starts together
+                response = client.post(reverse('accept-delivery', args=[self.order.id]))
+                return driver.id, response.status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            results = list(pool.map(accept, enumerate(self.drivers)))
+
+        winners = [driver_id for driver_id, code in results if code == 200]
+        codes = {code for _, code in results}
+        self.assertEqual(len(winners), 1)
+        self.assertEqual(codes, {200, 409})
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.assign_driver_id, winners[0])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class OrderTransitionTests(TestCase):
+    def setUp(self):
+        self.customer = UserAuth.objects.create_user(email='customer@example.com', password='x', role='customer', account_balance=1000)
+        self.driver = UserAuth.objects.create_user(email='driver@example.com', password='x', role='driver')
+        self.order = make_order(self.customer, status='pending', delivery_fee=100)
+
+    def post(self, user, name, data=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post(reverse(name, args=[self.order.id]), data or {})
+
+    def test_lifecycle_is_logged(self):
+        self.assertEqual(self.post(self.customer, 'confirm-delivery').status_code, 200)
+        self.assertEqual(self.post(self.driver, 'accept-delivery').status_code, 200)
+        for status in ['picked_up', 'on_the_way', 'delivered']:
+            self.assertEqual(self.post(self.driver, 'update-delivery', {'status': status}).status_code, 200)
+
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        response = client.get(reverse('order-timeline', args=[self.order.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(event['from_status'], event['status']) for event in response.json()['data']],
+            [('pending', 'confirmed'), ('confirmed', 'assigned'), ('assigned', 'picked_up'),
+             ('picked_up', 'on_the_way'), ('on_the_way', 'delivered')],
+        )
+        self.order.refresh_from_db()
+        self.assertIsNotNone(self.order.picked_up_at)
+        self.assertIsNotNone(self.order.delivered_at)
+
+        # Side effects wait in the outbox until it is drained
+        self.assertFalse(DriverEarningHistory.objects.exists())
+        self.assertEqual(drain(), (6, 0))  # 4 notifications, the earning and the track
+        self.assertEqual(NotificationRecipient.objects.filter(recipient=self.customer).count(), 4)
+        self.assertEqual(DriverEarningHistory.objects.get(delivery=self.order).amount, 100)
+
+    def test_transitions_outside_the_table_are_rejected(self):
+        self.assertEqual(self.post(self.customer, 'confirm-delivery').status_code, 200)
+        self.assertEqual(self.post(self.customer, 'confirm-delivery').status_code, 400)
+        self.assertEqual(self.post(self.customer, 'cancel-delivery').status_code, 400)
+        self.post(self.driver, 'accept-delivery')
+        self.assertEqual(self.post(self.driver, 'update-delivery', {'status': 'delivered'}).status_code, 400)
+        self.assertEqual(self.post(self.driver, 'update-delivery', {'status': 'pending'}).status_code, 400)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.account_balance, 920)  # charged once
+
+
+@override_settings(GOOGLE_MAPS_API_KEY=None, IMPORT_CHUNK_SIZE=2)
+class BulkImportTests(TestCase):
+    def setUp(self):
+        self.company = UserAuth.objects.create_user(email='company@example.com', password='x', role='company', default_delivery_fee=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.company)
+
+    def upload(self, name, content):
+        return self.client.post(reverse('bulk-import'), {'file': SimpleUploadedFile(name, content.encode())}, format='multipart')
+
+    def test_csv_rows_are_created_or_reported(self):
+        content = (
+            "order_id,pickup_location_lat,pickup_location_long,delivery_location_lat,delivery_location_long,product_amount\n"
+            "A1,22.35,91.82,22.37,91.83,120.50\n"
+            "A2,22.35,91.82,22.40,91.80,\n"
+            "A3,95,91.82,22.40,91.80,\n"
+            "A4,22.36,91.81,22.38,91.85,abc\n"
+            "A5,22.36,91.81,22.35,91.82,5\n"
+        )
+        response = self.upload('orders.csv', content)
+        self.assertEqual(response.status_code, 201)
+        job = response.data['data']
+        self.assertEqual((job['total_rows'], job['created_count'], job['error_count']), (5, 3, 2))
+        self.assertEqual([r['status'] for r in job['results']], ['created', 'created', 'error', 'error', 'created'])
+        self.assertIn('pickup_location_lat', job['results'][2]['errors'])
+        self.assertIn('product_amount', job['results'][3]['errors'])
+
+        order = DeliveryRequest.objects.get(id=job['results'][0]['id'])
+        self.assertEqual(order.order_id, 'A1')
+        self.assertEqual(order.customer, self.company)
+        self.assertEqual(order.status, 'pending')
+        self.assertGreater(order.distance_km, 0)
+        self.assertAlmostEqual(float(order.delivery_fee), float(order.distance_km) * 10, delta=0.1)
+        # No Google key here, the local estimate is used and recorded as such
+        self.assertIs(order.estimates_approximate, True)
+        self.assertIsNone(order.estimated_live_minutes)
+
+        detail = self.client.get(reverse('bulk-import-job', args=[job['id']]))
+        self.assertEqual(detail.data['data']['created_count'], 3)
+
+    def test_ndjson(self):
+        rows = [
+            {"order_id": "B1", "pickup_location_lat": 22.35, "pickup_location_long": 91.82, "delivery_location_lat": 22.37, "delivery_location_long": 91.83},
+            "not an object",
+        ]
+        content = "\n".join(json.dumps(row) for row in rows) + "\n{broken\n"
+        response = self.upload('orders.ndjson', content)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([r['status'] for r in response.data['data']['results']], ['created', 'error', 'error'])
+
+    @override_settings(IMPORT_CHUNK_SIZE=2)
+    def test_unreadable_bytes_after_a_chunk_keep_its_results(self):
+        header = b"order_id,pickup_location_lat,pickup_location_long,delivery_location_lat,delivery_location_long\n"
+        content = header + b"A1,22.35,91.82,22.37,91.83\nA2,22.35,91.82,22.40,91.80\nA3,22.36,91.81,22.38,91.85\nA\xff4,22.36,91.81,22.38,91.85\n"
+        response = self.client.post(reverse('bulk-import'), {'file': SimpleUploadedFile('orders.csv', content)}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        job = response.data['data']
+        self.assertEqual(job['status'], 'partial')
+        self.assertIn('row 3', job['message'])
+        self.assertEqual([r['status'] for r in job['results']], ['created', 'created'])
+        self.assertEqual(sorted(DeliveryRequest.objects.values_list('order_id', flat=True)), ['A1', 'A2'])
+
+    def test_missing_columns_fail_the_job(self):
+        response = self.upload('orders.csv', "order_id,pickup_location_lat\nA1,22.35\n")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(BulkImportJob.objects.get().status, 'failed')
+        self.assertFalse(DeliveryRequest.objects.exists())
+
+    def test_only_companies_can_import(self):
+        customer = UserAuth.objects.create_user(email='customer@example.com', password='x', role='customer')
+        self.client.force_authenticate(customer)
+        self.assertEqual(self.upload('orders.csv', "").status_code, 403)
+        other = self.client.get(reverse('bulk-import-job', args=[BulkImportJob.objects.create(customer=self.company, format='csv').id]))
+        self.assertEqual(other.status_code, 404)
+
+
+class OrderListPaginationTests(TestCase):
+    def setUp(self):
+        self.customer = UserAuth.objects.create_user(email='customer@example.com', password='x', role='customer')
+        self.orders = [make_order(self.customer, status='pending') for _ in range(5)]
+        # Two orders created at the same instant are told apart by id
+        DeliveryRequest.objects.filter(id__in=[o.id for o in self.orders[1:3]]).update(created_at=self.orders[1].created_at)
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def test_pages_cover_every_order_once_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get(reverse('customer-orders'), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['data']), 2)
+            seen += [order['id'] for order in response.data['data']]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+        expected = DeliveryRequest.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(reverse('customer-orders'), {'cursor': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('customer-orders'), {'limit': 0}).status_code, 400)
+
+
+class OrderListQueryCountTests(TestCase):
+    def setUp(self):
+        self.customer = UserAuth.objects.create_user(email='customer@example.com', password='x', role='customer', name='Customer')
+        self.driver = UserAuth.objects.create_user(email='driver@example.com', password='x', role='driver', name='Driver')
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def add_orders(self, count):
+        for i in range(count):
+            make_order(self.customer, status='assigned', assign_driver=self.driver if i % 2 else None)
+
+    def test_list_queries_do_not_grow_with_the_page(self):
+        self.add_orders(2)
+        with self.assertNumQueries(1):
+            small = self.client.get(reverse('customer-orders'))
+        self.add_orders(18)
+        with self.assertNumQueries(1):
+            large = self.client.get(reverse('customer-orders'))
+        self.assertEqual((len(small.data['data']), len(large.data['data'])), (2, 20))
+
+        order = large.data['data'][0]
+        self.assertEqual(order['customer_details']['name'], 'Customer')
+        drivers = [order['assign_driver_details'] for order in large.data['data']]
+        self.assertIn(None, drivers)
+        self.assertEqual({driver['name'] for driver in drivers if driver}, {'Driver'})
+
+    def test_detail_is_one_query(self):
+        self.add_orders(2)
+        order = DeliveryRequest.objects.filter(assign_driver=self.driver).get()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('order-detail', args=[order.id]))
+        self.assertEqual(response.data['data']['assign_driver_details']['id'], self.driver.id)
+
+
+class NearbyPendingOrderTests(TestCase):
+    def setUp(self):
+        customer = UserAuth.objects.create_user(email='customer@example.com', password='x', role='customer')
+        self.driver = UserAuth.objects.create_user(email='driver@example.com', password='x', role='driver')
+        self.orders = [
+            make_order(customer, pickup_location_lat=22.35 + i * 0.002, pickup_location_long=91.82)
+            for i in range(7)
+        ]
+        rebuild_pending_order_index()
+        self.addCleanup(pending_order_index.rebuild, [])
+        # Taken meanwhile, without the index noticing
+        DeliveryRequest.objects.filter(id=self.orders[2].id).update(status='assigned')
+        self.client = APIClient()
+        self.client.force_authenticate(self.driver)
+
+    def get(self, **params):
+        return self.client.get(reverse('nearby_pending_order'), {'lat': 22.35, 'lng': 91.82, 'radius_km': 5, **params})
+
+    def test_pages_are_bounded_and_cover_every_order_once(self):
+        fetches = []
+        within = pending_order_index.within
+        pending_order_index.within = lambda *args: fetches.append(args[3]) or within(*args)
+        self.addCleanup(delattr, pending_order_index, 'within')
+
+        seen, cursor = [], None
+        while True:
+            response = self.get(limit=2, **({'cursor': cursor} if cursor else {}))
+            self.assertEqual(response.status_code, 200)
+            seen += [order['id'] for order in response.data['data']]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, [order.id for i, order in enumerate(self.orders) if i != 2])
+        # rank + limit hits per page, twice that once for the page that met the stale order
+        self.assertEqual(fetches[:3], [2, 4, 8])
+        self.assertNotIn(self.orders[2].id, [member for member, _ in within(22.35, 91.82, 5)])
+
+    def test_invalid_coordinates(self):
+        for params in [{'lat': 91}, {'lng': -181}, {'lat': 'nan'}, {'radius_km': 'nan'}]:
+            self.assertEqual(self.get(**params).status_code, 400, params)
+
+
+class PoolingTests(TestCase):
+    def setUp(self):
+        self.customer = UserAuth.objects.create_user(email='customer@example.com', password='x', role='customer')
+
+    def test_clusters_need_near_pickups_and_one_direction(self):
+        pickups = [(22.35, 91.82), (22.351, 91.821), (22.352, 91.82), (22.45, 91.82)]
+        # North, north, south, north but far away
+        drops = [(22.40, 91.82), (22.41, 91.821), (22.30, 91.82), (22.50, 91.82)]
+        self.assertEqual(find_clusters(pickups, drops, [0, 60, 120, 180], pickup_radius_km=1, max_bearing_diff=30), [[0, 1]])
+        # Too far apart in time
+        self.assertEqual(find_clusters(pickups[:2], drops[:2], [0, 3600], pickup_radius_km=1, max_bearing_diff=30, window_seconds=600), [])
+
+    def test_partly_claimed_bundle_is_planned_for_its_members(self):
+        orders = [
+            make_order(self.customer, pickup_location_lat=22.35, delivery_location_lat=22.40),
+            make_order(self.customer, pickup_location_lat=22.351, delivery_location_lat=22.41),
+            make_order(self.customer, pickup_location_lat=22.352, delivery_location_lat=22.60),
+        ]
+        # Taken meanwhile
+        DeliveryRequest.objects.filter(id=orders[2].id).update(status='assigned')
+        bundle = create_bundle(orders)
+        bundle.refresh_from_db()
+        self.assertEqual(sorted(bundle.orders.values_list('id', flat=True)), sorted([orders[0].id, orders[1].id]))
+        self.assertAlmostEqual(bundle.pickup_location_lat, 22.3505)
+        route = plan_route((22.3505, 91.82), orders[:2])
+        self.assertEqual(float(bundle.route_km), route["total_km"])
+        self.assertEqual(bundle.route_minutes, round(route["total_minutes"]))
+
+    def test_bundle_with_one_member_left_is_dropped(self):
+        orders = [make_order(self.customer), make_order(self.customer)]
+        DeliveryRequest.objects.filter(id=orders[0].id).update(status='assigned')
+        self.assertIsNone(create_bundle(orders))
+        self.assertFalse(DeliveryRequest.objects.filter(bundle__isnull=False).exists())
+
+
+class TrackEncodingTests(SimpleTestCase):
+    def test_round_trip_across_appends(self):
+        rng = np.random.default_rng(5)
+        points = [(22.35 + i * 1e-4 + rng.normal(0, 1e-5), 91.82 - i * 1e-4, i * 3) for i in range(50)]
+        first, kept, last = encode(points[:20])
+        rest, more, _ = encode(points[20:], last)
+        self.assertEqual(kept + more, 50)
+        decoded = decode(first + rest)
+        expected = np.array([(round(lat * SCALE), round(lng * SCALE), seconds) for lat, lng, seconds in points])
+        self.assertTrue(np.array_equal(decoded, expected))
+
+    def test_close_and_out_of_order_points_are_skipped(self):
+        points = [(22.35, 91.82, 0), (22.350001, 91.82, 5), (22.36, 91.82, 3), (22.37, 91.82, 2), (22.38, 91.82, 9)]
+        data, kept, _ = encode(points, min_distance_m=5)
+        self.assertEqual(kept, 3)
+        self.assertEqual(decode(data)[:, 2].tolist(), [0, 3, 9])
+
+    def test_douglas_peucker_stays_within_tolerance(self):
+        rng = np.random.default_rng(8)
+        x = np.cumsum(rng.uniform(0, 10, 300))
+        y = np.cumsum(rng.normal(0, 5, 300))
+        for tolerance in (1, 5, 20):
+            keep = douglas_peucker(x, y, tolerance)
+            self.assertTrue(keep[0] and keep[-1])
+            kept = np.nonzero(keep)[0]
+            for start, end in zip(kept, kept[1:]):
+                dx, dy = x[end] - x[start], y[end] - y[start]
+                for i in range(start + 1, end):
+                    t = min(max(((x[i] - x[start]) * dx + (y[i] - y[start]) * dy) / (dx * dx + dy * dy), 0), 1)
+                    self.assertLessEqual(np.hypot(x[i] - x[start] - t * dx, y[i] - y[start] - t * dy), tolerance + 1e-9)
+        # A straight line needs only its ends
+        self.assertEqual(douglas_peucker(np.arange(10.0), np.arange(10.0) * 2, 0.1).tolist(), [True] + [False] * 8 + [True])
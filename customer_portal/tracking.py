@@ -0,0 +1,87 @@
+"""
+Which orders are being tracked live, so driver positions are only relayed
+to order_{id}_tracking groups somebody is listening to.
+"""
+import threading
+from collections import Counter
+
+from channels.layers import get_channel_layer
+from asgiref.sync import sync_to_async
+
+from common_portal.redis_client import get_redis, redis_failed
+
+SUBSCRIBERS_KEY = 'tracking:subscribers'  # hash "driver_id:order_id" -> open tracking sockets
+
+_local_subscribers = Counter()
+_local_lock = threading.Lock()
+
+
+def tracking_group(order_id):
+    return f"order_{order_id}_tracking"
+
+
+def subscribe(driver_id, order_id):
+    field = f"{driver_id}:{order_id}"
+    with _local_lock:
+        _local_subscribers[field] += 1
+    client = get_redis()
+    if client is not None:
+        try:
+            client.hincrby(SUBSCRIBERS_KEY, field, 1)
+        except Exception as e:
+            redis_failed(e)
+
+
+def unsubscribe(driver_id, order_id):
+    field = f"{driver_id}:{order_id}"
+    with _local_lock:
+        _local_subscribers[field] -= 1
+        if _local_subscribers[field] <= 0:
+            del _local_subscribers[field]
+    client = get_redis()
+    if client is not None:
+        try:
+            if client.hincrby(SUBSCRIBERS_KEY, field, -1) <= 0:
+                client.hdel(SUBSCRIBERS_KEY, field)
+        except Exception as e:
+            redis_failed(e)
+
+
+def tracked_orders():
+    """driver_id -> [order_id] of every order with an open tracking socket"""
+    fields = None
+    client = get_redis()
+    if client is not None:
+        try:
+            fields = client.hkeys(SUBSCRIBERS_KEY)
+        except Exception as e:
+            redis_failed(e)
+    if fields is None:
+        with _local_lock:
+            fields = list(_local_subscribers)
+    orders = {}
+    for field in fields:
+        driver_id, order_id = field.split(':', 1)
+        orders.setdefault(int(driver_id), []).append(order_id)
+    return orders
+
+
+async def broadcast_positions(positions):
+    """Relay {driver_id: (lat, lng, timestamp)} to the tracking groups of the drivers' orders"""
+    tracked = await sync_to_async(tracked_orders, thread_sensitive=False)()
+    if not tracked:
+        return 0
+    channel_layer = get_channel_layer()
+    sent = 0
+    for driver_id in tracked.keys() & positions.keys():
+        lat, lng, at = positions[driver_id]
+        for order_id in tracked[driver_id]:
+            await channel_layer.group_send(tracking_group(order_id), {
+                "type": "send_position",
+                "order_id": order_id,
+                "lat": lat,
+                "lng": lng,
+                "timestamp": at,
+            })
+            sent += 1
+    return sent
@@ -0,0 +1,155 @@
+"""
+Compact storage of delivery GPS tracks.
+
+A track is a flat array of int32 triples (dlat, dlng, dt): coordinates in
+millionths of a degree (~0.1 m) and time in seconds since the track's
+started_at, each stored as the difference to the previous point. That is
+12 bytes per point, appending only needs the last point, and a delivered
+track is simplified with Douglas-Peucker so it usually ends up a few KB.
+"""
+import json
+from array import array
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from common_portal.geo import KM_PER_DEGREE_LAT
+from .models import DeliveryRequest, DeliveryTrack
+
+SCALE = 1_000_000
+TRACKED_STATUSES = ['assigned', 'picked_up', 'on_the_way']
+
+
+def encode(points, last=(0, 0, 0), min_distance_m=0):
+    """
+    int32 deltas of ``points`` (lat, lng, seconds) following the encoded point
+    ``last``. Points closer than min_distance_m to the previous kept one, or
+    not later than it, are skipped. Returns (bytes, kept points, new last).
+    """
+    deltas = array('i')
+    last_lat, last_lng, last_time = last
+    # millionths of a degree of latitude in metres, longitude is close enough here
+    min_units = min_distance_m / (KM_PER_DEGREE_LAT * 1000) * SCALE
+    kept = 0
+    for lat, lng, seconds in points:
+        lat, lng, seconds = round(lat * SCALE), round(lng * SCALE), int(seconds)
+        if kept or last != (0, 0, 0):
+            if seconds <= last_time or max(abs(lat - last_lat), abs(lng - last_lng)) < min_units:
+                continue
+        deltas.extend((lat - last_lat, lng - last_lng, seconds - last_time))
+        last_lat, last_lng, last_time = lat, lng, seconds
+        kept += 1
+    return deltas.tobytes(), kept, (last_lat, last_lng, last_time)
+
+
+def decode(data):
+    """(n, 3) int64 array of absolute (lat, lng, seconds) in encoded units"""
+    deltas = np.frombuffer(bytes(data), dtype=np.int32).reshape(-1, 3)
+    return np.cumsum(deltas, axis=0, dtype=np.int64)
+
+
+def douglas_peucker(x, y, tolerance):
+    """Boolean mask of the points to keep so no dropped point is further than tolerance from the line"""
+    n = len(x)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end <= start + 1:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length = dx * dx + dy * dy
+        if length == 0:
+            distances = np.hypot(px, py)
+        else:
+            t = np.clip((px * dx + py * dy) / length, 0, 1)
+            distances = np.hypot(px - t * dx, py - t * dy)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return keep
+
+
+def append_points(driver_points):
+    """
+    Add {driver_id: [(lat, lng, timestamp)]} to the tracks of the drivers'
+    active deliveries. Returns the number of tracks written.
+    """
+    orders = DeliveryRequest.objects.filter(
+        assign_driver_id__in=list(driver_points), status__in=TRACKED_STATUSES
+    ).values_list('id', 'assign_driver_id')
+    orders = dict(orders)
+    if not orders:
+        return 0
+    with transaction.atomic():
+        tracks = {track.delivery_id: track for track in DeliveryTrack.objects.select_for_update().filter(delivery_id__in=list(orders))}
+        created = []
+        for order_id, driver_id in orders.items():
+            points = sorted(driver_points[driver_id], key=lambda point: point[2])
+            track = tracks.get(order_id)
+            if track is None:
+                track = DeliveryTrack(delivery_id=order_id, started_at=datetime.fromtimestamp(points[0][2], tz=dt_timezone.utc))
+                created.append(track)
+            elif track.simplified:
+                continue
+            origin = track.started_at.timestamp()
+            data, kept, last = encode(
+                [(lat, lng, at - origin) for lat, lng, at in points],
+                (track.last_lat, track.last_lng, track.last_time) if track.point_count else (0, 0, 0),
+                settings.TRACK_MIN_DISTANCE_M,
+            )
+            if not kept:
+                continue
+            track.data = bytes(track.data) + data
+            track.point_count += kept
+            track.last_lat, track.last_lng, track.last_time = last
+            if track not in created:
+                track.save(update_fields=['data', 'point_count', 'last_lat', 'last_lng', 'last_time', 'updated_at'])
+        DeliveryTrack.objects.bulk_create(created)
+    return len(orders)
+
+
+def simplify_track(order_id, tolerance_m=None):
+    """Douglas-Peucker simplification of a finished track. Returns the number of points kept."""
+    tolerance_m = tolerance_m or settings.TRACK_SIMPLIFY_TOLERANCE_M
+    with transaction.atomic():
+        track = DeliveryTrack.objects.select_for_update().filter(delivery_id=order_id).first()
+        if track is None or track.simplified:
+            return None
+        points = decode(track.data)
+        if len(points) > 2:
+            # Equirectangular projection to metres, fine at delivery scale
+            metres_per_unit = KM_PER_DEGREE_LAT * 1000 / SCALE
+            cos_lat = np.cos(np.radians(points[:, 0].mean() / SCALE))
+            keep = douglas_peucker(points[:, 1] * metres_per_unit * cos_lat, points[:, 0] * metres_per_unit, tolerance_m)
+            points = points[keep]
+        absolute = [(lat / SCALE, lng / SCALE, seconds) for lat, lng, seconds in points.tolist()]
+        track.data, track.point_count, (track.last_lat, track.last_lng, track.last_time) = encode(absolute)
+        track.simplified = True
+        track.save(update_fields=['data', 'point_count', 'last_lat', 'last_lng', 'last_time', 'simplified', 'updated_at'])
+    return track.point_count
+
+
+def iter_ndjson(track, chunk=500):
+    """The points of a track as NDJSON lines of {"lat", "lng", "time"}, a chunk of lines at a time"""
+    points = decode(track.data)
+    origin = track.started_at.timestamp()
+    for start in range(0, len(points), chunk):
+        lines = [
+            json.dumps({
+                "lat": lat / SCALE,
+                "lng": lng / SCALE,
+                "time": datetime.fromtimestamp(origin + seconds, tz=dt_timezone.utc).isoformat(),
+            })
+            for lat, lng, seconds in points[start:start + chunk].tolist()
+        ]
+        yield "\n".join(lines) + "\n"
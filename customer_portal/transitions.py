@@ -0,0 +1,110 @@
+"""
+Order status transitions.
+
+TRANSITIONS lists every allowed status change and who may make it. A
+transition is one conditional UPDATE that only matches the order while it
+still has the status the caller saw, so of two concurrent changes only one
+applies, and an OrderTrack row written in the same transaction records it.
+"""
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import DeliveryRequest, OrderTrack
+
+CUSTOMER, DRIVER, SYSTEM = 'customer', 'driver', 'system'
+
+# (from status, to status) -> who may make the change. SYSTEM covers
+# dispatch, bundles and geofences acting on the driver's behalf.
+TRANSITIONS = {
+    ('pending', 'confirmed'): {CUSTOMER},
+    ('pending', 'cancelled'): {CUSTOMER},
+    ('confirmed', 'assigned'): {DRIVER, SYSTEM},
+    ('assigned', 'picked_up'): {DRIVER, SYSTEM},
+    ('assigned', 'cancelled'): {CUSTOMER},
+    ('picked_up', 'on_the_way'): {DRIVER, SYSTEM},
+    ('picked_up', 'delivered'): {DRIVER},
+    ('picked_up', 'cancelled'): {CUSTOMER},
+    ('on_the_way', 'delivered'): {DRIVER},
+    ('on_the_way', 'cancelled'): {CUSTOMER},
+}
+
+# An order in one of these is what its driver is working on
+ACTIVE_STATUSES = ['assigned', 'picked_up', 'on_the_way']
+
+# What the customer is told when the driver moves the order on
+STATUS_MESSAGES = {
+    'picked_up': "A driver picked your parcel",
+    'on_the_way': "A driver on the way with your parcel",
+    'delivered': "your order mark as deliverd",
+}
+
+# Set once, the first time an order reaches the status
+TIMESTAMPS = {
+    'picked_up': 'picked_up_at',
+    'delivered': 'delivered_at',
+}
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def allowed(from_status, to_status, role):
+    return role in TRANSITIONS.get((from_status, to_status), ())
+
+
+def check(from_status, to_status, role):
+    if (from_status, to_status) not in TRANSITIONS:
+        raise InvalidTransition(f"Can't change a {from_status} order to {to_status}")
+    if not allowed(from_status, to_status, role):
+        raise InvalidTransition(f"A {role} can't change a {from_status} order to {to_status}")
+
+
+def apply(orders, from_status, to_status, **changes):
+    """
+    Move the orders of a queryset that still have from_status to to_status.
+    No event is logged, see log(). Returns the number of orders changed.
+    """
+    now = timezone.now()
+    changes.update(status=to_status, updated_at=now)
+    if to_status in TIMESTAMPS:
+        field = TIMESTAMPS[to_status]
+        changes[field] = Coalesce(field, Value(now))
+    return orders.filter(status=from_status).update(**changes)
+
+
+def log(order_ids, from_status, to_status, by=None, remark=''):
+    now = timezone.now()
+    OrderTrack.objects.bulk_create([
+        OrderTrack(
+            delivery_request_id=order_id, from_status=from_status, status=to_status,
+            updated_by_id=by, remark=remark, created_at=now,
+        )
+        for order_id in order_ids
+    ])
+
+
+def transition(order_id, from_status, to_status, role, by=None, remark='', match=None, **changes):
+    """
+    Change the status of one order from from_status to to_status and log it.
+    ``match`` adds conditions the order must meet, e.g. its driver, ``by``
+    is the id of the user making the change. Raises InvalidTransition for a
+    change the table does not allow. Returns False when the order was not
+    in from_status (anymore) or did not match.
+    """
+    check(from_status, to_status, role)
+    with transaction.atomic():
+        orders = DeliveryRequest.objects.filter(id=order_id, **(match or {}))
+        if not apply(orders, from_status, to_status, **changes):
+            return False
+        log([order_id], from_status, to_status, by, remark)
+    return True
+
+
+def timeline(order_id):
+    """Status changes of an order, oldest first"""
+    return OrderTrack.objects.filter(delivery_request_id=order_id).order_by('created_at', 'id').values(
+        'from_status', 'status', 'updated_by_id', 'remark', 'created_at'
+    )
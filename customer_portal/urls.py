@@ -4,19 +4,27 @@ from driver_portal.views import *
 
 urlpatterns = [
     path('delivery/create/', CreateDeliveryRequestView.as_view(), name='create-delivery'),
+    path('delivery/import/', BulkImportView.as_view(), name='bulk-import'),
+    path('delivery/import/<int:job_id>/', BulkImportJobView.as_view(), name='bulk-import-job'),
     path('delivery/cancel/<int:delivery_id>/', CancelDeliveryRequestView.as_view(), name='cancel-delivery'),
     path('delivery/accept/<int:delivery_id>/', AcceptDeliveryRequestView.as_view(), name='accept-delivery'),
     path('delivery/update/<int:delivery_id>/', UpdateDeliveryStatus.as_view(), name='update-delivery'),
 
-    path('delivery/confirm/<int:delivery_id>/', ConfirmDelivery.as_view(), name='update-delivery'),
+    path('delivery/confirm/<int:delivery_id>/', ConfirmDelivery.as_view(), name='confirm-delivery'),
 
     path('delivery/rate/<str:delivery_id>/', RateDriverView.as_view(), name='rate-driver'),
     
 
     path('delivery/customer/', CustomerOrderListView.as_view(), name='customer-orders'),
     path('delivery/driver/', DriverOrderListView.as_view(), name='driver-orders'),
+    path('delivery/driver/route/', DriverRouteView.as_view(), name='driver-route'),
     path('delivery/<int:order_id>/', OrderDetailView.as_view(), name='order-detail'),
+    path('delivery/<str:order_id>/track/', OrderTrackView.as_view(), name='order-track'),
+    path('delivery/<str:order_id>/timeline/', OrderTimelineView.as_view(), name='order-timeline'),
     path('delivery/pending_order/', PendingOrderListView.as_view(), name='pending_order'),
+    path('delivery/pending_order/nearby/', NearbyPendingOrderListView.as_view(), name='nearby_pending_order'),
+    path('delivery/bundle/nearby/', NearbyBundleListView.as_view(), name='nearby_bundle'),
+    path('delivery/bundle/accept/<int:bundle_id>/', AcceptBundleView.as_view(), name='accept-bundle'),
 
 
     path('delivery/<str:user_id>/pending_order/', UserPendingOrderListView.as_view(), name='user_pending_order'),
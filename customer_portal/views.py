@@ -1,15 +1,26 @@
+from decimal import Decimal
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
-from .models import DeliveryRequest
+from .models import BulkImportJob, DeliveryRequest, DeliveryBundle, DeliveryTrack, route_fields
 from account.models import UserAuth
 from .serializers import *
-from channels.layers import get_channel_layer
-from django.shortcuts import get_object_or_404
-from asgiref.sync import async_to_sync
 from notifications.models import *
+from common_portal.geo import valid_coordinates
 from common_portal.utils import calculate_distance_and_time
-from driver_portal.models import DriverEarningHistory
+from driver_portal.locations import driver_position
+from driver_portal.sequencing import plan_route
+from .acceptance import claim_order
+from .bulk_import import ImportFileError, detect_format, run_import
+from .feed import sync_pending_order, pending_orders_near
+from .pagination import keyset_page
+from .pooling import accept_bundle, bundles_near
+from .tracks import iter_ndjson
+from .transitions import ACTIVE_STATUSES, CUSTOMER, DRIVER, STATUS_MESSAGES, InvalidTransition, allowed, timeline, transition
+from django.db import transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from common_portal.outbox import enqueue, enqueue_many
 # Example delivery fee calculation function
 def calculate_delivery_fee(customer, product_weight):
     base_fee = 50  # example base
@@ -27,12 +38,18 @@ class CreateDeliveryRequestView(APIView):
         required_fields = ["pickup_location_lat", "pickup_location_long", "delivery_location_lat", "delivery_location_long"]
         if not all(field in data for field in required_fields):
             return Response({"status":"error","message":"Pickup and dropoff coordinates are required."}, status=400)
-        pickup_location_lat = float(data["pickup_location_lat"])
-        pickup_location_long = float(data["pickup_location_long"])
-        delivery_location_lat = float(data["delivery_location_lat"])
-        delivery_location_long = float(data["delivery_location_long"])
-
-        distance_km, estimate_time = calculate_distance_and_time(pickup_location_lat, pickup_location_long, delivery_location_lat, delivery_location_long)
+        try:
+            pickup_location_lat = float(data["pickup_location_lat"])
+            pickup_location_long = float(data["pickup_location_long"])
+            delivery_location_lat = float(data["delivery_location_lat"])
+            delivery_location_long = float(data["delivery_location_long"])
+        except (TypeError, ValueError):
+            return Response({"status":"error","message":"Coordinates must be numbers."}, status=400)
+
+        # Falls back to a local estimate when Google is slow or down, so this never blocks on it
+        distance_km, estimate_time, route = calculate_distance_and_time(pickup_location_lat, pickup_location_long, delivery_location_lat, delivery_location_long, with_route=True)
+        if distance_km is None:
+            return Response({"status":"error","message":"Unable to calculate distance for the given coordinates."}, status=400)
         default_delivery_fee = customer.default_delivery_fee if hasattr(customer, 'default_delivery_fee') else 0
         fee = distance_km * default_delivery_fee
 
@@ -50,15 +67,18 @@ class CreateDeliveryRequestView(APIView):
             company_name=request.data.get('company_name',''),
             description=request.data.get('description',''),
             product_weight=product_weight,
-            product_amount=request.data.get('product_amount',''),
+            product_amount=request.data.get('product_amount') or None,
             pickup_location=request.data.get('pickup_location',''),
-            pickup_location_lat=request.data.get('pickup_location_lat',''),
-            pickup_location_long=request.data.get('pickup_location_long',''),
+            pickup_location_lat=pickup_location_lat,
+            pickup_location_long=pickup_location_long,
             delivery_location=request.data.get('delivery_location',''),
-            delivery_location_lat=request.data.get('delivery_location_lat',''),
-            delivery_location_long=request.data.get('delivery_location_long',''),
+            delivery_location_lat=delivery_location_lat,
+            delivery_location_long=delivery_location_long,
             distance_km=distance_km,
+            estimated_time_minutes=estimate_time,
+            estimates_updated_at=timezone.now(),
             delivery_fee=fee,
+            **route_fields(route),
             assign_driver=None
         )
 
@@ -66,6 +86,44 @@ class CreateDeliveryRequestView(APIView):
         return Response({"status":"success","data":response_serializer.data}, status=201)
 
 
+
+class BulkImportView(APIView):
+    """
+    Create many delivery requests from one CSV or NDJSON upload (multipart
+    ``file``), with the columns of CreateDeliveryRequestView. The format
+    follows the file extension unless ``format`` is given. Returns the job
+    with one result per row.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        if request.user.role != 'company':
+            return Response({"status":"error","message":"Only company accounts can import orders."}, status=403)
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"status":"error","message":"file is required."}, status=400)
+        try:
+            file_format = detect_format(upload.name, request.data.get('format'))
+        except ImportFileError as e:
+            return Response({"status":"error","message":str(e)}, status=400)
+
+        job = BulkImportJob.objects.create(customer=request.user, file_name=upload.name[:255], format=file_format)
+        run_import(job, upload)
+        if job.status == 'failed':
+            return Response({"status":"error","message":job.message,"data":BulkImportJobSerializer(job).data}, status=400)
+        return Response({"status":"success","data":BulkImportJobSerializer(job).data}, status=201)
+
+
+class BulkImportJobView(APIView):
+    """Result of an import job"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = BulkImportJob.objects.filter(id=job_id, customer=request.user).first()
+        if job is None:
+            return Response({"status":"error","message":"Import job not found"}, status=404)
+        return Response({"status":"success","data":BulkImportJobSerializer(job).data}, status=200)
+
 class CancelDeliveryRequestView(APIView):
     """Cancel delivery request by ID"""
     permission_classes = [permissions.IsAuthenticated]
@@ -74,15 +132,17 @@ class CancelDeliveryRequestView(APIView):
             delivery = DeliveryRequest.objects.get(id=delivery_id)
         except DeliveryRequest.DoesNotExist:
             return Response({"status":"error","message":"Delivery request not found"}, status=404)
+        if delivery.customer_id != request.user.id:
+            return Response({"status":"error","message":"You can't cancel this delivery"}, status=403)
 
-        if delivery.status in ['delivered', 'cancelled']:
-            return Response({"status":"error","message":"Cannot cancel delivered or already cancelled request"}, status=400)
-        
-        if delivery.status == 'confirmed':
-            return Response({"status":"error","message":"can't cancel confirmed order"}, status=404)
-
+        try:
+            cancelled = transition(delivery.id, delivery.status, 'cancelled', CUSTOMER, by=request.user.id)
+        except InvalidTransition:
+            return Response({"status":"error","message":f"Can't cancel a {delivery.status} order"}, status=400)
+        if not cancelled:
+            return Response({"status":"error","message":"The order changed meanwhile, try again"}, status=409)
         delivery.status = 'cancelled'
-        delivery.save()
+        sync_pending_order(delivery)
         return Response({"status":"success","message":"Delivery request cancelled"}, status=200)
     
 
@@ -93,55 +153,22 @@ class AcceptDeliveryRequestView(APIView):
     """
     permission_classes = [permissions.IsAuthenticated]
     def post(self, request, delivery_id):
-        try:
-            delivery = DeliveryRequest.objects.get(id=delivery_id)
-        except DeliveryRequest.DoesNotExist:
-            return Response({"status":"error","message":"Delivery request not found"}, status=404)
-        
-        if delivery.assign_driver:
-            return Response({"status":"error","message":"Already assign a driver"}, status=404)
-
-        assign_driver_id = request.user
-        status_update = 'assigned'
-        delivery.assign_driver = assign_driver_id
-        delivery.status = status_update
-        delivery.save()
-        try:
-            # ---- Create Notification ----
-            title = "Assign Driver"
-            message = f"{request.user.name} accept your order."
-            data = {"order_id": delivery.id}
-
-            notification = Notification.objects.create(
-                title=title,
-                message=message,
-                data=data,
-                created_at=timezone.now()
-            )
-
-            invited_user = get_object_or_404(User, id=delivery.customer.id)
-
-            # Create NotificationRecipient link
-            NotificationRecipient.objects.create(
-                notification=notification,
-                recipient=invited_user
-            )
-            # ---- Push to WebSocket ----
-            channel_layer = get_channel_layer()
-            group_name = f"user_{invited_user.id}_notifications"
-
-            async_to_sync(channel_layer.group_send)(
-                group_name,
-                {
-                    "type": "send_notification",  # must match consumer method
-                    "title": title,
-                    "message": message,
-                    "data": data,
-                    "created_at": notification.created_at.isoformat(),
-                }
-            )
-        except:
-            pass
+        # Compare-and-set, of many drivers accepting at once exactly one wins
+        with transaction.atomic():
+            won = claim_order(delivery_id, request.user.id)
+            if won:
+                customer_id = DeliveryRequest.objects.values_list('customer_id', flat=True).get(id=delivery_id)
+                enqueue(
+                    'notification', title="Assign Driver", message=f"{request.user.name} accept your order.",
+                    data={"order_id": str(delivery_id)}, recipient_ids=customer_id,
+                )
+        if not won:
+            delivery = DeliveryRequest.objects.filter(id=delivery_id).only('assign_driver', 'status').first()
+            if delivery is None:
+                return Response({"status":"error","message":"Delivery request not found"}, status=404)
+            if delivery.assign_driver_id:
+                return Response({"status":"error","message":"Already assign a driver"}, status=409)
+            return Response({"status":"error","message":"This order can't be accepted"}, status=409)
         return Response({"status":"success","message":"Successfully accept order"}, status=200)
     
 
@@ -156,68 +183,31 @@ class UpdateDeliveryStatus(APIView):
             delivery = DeliveryRequest.objects.get(id=delivery_id)
         except DeliveryRequest.DoesNotExist:
             return Response({"status":"error","message":"Delivery request not found"}, status=404)
-        if delivery.status == 'confirmed':
-            return Response({"status":"error","message":"This order already confirmed"}, status=404)
-        if delivery.status == 'delivered':
-            return Response({"status":"error","message":"This order already delivered"}, status=404)
-        assign_driver_id = delivery.assign_driver
-        if assign_driver_id != request.user:
+        if delivery.assign_driver_id != request.user.id:
             return Response({"status":"error","message":"You can't update this delivery"}, status=404)
         status_update = request.data.get('status', None)
 
-        if status_update:
-            if status_update not in ['pending','confirmed','assigned','picked_up','on_the_way','delivered','cancelled']:
-                return Response({"status":"error","message":"Invalid status value"}, status=400)
-        delivery.status = status_update
-        delivery.save()
         try:
-            # ---- Create Notification ----
-            title = "Oder Update"
-            if status_update == 'picked_up':
-                message = f"A driver picked your parcel"
-            elif status_update == 'on_the_way':
-                message = f"A driver on the way with your parcel"
-            elif status_update == 'delivered':
-                message = f"your order mark as deliverd"
-            data = {"order_id": delivery.id}
-
-            notification = Notification.objects.create(
-                title=title,
-                message=message,
-                data=data,
-                created_at=timezone.now()
-            )
-            if status_update == 'delivered':
-                driver_earning = DriverEarningHistory(
-                    driver=assign_driver_id,
-                    delivery=delivery,
-                    amount=delivery.delivery_fee
+            with transaction.atomic():
+                updated = transition(
+                    delivery.id, delivery.status, status_update, DRIVER, by=request.user.id,
+                    match={'assign_driver_id': request.user.id},
                 )
-                driver_earning.save()
-
-            invited_user = get_object_or_404(User, id=delivery.customer.id)
-
-            # Create NotificationRecipient link
-            NotificationRecipient.objects.create(
-                notification=notification,
-                recipient=invited_user
-            )
-            # ---- Push to WebSocket ----
-            channel_layer = get_channel_layer()
-            group_name = f"user_{invited_user.id}_notifications"
-
-            async_to_sync(channel_layer.group_send)(
-                group_name,
-                {
-                    "type": "send_notification",  # must match consumer method
-                    "title": title,
-                    "message": message,
-                    "data": data,
-                    "created_at": notification.created_at.isoformat(),
-                }
-            )
-        except:
-            pass
+                if updated:
+                    # Carried out by drain_outbox, committed together with the status
+                    enqueue(
+                        'notification', title="Oder Update", message=STATUS_MESSAGES[status_update],
+                        data={"order_id": delivery.id}, recipient_ids=delivery.customer_id,
+                    )
+                    if status_update == 'delivered':
+                        enqueue('driver_earning', driver_id=request.user.id, delivery_id=delivery.id, amount=str(delivery.delivery_fee))
+                        enqueue('simplify_track', order_id=delivery.id)
+        except InvalidTransition as e:
+            return Response({"status":"error","message":str(e)}, status=400)
+        if not updated:
+            return Response({"status":"error","message":"The order changed meanwhile, try again"}, status=409)
+        delivery.status = status_update
+        sync_pending_order(delivery)
         return Response({"status":"success","message":"Successfully Update order"}, status=200)
     
 
@@ -234,41 +224,93 @@ class ConfirmDelivery(APIView):
             delivery = DeliveryRequest.objects.get(id=delivery_id)
         except DeliveryRequest.DoesNotExist:
             return Response({"status":"error","message":"Delivery request not found"}, status=404)
-        if delivery.status == 'confirmed':
-            return Response({"status":"error","message":"This order already confirmed"}, status=404)
         customer = delivery.customer
         if customer != request.user:
             return Response({"status":"error","message":"You can't confirm this delivery"}, status=404)
+        if not allowed(delivery.status, 'confirmed', CUSTOMER):
+            return Response({"status":"error","message":f"Can't confirm a {delivery.status} order"}, status=400)
         if account_balance < delivery.delivery_fee:
             return Response({"status":"error","message":"Insufficient balance"}, status=404)
-        driver_earning = delivery.delivery_fee - delivery.delivery_fee * 0.2
-        user.account_balance -= driver_earning
-        user.save()
+        driver_earning = delivery.delivery_fee - delivery.delivery_fee * Decimal('0.2')
+        with transaction.atomic():
+            # Charged only by the request that actually confirms
+            if not transition(delivery.id, delivery.status, 'confirmed', CUSTOMER, by=user.id):
+                return Response({"status":"error","message":"This order already confirmed"}, status=409)
+            UserAuth.objects.filter(id=user.id).update(account_balance=F('account_balance') - driver_earning)
         delivery.status = 'confirmed'
-        delivery.save()
+        sync_pending_order(delivery)
         return Response({"status":"success","message":"Successfully confirmed order"}, status=200)
 
 
 
-# Customer order list
-class CustomerOrderListView(APIView):
+class OrderListView(APIView):
+    """
+    Orders of get_orders(), newest first, ?limit= per page.
+    Paginate with the returned next_cursor.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    default_limit = 20
+    max_limit = 100
 
-    def get(self, request):
-        customer = request.user
-        orders = DeliveryRequest.objects.filter(customer=customer)
+    def get_orders(self, request, **kwargs):
+        """The orders to list, none unless a subclass says which"""
+        return DeliveryRequest.objects.none()
+
+    def get(self, request, **kwargs):
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            return Response({"status":"error","message":"Invalid limit."}, status=400)
+        if limit <= 0:
+            return Response({"status":"error","message":"limit must be positive."}, status=400)
+        try:
+            orders, next_cursor = keyset_page(with_details(self.get_orders(request, **kwargs)), limit, request.query_params.get('cursor'))
+        except ValueError as e:
+            return Response({"status":"error","message":str(e)}, status=400)
         serializer = DeliveryRequestSerializer(orders, many=True)
-        return Response({"status":"success","data":serializer.data}, status=200)
+        return Response({"status":"success","data":serializer.data,"next_cursor":next_cursor}, status=200)
+
+
+# Customer order list
+class CustomerOrderListView(OrderListView):
+    def get_orders(self, request):
+        return DeliveryRequest.objects.filter(customer=request.user)
 
 # Driver order list
-class DriverOrderListView(APIView):
+class DriverOrderListView(OrderListView):
+    def get_orders(self, request):
+        return DeliveryRequest.objects.filter(assign_driver=request.user)
+
+
+class DriverRouteView(APIView):
+    """
+    Suggested travel order over the driver's active deliveries, every pickup
+    before its drop. Starts from ?lat=&lng=, else the driver's last location.
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         driver = request.user
-        orders = DeliveryRequest.objects.filter(assign_driver=driver)
-        serializer = DeliveryRequestSerializer(orders, many=True)
-        return Response({"status":"success","data":serializer.data}, status=200)
+        if driver.role != 'driver':
+            return Response({"status":"error","message":"Permission denied."}, status=403)
+
+        try:
+            if 'lat' in request.query_params or 'lng' in request.query_params:
+                position = (float(request.query_params['lat']), float(request.query_params['lng']))
+            else:
+                position = driver_position(driver)
+        except (KeyError, ValueError):
+            return Response({"status":"error","message":"Invalid lat or lng."}, status=400)
+        if position is None:
+            return Response({"status":"error","message":"Driver location is unknown."}, status=400)
+        if not valid_coordinates(*position):
+            return Response({"status":"error","message":"lat must be within -90..90 and lng within -180..180."}, status=400)
+
+        orders = [
+            order for order in DeliveryRequest.objects.filter(assign_driver=driver, status__in=ACTIVE_STATUSES)
+            if order.has_coordinates()
+        ]
+        return Response({"status":"success","data":plan_route(position, orders)}, status=200)
 
 # Order details
 class OrderDetailView(APIView):
@@ -276,7 +318,7 @@ class OrderDetailView(APIView):
 
     def get(self, request, order_id):
         try:
-            order = DeliveryRequest.objects.get(id=order_id)
+            order = with_details(DeliveryRequest.objects).get(id=order_id)
         except DeliveryRequest.DoesNotExist:
             return Response({"status":"error","message":"Order not found"}, status=404)
 
@@ -290,32 +332,179 @@ class OrderDetailView(APIView):
         return Response({"status":"success","data":serializer.data}, status=200)
     
 
+class OrderTrackView(APIView):
+    """
+    GPS track of a delivery as NDJSON, one {"lat", "lng", "time"} point per line
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, order_id):
+        try:
+            order = DeliveryRequest.objects.get(id=order_id)
+        except DeliveryRequest.DoesNotExist:
+            return Response({"status":"error","message":"Order not found"}, status=404)
+        if request.user.id not in (order.customer_id, order.assign_driver_id) and not request.user.is_staff:
+            return Response({"status":"error","message":"Not authorized"}, status=403)
+        track = DeliveryTrack.objects.filter(delivery=order).first()
+        if track is None:
+            return Response({"status":"error","message":"No track recorded for this order"}, status=404)
+        return StreamingHttpResponse(iter_ndjson(track), content_type='application/x-ndjson')
+
+
+class OrderTimelineView(APIView):
+    """
+    Status changes of an order, oldest first
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, order_id):
+        order = DeliveryRequest.objects.filter(id=order_id).values('customer_id', 'assign_driver_id').first()
+        if order is None:
+            return Response({"status":"error","message":"Order not found"}, status=404)
+        if request.user.id not in (order['customer_id'], order['assign_driver_id']) and not request.user.is_staff:
+            return Response({"status":"error","message":"Not authorized"}, status=403)
+        events = [
+            {
+                "from_status": event['from_status'],
+                "status": event['status'],
+                "updated_by": event['updated_by_id'],
+                "remark": event['remark'],
+                "created_at": event['created_at'].isoformat(),
+            }
+            for event in timeline(order_id)
+        ]
+        return Response({"status":"success","data":events}, status=200)
+
+
 # Pending order list
-class PendingOrderListView(APIView):
+class PendingOrderListView(OrderListView):
+    def get_orders(self, request):
+        return DeliveryRequest.objects.filter(status='confirmed')
+    
+
+# Pending orders around the driver
+class NearbyPendingOrderListView(APIView):
+    """
+    Confirmed orders whose pickup is within radius_km of the driver, closest first.
+    Position comes from ?lat=&lng=, else the driver's last reported location.
+    Paginate with the returned next_cursor.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    default_radius_km = 5
+    max_radius_km = 50
+    default_limit = 20
+    max_limit = 100
 
     def get(self, request):
-        orders = DeliveryRequest.objects.filter(status='confirmed')
-        serializer = DeliveryRequestSerializer(orders, many=True)
-        return Response({"status":"success","data":serializer.data}, status=200)
-    
+        driver = request.user
+        if driver.role != 'driver':
+            return Response({"status":"error","message":"Permission denied."}, status=403)
 
-# Pending order list
-class UserPendingOrderListView(APIView):
+        try:
+            radius_km = min(float(request.query_params.get('radius_km', self.default_radius_km)), self.max_radius_km)
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+            if 'lat' in request.query_params or 'lng' in request.query_params:
+                position = (float(request.query_params['lat']), float(request.query_params['lng']))
+            else:
+                position = driver_position(driver)
+        except (KeyError, ValueError):
+            return Response({"status":"error","message":"Invalid lat, lng, radius_km or limit."}, status=400)
+        if position is None:
+            return Response({"status":"error","message":"Driver location is unknown."}, status=400)
+        if not valid_coordinates(*position):
+            return Response({"status":"error","message":"lat must be within -90..90 and lng within -180..180."}, status=400)
+        if not radius_km > 0 or limit <= 0:
+            return Response({"status":"error","message":"radius_km and limit must be positive."}, status=400)
+
+        try:
+            page, next_cursor = pending_orders_near(position[0], position[1], radius_km, limit, request.query_params.get('cursor'))
+        except ValueError as e:
+            return Response({"status":"error","message":str(e)}, status=400)
+
+        data = []
+        for order, distance in page:
+            item = DeliveryRequestSerializer(order).data
+            item["pickup_distance_km"] = round(distance, 2)
+            data.append(item)
+        return Response({"status":"success","data":data,"next_cursor":next_cursor}, status=200)
+
+
+# Bundles of pooled orders around the driver
+class NearbyBundleListView(APIView):
+    """
+    Open bundles whose pickup centre is within radius_km of the driver, closest first.
+    Position comes from ?lat=&lng=, else the driver's last reported location.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    default_radius_km = 5
+    max_radius_km = 50
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request):
+        driver = request.user
+        if driver.role != 'driver':
+            return Response({"status":"error","message":"Permission denied."}, status=403)
+
+        try:
+            radius_km = min(float(request.query_params.get('radius_km', self.default_radius_km)), self.max_radius_km)
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+            if 'lat' in request.query_params or 'lng' in request.query_params:
+                position = (float(request.query_params['lat']), float(request.query_params['lng']))
+            else:
+                position = driver_position(driver)
+        except (KeyError, ValueError):
+            return Response({"status":"error","message":"Invalid lat, lng, radius_km or limit."}, status=400)
+        if position is None:
+            return Response({"status":"error","message":"Driver location is unknown."}, status=400)
+        if not valid_coordinates(*position):
+            return Response({"status":"error","message":"lat must be within -90..90 and lng within -180..180."}, status=400)
+        if not radius_km > 0 or limit <= 0:
+            return Response({"status":"error","message":"radius_km and limit must be positive."}, status=400)
+
+        data = []
+        for bundle, distance in bundles_near(position[0], position[1], radius_km, limit):
+            item = DeliveryBundleSerializer(bundle).data
+            item["pickup_distance_km"] = round(distance, 2)
+            data.append(item)
+        return Response({"status":"success","data":data}, status=200)
+
+
+class AcceptBundleView(APIView):
+    """
+    Take every order of an open bundle at once
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, bundle_id):
+        if request.user.role != 'driver':
+            return Response({"status":"error","message":"Permission denied."}, status=403)
+        if not DeliveryBundle.objects.filter(id=bundle_id).exists():
+            return Response({"status":"error","message":"Bundle not found"}, status=404)
+
+        with transaction.atomic():
+            orders = accept_bundle(bundle_id, request.user)
+            if orders is not None:
+                enqueue_many('notification', [
+                    {"title": "Assign Driver", "message": f"{request.user.name} accept your order.",
+                     "data": {"order_id": order.id}, "recipient_ids": order.customer_id}
+                    for order in orders
+                ])
+        if orders is None:
+            return Response({"status":"error","message":"Bundle is no longer available"}, status=409)
 
-    def get(self, request,user_id=None):
-        orders = DeliveryRequest.objects.filter(customer = user_id).exclude(status='delivered').exclude(status='cancelled')
         serializer = DeliveryRequestSerializer(orders, many=True)
-        return Response({"status":"success","data":serializer.data}, status=200)
-    
+        return Response({"status":"success","message":"Bundle accepted","data":serializer.data}, status=200)
 
 
 # Pending order list
-class UserCompliteOrderListView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
+class UserPendingOrderListView(OrderListView):
+    def get_orders(self, request, user_id=None):
+        return DeliveryRequest.objects.filter(customer = user_id).exclude(status='delivered').exclude(status='cancelled')
+    
 
-    def get(self, request,user_id=None):
-        orders = DeliveryRequest.objects.filter(customer = user_id, status='delivered')
-        serializer = DeliveryRequestSerializer(orders, many=True)
-        return Response({"status":"success","data":serializer.data}, status=200)
\ No newline at end of file
+
+# Pending order list
+class UserCompliteOrderListView(OrderListView):
+    def get_orders(self, request, user_id=None):
+        return DeliveryRequest.objects.filter(customer = user_id, status='delivered')
\ No newline at end of file
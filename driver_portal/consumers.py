@@ -0,0 +1,59 @@
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .location_buffer import discard, ensure_flusher, heartbeat, record
+from .locations import driver_index
+from .presence import mark_offline
+
+
+class DriverLocationConsumer(AsyncWebsocketConsumer):
+    """
+    Drivers send {"lat": ..., "lng": ...} every few seconds, or
+    {"type": "heartbeat"} while standing still, at least every PRESENCE_TTL
+    seconds to stay online. Reports closer together than
+    DRIVER_LOCATION_MIN_INTERVAL are ignored.
+    """
+    async def connect(self):
+        user = self.scope["user"]
+        if user.is_anonymous or user.role != 'driver':
+            await self.close()
+        else:
+            self.driver_id = user.id
+            self.last_report = 0
+            ensure_flusher()
+            await self.accept()
+            heartbeat(self.driver_id)
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "driver_id"):
+            # Unpublished reports would mark the driver online again.
+            discard(self.driver_id)
+            await sync_to_async(self.go_offline, thread_sensitive=False)()
+
+    def go_offline(self):
+        mark_offline(self.driver_id)
+        driver_index.remove(self.driver_id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data)
+            if data.get("type") == "heartbeat":
+                heartbeat(self.driver_id)
+                return
+            lat, lng = float(data["lat"]), float(data["lng"])
+        except (TypeError, ValueError, KeyError, AttributeError):
+            await self.send(text_data=json.dumps({"status": "error", "message": "Expected {\"lat\": ..., \"lng\": ...} or {\"type\": \"heartbeat\"}"}))
+            return
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            await self.send(text_data=json.dumps({"status": "error", "message": "Coordinates out of range"}))
+            return
+
+        now = time.monotonic()
+        if now - self.last_report < settings.DRIVER_LOCATION_MIN_INTERVAL:
+            return
+        self.last_report = now
+        record(self.driver_id, lat, lng)
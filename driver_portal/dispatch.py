@@ -0,0 +1,218 @@
+"""
+Batched dispatch: every cycle matches all confirmed orders against all
+free drivers at once instead of first-come-first-served acceptance.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from account.models import UserAuth
+from common_portal.geo import haversine_matrix
+from common_portal.outbox import enqueue_many
+from customer_portal.acceptance import claim_orders
+from customer_portal.models import DeliveryRequest
+from customer_portal.transitions import ACTIVE_STATUSES, SYSTEM
+from customer_portal.feed import pending_order_index
+from .presence import online_driver_ids
+
+
+def hungarian(cost):
+    """
+    Minimum cost assignment for an n x m cost matrix with n <= m
+    (shortest augmenting path with potentials, O(n^2 m), inner loop vectorized).
+    Returns an array with the column assigned to every row.
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)  # p[j]: row (1-based) holding column j, 0 = free
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    assignment = np.full(n, -1, dtype=np.int64)
+    for j in range(1, m + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+
+def solve_optimal(cost, max_cost):
+    """(row, col) pairs minimising the total cost, pairs above max_cost are left out"""
+    n, m = cost.shape
+    if not n or not m:
+        return []
+    # Infeasible pairs get a cost no feasible solution can beat, then are dropped.
+    padded = np.where(cost <= max_cost, cost, max_cost * max(n, m) + 1)
+    if n <= m:
+        pairs = enumerate(hungarian(padded))
+    else:
+        pairs = ((row, col) for col, row in enumerate(hungarian(padded.T)))
+    return [(int(row), int(col)) for row, col in pairs if col >= 0 and cost[row, col] <= max_cost]
+
+
+def solve_greedy(rows, cols, costs):
+    """
+    Cheapest-pair-first matching over candidate (row, col, cost) arrays,
+    for batches too large for solve_optimal.
+    """
+    order = np.argsort(costs, kind='stable')
+    taken_rows, taken_cols = set(), set()
+    pairs = []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if row in taken_rows or col in taken_cols:
+            continue
+        taken_rows.add(row)
+        taken_cols.add(col)
+        pairs.append((row, col))
+    return pairs
+
+
+def pickup_cost_matrix(orders, drivers):
+    """Straight-line km from every driver to every order pickup, orders as rows"""
+    orders = np.asarray(orders, dtype=np.float64).reshape(-1, 2)
+    drivers = np.asarray(drivers, dtype=np.float64).reshape(-1, 2)
+    return haversine_matrix(orders[:, 0], orders[:, 1], drivers[:, 0], drivers[:, 1])
+
+
+def nearest_candidates(orders, drivers, k, max_cost, chunk=1000):
+    """
+    The k closest drivers of every order within max_cost as flat
+    (rows, cols, costs) arrays. Works in row blocks so the full
+    orders x drivers matrix never has to fit in memory.
+    """
+    orders = np.asarray(orders, dtype=np.float64).reshape(-1, 2)
+    drivers = np.asarray(drivers, dtype=np.float64).reshape(-1, 2)
+    k = min(k, len(drivers))
+    rows, cols, costs = [], [], []
+    for start in range(0, len(orders), chunk):
+        block = pickup_cost_matrix(orders[start:start + chunk], drivers)
+        nearest = np.argpartition(block, k - 1, axis=1)[:, :k] if k < block.shape[1] else np.tile(np.arange(block.shape[1]), (len(block), 1))
+        block_costs = np.take_along_axis(block, nearest, axis=1)
+        keep = block_costs <= max_cost
+        rows.append((np.nonzero(keep)[0] + start))
+        cols.append(nearest[keep])
+        costs.append(block_costs[keep])
+    if not rows:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(costs)
+
+
+def solve_assignment(orders, drivers, max_cost, method=None):
+    """
+    Match orders to drivers, both lists of (lat, lng), minimising pickup km.
+    ``method`` is 'optimal', 'greedy' or None to pick by batch size
+    (DISPATCH_OPTIMAL_MAX_SIZE). Returns ([(order_index, driver_index)], method).
+    """
+    if not len(orders) or not len(drivers):
+        return [], method
+    if method is None:
+        method = 'optimal' if max(len(orders), len(drivers)) <= settings.DISPATCH_OPTIMAL_MAX_SIZE else 'greedy'
+    if method == 'optimal':
+        return solve_optimal(pickup_cost_matrix(orders, drivers), max_cost), method
+    # Orders whose nearest drivers all went to others get another round
+    # against the drivers that are still free.
+    orders = np.asarray(orders, dtype=np.float64).reshape(-1, 2)
+    drivers = np.asarray(drivers, dtype=np.float64).reshape(-1, 2)
+    open_rows, open_cols = np.arange(len(orders)), np.arange(len(drivers))
+    pairs = []
+    for _ in range(settings.DISPATCH_GREEDY_ROUNDS):
+        rows, cols, costs = nearest_candidates(orders[open_rows], drivers[open_cols], settings.DISPATCH_GREEDY_CANDIDATES, max_cost)
+        matched = [(int(open_rows[row]), int(open_cols[col])) for row, col in solve_greedy(rows, cols, costs)]
+        if not matched:
+            break
+        pairs.extend(matched)
+        open_rows = np.setdiff1d(open_rows, [row for row, _ in matched])
+        open_cols = np.setdiff1d(open_cols, [col for _, col in matched])
+        if not len(open_rows) or not len(open_cols):
+            break
+    return pairs, method
+
+
+def load_batch(limit=None):
+    """Confirmed unassigned orders and online drivers without an active delivery"""
+    # Bundled orders are left to drivers accepting the whole bundle.
+    orders = DeliveryRequest.objects.filter(
+        status='confirmed', assign_driver__isnull=True, bundle__isnull=True,
+        pickup_location_lat__isnull=False, pickup_location_long__isnull=False,
+    ).order_by('created_at').values_list('id', 'pickup_location_lat', 'pickup_location_long')
+    if limit:
+        orders = orders[:limit]
+    busy = DeliveryRequest.objects.filter(status__in=ACTIVE_STATUSES, assign_driver__isnull=False).values('assign_driver')
+    drivers = UserAuth.objects.filter(
+        role='driver', is_active=True,
+        location_latitude__isnull=False, location_longitude__isnull=False,
+    ).exclude(id__in=busy).values_list('id', 'location_latitude', 'location_longitude')
+    online = online_driver_ids()
+    drivers = drivers.filter(is_online=True) if online is None else drivers.filter(id__in=online)
+    return list(orders), list(drivers)
+
+
+def apply_assignments(assignments):
+    """
+    Assign (order_id, driver_id) pairs in one transaction, together with
+    the customers' notifications. Each update only matches an order that is
+    still confirmed and unassigned, so a driver who accepted an order
+    manually in the meantime keeps it, and only a driver who is still free,
+    so a concurrent round or a manual accept never leaves one with two.
+    Returns the pairs that were applied.
+    """
+    applied = []
+    with transaction.atomic():
+        for order_id, driver_id in assignments:
+            if claim_orders(driver_id, role=SYSTEM, remark='dispatch', only_if_free=True, id=order_id):
+                applied.append((order_id, driver_id))
+        if applied:
+            customers = dict(DeliveryRequest.objects.filter(
+                id__in=[order_id for order_id, _ in applied]
+            ).values_list('id', 'customer_id'))
+            enqueue_many('notification', [
+                {"title": "Assign Driver", "message": "A driver has been assigned to your order.",
+                 "data": {"order_id": order_id}, "recipient_ids": customers[order_id]}
+                for order_id, _ in applied
+            ])
+    for order_id, _ in applied:
+        pending_order_index.remove(order_id)
+    return applied
+
+
+def run_cycle(max_pickup_km=None, method=None, limit=None):
+    """One dispatch cycle, returns a dict of counters for logging"""
+    max_pickup_km = max_pickup_km or settings.DISPATCH_MAX_PICKUP_KM
+    orders, drivers = load_batch(limit or settings.DISPATCH_BATCH_LIMIT)
+    stats = {"orders": len(orders), "drivers": len(drivers), "assigned": 0, "solve_seconds": 0.0, "method": None}
+    if not orders or not drivers:
+        return stats
+
+    start = time.perf_counter()
+    pairs, stats["method"] = solve_assignment([o[1:] for o in orders], [d[1:] for d in drivers], max_pickup_km, method)
+    stats["solve_seconds"] = time.perf_counter() - start
+
+    applied = apply_assignments([(orders[row][0], drivers[col][0]) for row, col in pairs])
+    stats["assigned"] = len(applied)
+    return stats
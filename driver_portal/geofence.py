@@ -0,0 +1,221 @@
+"""
+Pickup and drop geofences of active deliveries, checked against every
+published driver position.
+
+The fences of all active orders are kept as flat NumPy arrays sorted by
+driver and rebuilt every GEOFENCE_REFRESH_INTERVAL seconds with one query,
+so a batch of positions is matched to its drivers' fences with a
+searchsorted and checked with a single vectorized haversine, whatever the
+number of orders. A fence is entered within GEOFENCE_RADIUS_M and only
+left beyond GEOFENCE_RADIUS_M * GEOFENCE_EXIT_FACTOR, so GPS jitter at the
+edge does not fire events back and forth.
+
+Entering or leaving a fence moves the order on when its status allows it
+(RULES). Statuses in GEOFENCE_AUTO_STATUSES are applied right away, the
+others are suggested to the driver over the notifications socket.
+Transitions the table in customer_portal.transitions keeps for drivers,
+like delivered, are only ever suggested.
+
+Inside/outside state lives in the worker holding the driver's location
+socket, which is the only one evaluating that driver's positions.
+"""
+import logging
+import time
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from common_portal.geo import haversine
+from common_portal.outbox import enqueue
+from customer_portal.models import DeliveryRequest
+from customer_portal.transitions import STATUS_MESSAGES, SYSTEM, allowed, transition
+
+PICKUP, DROP = 0, 1
+FENCE_NAMES = {PICKUP: 'pickup', DROP: 'drop'}
+
+# (fence, event) -> (status the order must have, status it moves to)
+RULES = {
+    (PICKUP, 'enter'): ('assigned', 'picked_up'),
+    (PICKUP, 'exit'): ('picked_up', 'on_the_way'),
+    (DROP, 'enter'): ('on_the_way', 'delivered'),
+}
+
+# Which fences an order has in each status
+FENCE_STATUSES = {
+    PICKUP: ['assigned', 'picked_up'],
+    DROP: ['picked_up', 'on_the_way'],
+}
+
+logger = logging.getLogger(__name__)
+
+
+class FenceTable:
+    """Every active fence as parallel arrays, sorted by driver id"""
+
+    def __init__(self, rows=()):
+        rows = sorted(rows, key=lambda row: row[0])
+        self.driver_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.order_ids = [row[1] for row in rows]
+        self.customer_ids = [row[2] for row in rows]
+        self.statuses = [row[3] for row in rows]
+        self.kinds = np.array([row[4] for row in rows], dtype=np.int8)
+        self.lats = np.array([row[5] for row in rows], dtype=np.float64)
+        self.lngs = np.array([row[6] for row in rows], dtype=np.float64)
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.order_ids)
+
+    def rows_of(self, driver_ids):
+        """(fence row indexes, index into driver_ids of each row's driver)"""
+        driver_ids = np.asarray(driver_ids, dtype=np.int64)
+        starts = np.searchsorted(self.driver_ids, driver_ids, side='left')
+        ends = np.searchsorted(self.driver_ids, driver_ids, side='right')
+        counts = ends - starts
+        if not counts.any():
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        owners = np.repeat(np.arange(len(driver_ids)), counts)
+        # Position of every row within its driver's run, added to the run's start
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(starts, counts) + offsets, owners
+
+
+def load_fences():
+    rows = []
+    orders = DeliveryRequest.objects.filter(
+        assign_driver__isnull=False,
+        status__in=set(FENCE_STATUSES[PICKUP]) | set(FENCE_STATUSES[DROP]),
+    ).values_list(
+        'assign_driver_id', 'id', 'customer_id', 'status',
+        'pickup_location_lat', 'pickup_location_long', 'delivery_location_lat', 'delivery_location_long',
+    )
+    for driver_id, order_id, customer_id, status, pickup_lat, pickup_lng, drop_lat, drop_lng in orders:
+        if status in FENCE_STATUSES[PICKUP] and pickup_lat is not None and pickup_lng is not None:
+            rows.append((driver_id, order_id, customer_id, status, PICKUP, pickup_lat, pickup_lng))
+        if status in FENCE_STATUSES[DROP] and drop_lat is not None and drop_lng is not None:
+            rows.append((driver_id, order_id, customer_id, status, DROP, drop_lat, drop_lng))
+    return FenceTable(rows)
+
+
+_table = None
+_inside = {}  # (order_id, fence kind) -> True while the driver is inside
+
+
+def fences():
+    global _table
+    if _table is None or time.monotonic() - _table.built_at >= settings.GEOFENCE_REFRESH_INTERVAL:
+        _table = load_fences()
+        live = {(order_id, int(kind)) for order_id, kind in zip(_table.order_ids, _table.kinds)}
+        for key in list(_inside):
+            if key not in live:
+                del _inside[key]
+    return _table
+
+
+def reset_fences():
+    """Rebuild the fences on the next check, after statuses changed"""
+    global _table
+    _table = None
+
+
+def detect(positions):
+    """
+    Fence crossings of {driver_id: (lat, lng, timestamp)}.
+    Returns [(driver_id, fence row, 'enter' | 'exit')].
+    """
+    table = fences()
+    if not positions or not len(table):
+        return []
+    driver_ids = list(positions)
+    rows, owners = table.rows_of(driver_ids)
+    if not len(rows):
+        return []
+    points = np.array([positions[driver_id][:2] for driver_id in driver_ids], dtype=np.float64)
+    distances_m = haversine(points[owners, 0], points[owners, 1], table.lats[rows], table.lngs[rows]) * 1000
+    radius = settings.GEOFENCE_RADIUS_M
+    exit_radius = radius * settings.GEOFENCE_EXIT_FACTOR
+
+    events = []
+    for row, owner, distance_m in zip(rows.tolist(), owners.tolist(), distances_m.tolist()):
+        key = (table.order_ids[row], int(table.kinds[row]))
+        was_inside = _inside.get(key)
+        if was_inside:
+            if distance_m > exit_radius:
+                _inside[key] = False
+                events.append((driver_ids[owner], row, 'exit'))
+        elif distance_m <= radius:
+            _inside[key] = True
+            events.append((driver_ids[owner], row, 'enter'))
+        elif was_inside is None:
+            # First position seen outside, leaving is only reported after being inside
+            _inside[key] = False
+    return events
+
+
+def apply_transition(order_id, driver_id, customer_id, from_status, to_status):
+    """
+    Move the order on if it still has from_status and driver, and queue the
+    customer's notification with it. Returns True when it did.
+    """
+    with transaction.atomic():
+        done = transition(
+            order_id, from_status, to_status, SYSTEM, remark='geofence', match={'assign_driver_id': driver_id}
+        )
+        if done:
+            enqueue(
+                'notification', title="Oder Update", message=STATUS_MESSAGES[to_status],
+                data={"order_id": order_id}, recipient_ids=customer_id,
+            )
+    return done
+
+
+def push_event(driver_id, order_id, fence, event, status, applied):
+    async_to_sync(get_channel_layer().group_send)(
+        f"user_{driver_id}_notifications",
+        {
+            "type": "send_geofence_event",
+            "order_id": order_id,
+            "fence": fence,
+            "event": event,
+            "status": status,
+            "applied": applied,
+        }
+    )
+
+
+def check_positions(positions):
+    """
+    Run the geofences over a batch of published positions, apply or suggest
+    the transitions they trigger. Returns the number of transitions applied.
+    """
+    events = detect(positions)
+    if not events:
+        return 0
+    table = _table
+    auto = set(settings.GEOFENCE_AUTO_STATUSES)
+    applied = 0
+    for driver_id, row, event in events:
+        kind = int(table.kinds[row])
+        rule = RULES.get((kind, event))
+        if rule is None or table.statuses[row] != rule[0]:
+            continue
+        from_status, to_status = rule
+        order_id = table.order_ids[row]
+        done = (
+            to_status in auto and allowed(from_status, to_status, SYSTEM)
+            and apply_transition(order_id, driver_id, table.customer_ids[row], from_status, to_status)
+        )
+        if done:
+            applied += 1
+            table.statuses[row] = to_status
+        try:
+            push_event(driver_id, order_id, FENCE_NAMES[kind], event, to_status, done)
+        except Exception:
+            # Suggestions are only of use right away, they are not queued
+            logger.exception("Geofence push failed")
+    if applied:
+        reset_fences()
+    return applied
@@ -0,0 +1,127 @@
+"""
+Live ETA of orders that are on the way, pushed to the customer's
+notifications socket as the driver moves.
+
+A full routing lookup from the driver's position runs at most every
+LIVE_ETA_ROUTE_INTERVAL seconds per order. In between, the last routed
+ETA is scaled by how much of the straight-line distance is left, which
+needs no network call. The lookups of one position report share
+LIVE_ETA_ROUTING_BUDGET seconds, the local estimate answers once it is
+spent and the order is routed again at the next check. A new ETA is only
+pushed when it moved by at least LIVE_ETA_MIN_CHANGE_MINUTES.
+"""
+import json
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+from common_portal.redis_client import get_redis, redis_failed
+from common_portal.utils import calculate_distance, calculate_distance_and_time
+from customer_portal.models import DeliveryRequest
+
+_local_state = {}
+_local_lock = threading.Lock()
+
+
+def _state_key(driver_id):
+    return f"live_eta:{driver_id}"
+
+
+def load_state(driver_id):
+    client = get_redis()
+    if client is not None:
+        try:
+            raw = client.get(_state_key(driver_id))
+            return json.loads(raw) if raw else {}
+        except Exception as e:
+            redis_failed(e)
+    with _local_lock:
+        return dict(_local_state.get(driver_id, {}))
+
+
+def save_state(driver_id, state):
+    client = get_redis()
+    if client is not None:
+        try:
+            client.set(_state_key(driver_id), json.dumps(state), ex=settings.LIVE_ETA_STATE_TTL)
+            return
+        except Exception as e:
+            redis_failed(e)
+    with _local_lock:
+        _local_state[driver_id] = state
+
+
+def estimate(order_state, lat, lng, drop, now, timeout=None):
+    """
+    (distance_km, minutes) from (lat, lng) to the drop, routed within
+    ``timeout`` seconds when the last routed value is too old, else scaled
+    from it. Updates order_state in place.
+    """
+    straight_km = calculate_distance(lat, lng, drop[0], drop[1])
+    routed_at = order_state.get('routed_at')
+    if routed_at is None or now - routed_at >= settings.LIVE_ETA_ROUTE_INTERVAL or not order_state.get('routed_straight_km'):
+        distance_km, minutes, route = calculate_distance_and_time(lat, lng, drop[0], drop[1], timeout=timeout, with_route=True)
+        if distance_km is None:
+            return None, None
+        # A local estimate is not a route, try routing again at the next check.
+        order_state.update(routed_at=None if route.approximate else now, routed_straight_km=straight_km, routed_km=distance_km, routed_minutes=minutes)
+        return distance_km, minutes
+    share = min(straight_km / order_state['routed_straight_km'], 1.0)
+    return round(order_state['routed_km'] * share, 2), order_state['routed_minutes'] * share
+
+
+def push_eta(customer_id, order_id, distance_km, minutes):
+    now = timezone.now()
+    async_to_sync(get_channel_layer().group_send)(
+        f"user_{customer_id}_notifications",
+        {
+            "type": "send_eta_update",
+            "order_id": order_id,
+            "distance_km": distance_km,
+            "eta_minutes": round(minutes),
+            "arrives_at": (now + timedelta(minutes=minutes)).isoformat(),
+            "updated_at": now.isoformat(),
+        }
+    )
+
+
+def refresh_live_eta(driver_id, lat, lng, budget=None):
+    """
+    Called with every position a driver reports. Does nothing until
+    LIVE_ETA_MIN_INTERVAL seconds passed since the last check of this driver.
+    Routing lookups share ``budget`` seconds (LIVE_ETA_ROUTING_BUDGET by default).
+    Returns the number of ETA updates pushed.
+    """
+    deadline = time.monotonic() + (settings.LIVE_ETA_ROUTING_BUDGET if budget is None else budget)
+    now = time.time()
+    state = load_state(driver_id)
+    if now - state.get('checked_at', 0) < settings.LIVE_ETA_MIN_INTERVAL:
+        return 0
+    orders = list(DeliveryRequest.objects.filter(
+        assign_driver_id=driver_id, status='on_the_way',
+        delivery_location_lat__isnull=False, delivery_location_long__isnull=False,
+    ).values_list('id', 'customer_id', 'delivery_location_lat', 'delivery_location_long'))
+
+    previous = state.get('orders', {})
+    state = {'checked_at': now, 'orders': {}}
+    pushed = 0
+    for order_id, customer_id, drop_lat, drop_lng in orders:
+        order_state = previous.get(order_id, {})
+        distance_km, minutes = estimate(order_state, lat, lng, (drop_lat, drop_lng), now, timeout=max(deadline - time.monotonic(), 0))
+        if minutes is not None:
+            last = order_state.get('pushed_minutes')
+            if last is None or abs(minutes - last) >= settings.LIVE_ETA_MIN_CHANGE_MINUTES:
+                try:
+                    push_eta(customer_id, order_id, distance_km, minutes)
+                    order_state['pushed_minutes'] = minutes
+                    pushed += 1
+                except Exception:
+                    pass
+        state['orders'][order_id] = order_state
+    save_state(driver_id, state)
+    return pushed
@@ -0,0 +1,265 @@
+"""
+Driver positions reported over the location socket.
+
+Reports only touch an in-process dict, so the socket path never blocks on
+I/O and a driver reporting every second costs nothing extra. A background
+task per worker publishes the latest position of every driver to Redis,
+the driver index and the tracking sockets of the driver's orders every
+DRIVER_LOCATION_PUBLISH_INTERVAL seconds, and
+writes them through to UserAuth every DRIVER_LOCATION_FLUSH_INTERVAL
+seconds in batched UPDATEs, whatever the report rate. Every published
+position is also kept for the tracks of the driver's active deliveries and
+checked against the geofences of their pickups and drops. A flush that
+fails puts what it took back, the next one writes it.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+
+from account.models import UserAuth
+from common_portal.redis_client import get_redis, redis_failed
+from customer_portal.models import DeliveryRequest
+from customer_portal.tracking import broadcast_positions
+from customer_portal.tracks import append_points
+from .geofence import check_positions
+from .live_eta import refresh_live_eta
+from .locations import driver_index
+from .presence import mark_online
+
+POSITIONS_KEY = 'driver:locations'  # hash driver_id -> "lat,lng,timestamp"
+DIRTY_KEY = 'driver:locations:dirty'  # drivers whose position is not in the database yet
+
+_pending = {}  # driver_id -> (lat, lng, timestamp), reported since the last publish
+_heartbeats = set()  # drivers that sent a heartbeat since the last publish
+_unsaved = {}  # same, kept here instead of Redis while it is unreachable
+_unsaved_lock = threading.Lock()
+_track_points = {}  # driver_id -> [(lat, lng, timestamp)] not yet added to delivery tracks
+_flushers = set()
+
+logger = logging.getLogger(__name__)
+
+
+def record(driver_id, lat, lng):
+    """Keep the latest report of a driver, older unpublished ones are dropped"""
+    _pending[driver_id] = (lat, lng, time.time())
+
+
+def heartbeat(driver_id):
+    """The driver's app is alive, also without a new position"""
+    _heartbeats.add(driver_id)
+
+
+def discard(driver_id):
+    """Forget what a driver reported since the last publish, for drivers going offline"""
+    _pending.pop(driver_id, None)
+    _heartbeats.discard(driver_id)
+
+
+def take_pending():
+    global _pending, _heartbeats
+    pending, _pending = _pending, {}
+    heartbeats, _heartbeats = _heartbeats, set()
+    return pending, heartbeats
+
+
+def publish(pending=None, heartbeats=()):
+    """
+    Move the pending reports to Redis and the driver index and renew the
+    presence of every driver heard from. Returns the number of positions.
+    The flusher takes ``pending`` on the event loop, so reports never race the swap.
+    """
+    if pending is None:
+        pending, heartbeats = take_pending()
+    if not pending:
+        if heartbeats:
+            mark_online(heartbeats)
+        return 0
+    with _unsaved_lock:
+        for driver_id, point in pending.items():
+            _track_points.setdefault(driver_id, []).append(point)
+    driver_index.update_many((driver_id, lat, lng) for driver_id, (lat, lng, _) in pending.items())
+    client = get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.hset(POSITIONS_KEY, mapping={driver_id: f"{lat},{lng},{at}" for driver_id, (lat, lng, at) in pending.items()})
+            pipe.sadd(DIRTY_KEY, *pending)
+            mark_online(set(pending) | set(heartbeats), pipe)
+            pipe.execute()
+            return len(pending)
+        except Exception as e:
+            redis_failed(e)
+    with _unsaved_lock:
+        _unsaved.update(pending)
+    return len(pending)
+
+
+def latest_position(driver_id):
+    """(lat, lng, timestamp) of the last report of a driver, or None"""
+    if driver_id in _pending:
+        return _pending[driver_id]
+    client = get_redis()
+    if client is not None:
+        try:
+            raw = client.hget(POSITIONS_KEY, driver_id)
+            if raw:
+                lat, lng, at = raw.split(',')
+                return float(lat), float(lng), float(at)
+        except Exception as e:
+            redis_failed(e)
+    with _unsaved_lock:
+        return _unsaved.get(driver_id)
+
+
+def _take_unsaved():
+    """
+    Positions waiting for the database, taken out of Redis and the local
+    buffer. Returns (positions, ids of those that came from Redis).
+    """
+    positions, ids = {}, []
+    client = get_redis()
+    if client is not None:
+        try:
+            # SPOP hands every driver to exactly one of the workers flushing at the same time.
+            ids = client.spop(DIRTY_KEY, settings.DRIVER_LOCATION_FLUSH_BATCH * 10) or []
+            if ids:
+                for driver_id, raw in zip(ids, client.hmget(POSITIONS_KEY, ids)):
+                    if raw:
+                        lat, lng, at = raw.split(',')
+                        positions[int(driver_id)] = (float(lat), float(lng), float(at))
+        except Exception as e:
+            redis_failed(e)
+    with _unsaved_lock:
+        local = dict(_unsaved)
+        _unsaved.clear()
+    # A position kept here during a Redis outage may be older than the one
+    # Redis has for the same driver, the newest report wins.
+    newer_here = {
+        driver_id for driver_id, position in local.items()
+        if driver_id not in positions or position[2] > positions[driver_id][2]
+    }
+    positions.update((driver_id, local[driver_id]) for driver_id in newer_here)
+    return positions, [driver_id for driver_id in ids if int(driver_id) not in newer_here]
+
+
+def _restore_unsaved(positions, ids):
+    """Put positions taken by _take_unsaved back, newer reports that came in since win"""
+    requeued = set()
+    client = get_redis()
+    if client is not None and ids:
+        try:
+            client.sadd(DIRTY_KEY, *ids)
+            requeued = {int(driver_id) for driver_id in ids}
+        except Exception as e:
+            redis_failed(e)
+    with _unsaved_lock:
+        for driver_id, position in positions.items():
+            if driver_id in requeued:
+                continue
+            newer = _unsaved.get(driver_id)
+            if newer is None or newer[2] < position[2]:
+                _unsaved[driver_id] = position
+
+
+def _restore_track_points(track_points):
+    with _unsaved_lock:
+        for driver_id, points in track_points.items():
+            _track_points[driver_id] = points + _track_points.get(driver_id, [])
+
+
+def flush():
+    """Write the buffered positions to UserAuth and the delivery tracks. Returns the number of drivers written."""
+    global _track_points
+    with _unsaved_lock:
+        track_points, _track_points = _track_points, {}
+    if track_points:
+        try:
+            append_points(track_points)
+        except Exception:
+            # Kept for the next flush, the positions below are written regardless.
+            _restore_track_points(track_points)
+            logger.exception("Adding track points failed")
+
+    positions, ids = _take_unsaved()
+    if not positions:
+        return 0
+    # One prepared UPDATE executed per batch. bulk_update() builds a CASE
+    # expression per row and spends far longer in Python than in the database.
+    quote = connection.ops.quote_name
+    meta = UserAuth._meta
+    sql = "UPDATE {} SET {} = %s, {} = %s WHERE {} = %s".format(
+        quote(meta.db_table),
+        quote(meta.get_field('location_latitude').column),
+        quote(meta.get_field('location_longitude').column),
+        quote(meta.pk.column),
+    )
+    rows = [(lat, lng, driver_id) for driver_id, (lat, lng, _) in positions.items()]
+    batch = settings.DRIVER_LOCATION_FLUSH_BATCH
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(rows), batch):
+                cursor.executemany(sql, rows[start:start + batch])
+    except Exception:
+        _restore_unsaved(positions, ids)
+        raise
+
+    # Live ETAs only concern drivers with an order on the way. Their routing
+    # lookups share one budget, the local estimate answers after.
+    deadline = time.monotonic() + settings.LIVE_ETA_FLUSH_BUDGET
+    moving = DeliveryRequest.objects.filter(
+        assign_driver_id__in=list(positions), status='on_the_way'
+    ).values_list('assign_driver_id', flat=True).distinct()
+    for driver_id in moving:
+        lat, lng, _ = positions[driver_id]
+        refresh_live_eta(driver_id, lat, lng, budget=max(deadline - time.monotonic(), 0))
+    return len(rows)
+
+
+async def publish_round(flush_due=False):
+    """
+    One round of the flusher. The reports are published first, so presence
+    is renewed whatever fails after, and each later step runs on its own.
+    """
+    pending, heartbeats = take_pending()
+    try:
+        await sync_to_async(publish, thread_sensitive=False)(pending, heartbeats)
+    except Exception:
+        logger.exception("Publishing driver locations failed")
+    if pending:
+        try:
+            await broadcast_positions(pending)
+        except Exception:
+            logger.exception("Broadcasting driver locations failed")
+        try:
+            await database_sync_to_async(check_positions)(pending)
+        except Exception:
+            logger.exception("Geofence check failed")
+    if flush_due:
+        try:
+            await database_sync_to_async(flush)()
+        except Exception:
+            logger.exception("Driver location flush failed")
+
+
+async def run_flusher():
+    last_flush = time.monotonic()
+    while True:
+        await asyncio.sleep(settings.DRIVER_LOCATION_PUBLISH_INTERVAL)
+        flush_due = time.monotonic() - last_flush >= settings.DRIVER_LOCATION_FLUSH_INTERVAL
+        if flush_due:
+            last_flush = time.monotonic()
+        await publish_round(flush_due)
+
+
+def ensure_flusher():
+    """Start the background flusher of this worker's event loop once"""
+    loop = asyncio.get_running_loop()
+    if loop not in _flushers:
+        _flushers.add(loop)
+        loop.create_task(run_flusher())
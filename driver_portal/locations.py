@@ -0,0 +1,57 @@
+from account.models import UserAuth
+from common_portal.spatial import SpatialIndex
+from .live_eta import refresh_live_eta
+from .presence import mark_offline, mark_online
+
+
+def _online_driver_positions():
+    return UserAuth.objects.filter(
+        role='driver', is_online=True, location_latitude__isnull=False, location_longitude__isnull=False
+    ).values_list('id', 'location_latitude', 'location_longitude')
+
+
+# Latest position of every online driver
+driver_index = SpatialIndex('drivers', loader=_online_driver_positions)
+
+
+def update_driver_position(driver):
+    """
+    Keep the index and presence in step with a driver's saved location and
+    online flag. Going online or reporting a location over HTTP renews the
+    presence like the location socket does, or the next presence sync would
+    take the driver offline again.
+    """
+    if driver.role != 'driver':
+        return
+    if not driver.is_online:
+        driver_index.remove(driver.id)
+        mark_offline(driver.id)
+        return
+    mark_online([driver.id])
+    if driver.location_latitude is not None and driver.location_longitude is not None:
+        driver_index.update(driver.id, float(driver.location_latitude), float(driver.location_longitude))
+        refresh_live_eta(driver.id, float(driver.location_latitude), float(driver.location_longitude))
+    else:
+        driver_index.remove(driver.id)
+
+
+def driver_position(driver):
+    """Last reported (lat, lng) of a driver, from the index or the saved profile"""
+    position = driver_index.position(driver.id)
+    if position is None and driver.location_latitude is not None and driver.location_longitude is not None:
+        position = (driver.location_latitude, driver.location_longitude)
+    return position
+
+
+def nearest_drivers(lat, lng, k=10, max_radius_km=None):
+    """The k closest online drivers as [(driver_id, distance_km)]"""
+    return [(int(member), distance) for member, distance in driver_index.nearest(lat, lng, k, max_radius_km)]
+
+
+def drivers_within(lat, lng, radius_km, limit=None):
+    """Online drivers within radius_km as [(driver_id, distance_km)], closest first"""
+    return [(int(member), distance) for member, distance in driver_index.within(lat, lng, radius_km, limit)]
+
+
+def rebuild_driver_index():
+    return driver_index.rebuild(_online_driver_positions())
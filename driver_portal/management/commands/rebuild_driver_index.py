@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from driver_portal.locations import rebuild_driver_index
+
+
+class Command(BaseCommand):
+    help = "Reload the spatial index of online drivers from the database."
+
+    def handle(self, *args, **options):
+        count = rebuild_driver_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} online drivers."))
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from driver_portal.dispatch import run_cycle
+
+
+class Command(BaseCommand):
+    help = "Assign confirmed orders to free drivers in batches every few seconds."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run a single cycle and exit.")
+        parser.add_argument('--interval', type=float, default=None, help="Seconds between cycles.")
+        parser.add_argument('--method', choices=['optimal', 'greedy'], default=None)
+        parser.add_argument('--force', action='store_true', help="Run even when DISPATCH_ENABLED is off.")
+
+    def handle(self, *args, **options):
+        if not settings.DISPATCH_ENABLED and not options['force']:
+            self.stdout.write(self.style.WARNING("DISPATCH_ENABLED is off, nothing to do (use --force to run anyway)."))
+            return
+        interval = options['interval'] or settings.DISPATCH_INTERVAL_SECONDS
+        while True:
+            started = time.monotonic()
+            stats = run_cycle(method=options['method'])
+            if stats['orders']:
+                self.stdout.write(
+                    f"{stats['orders']} orders, {stats['drivers']} drivers, {stats['assigned']} assigned "
+                    f"({stats['method']}, solved in {stats['solve_seconds'] * 1000:.0f} ms)"
+                )
+            if options['once']:
+                break
+            time.sleep(max(interval - (time.monotonic() - started), 0))
@@ -0,0 +1,57 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from common_portal.geo import haversine
+from driver_portal.dispatch import solve_assignment
+
+
+class Command(BaseCommand):
+    help = "Replay a dispatch scenario offline and report pickup distance and solve time per solver."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--drivers-ratio', type=float, default=1.0, help="Drivers per order.")
+        parser.add_argument('--max-pickup-km', type=float, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--scenario', help="JSON file with {\"orders\": [[lat, lng], ...], \"drivers\": [...]} to replay.")
+        parser.add_argument('--save-scenario', help="Write the generated scenario to this JSON file.")
+        parser.add_argument('--optimal-limit', type=int, default=2000, help="Skip the optimal solver above this size.")
+
+    def scenarios(self, options):
+        if options['scenario']:
+            with open(options['scenario']) as f:
+                data = json.load(f)
+            yield np.array(data['orders']), np.array(data['drivers'])
+            return
+        rng = np.random.default_rng(options['seed'])
+        for count in options['orders']:
+            drivers = int(count * options['drivers_ratio'])
+            # Uniform over a city sized area (Chattogram)
+            orders = np.column_stack([rng.uniform(22.25, 22.45, count), rng.uniform(91.75, 91.90, count)])
+            drivers = np.column_stack([rng.uniform(22.25, 22.45, drivers), rng.uniform(91.75, 91.90, drivers)])
+            if options['save_scenario']:
+                with open(options['save_scenario'], 'w') as f:
+                    json.dump({"orders": orders.tolist(), "drivers": drivers.tolist()}, f)
+            yield orders, drivers
+
+    def handle(self, *args, **options):
+        for orders, drivers in self.scenarios(options):
+            self.stdout.write(f"{len(orders)} orders, {len(drivers)} drivers")
+            for method in ['optimal', 'greedy']:
+                if method == 'optimal' and max(len(orders), len(drivers)) > options['optimal_limit']:
+                    self.stdout.write(f"  {method:8} skipped (above --optimal-limit)")
+                    continue
+                start = time.perf_counter()
+                pairs, _ = solve_assignment(orders, drivers, options['max_pickup_km'], method)
+                seconds = time.perf_counter() - start
+                rows = [row for row, _ in pairs]
+                cols = [col for _, col in pairs]
+                distances = haversine(orders[rows, 0], orders[rows, 1], drivers[cols, 0], drivers[cols, 1])
+                average = float(distances.mean()) if len(pairs) else 0
+                self.stdout.write(
+                    f"  {method:8} assigned {len(pairs):6}  avg pickup {average:6.3f} km  "
+                    f"total {float(distances.sum()):10.1f} km  solve {seconds * 1000:8.0f} ms"
+                )
@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from driver_portal.presence import sync_presence
+
+
+class Command(BaseCommand):
+    help = "Copy driver presence from Redis heartbeats to UserAuth.is_online."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Sync once and exit.")
+        parser.add_argument('--interval', type=float, default=None, help="Seconds between syncs.")
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or settings.PRESENCE_SYNC_INTERVAL
+        while True:
+            started = time.monotonic()
+            result = sync_presence()
+            if result is None:
+                self.stdout.write(self.style.WARNING("Redis is unreachable, is_online left as it is."))
+            elif any(result):
+                self.stdout.write(f"{result[0]} drivers went online, {result[1]} went offline")
+            if options['once']:
+                break
+            time.sleep(max(interval - (time.monotonic() - started), 0))
@@ -0,0 +1,105 @@
+"""
+Driver presence from location socket heartbeats.
+
+A driver is online while the Redis key presence:<id> exists. Every report
+or heartbeat on the socket renews it for PRESENCE_TTL seconds, so a driver
+whose app died drops out on its own. The is_online column is only synced
+from here now and then (sync_driver_presence); it is what callers fall back
+on while Redis is unreachable, since presence kept in one process would be
+wrong for every other one.
+"""
+import time
+
+from django.conf import settings
+
+from account.models import UserAuth
+from common_portal.redis_client import get_redis, redis_failed
+
+KEY_PREFIX = 'presence:'
+
+
+def _key(driver_id):
+    return f"{KEY_PREFIX}{driver_id}"
+
+
+def mark_online(driver_ids, pipe=None):
+    """Renew the presence of drivers, queued on ``pipe`` when given, else sent right away"""
+    if pipe is not None:
+        now = int(time.time())
+        for driver_id in driver_ids:
+            pipe.set(_key(driver_id), now, ex=settings.PRESENCE_TTL)
+        return True
+    client = get_redis()
+    if client is None:
+        return False
+    try:
+        pipe = client.pipeline(transaction=False)
+        mark_online(driver_ids, pipe)
+        pipe.execute()
+        return True
+    except Exception as e:
+        redis_failed(e)
+        return False
+
+
+def mark_offline(driver_id):
+    client = get_redis()
+    if client is not None:
+        try:
+            client.delete(_key(driver_id))
+        except Exception as e:
+            redis_failed(e)
+
+
+def online_among(driver_ids):
+    """
+    The subset of driver_ids that is online, in one round trip.
+    None while Redis is unreachable, callers then use the is_online column.
+    """
+    driver_ids = list(driver_ids)
+    if not driver_ids:
+        return set()
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        seen = client.mget([_key(driver_id) for driver_id in driver_ids])
+    except Exception as e:
+        redis_failed(e)
+        return None
+    return {driver_id for driver_id, value in zip(driver_ids, seen) if value is not None}
+
+
+def is_online(driver):
+    online = online_among([driver.id])
+    return driver.is_online if online is None else driver.id in online
+
+
+def online_driver_ids():
+    """Every online driver id, or None while Redis is unreachable"""
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        return {int(key[len(KEY_PREFIX):]) for key in client.scan_iter(match=f"{KEY_PREFIX}*", count=1000)}
+    except Exception as e:
+        redis_failed(e)
+        return None
+
+
+def sync_presence():
+    """
+    Write presence back to UserAuth.is_online and drop offline drivers from
+    the driver index. Returns (went online, went offline), or None without Redis.
+    """
+    from .locations import driver_index
+
+    online = online_driver_ids()
+    if online is None:
+        return None
+    went_online = UserAuth.objects.filter(role='driver', is_online=False, id__in=online).update(is_online=True)
+    stale = list(UserAuth.objects.filter(role='driver', is_online=True).exclude(id__in=online).values_list('id', flat=True))
+    went_offline = UserAuth.objects.filter(id__in=stale).update(is_online=False)
+    for driver_id in stale:
+        driver_index.remove(driver_id)
+    return went_online, went_offline
@@ -0,0 +1,186 @@
+"""
+Stop sequencing for a driver holding several deliveries: nearest-neighbour
+construction followed by 2-opt, or-opt and exchange moves, then random
+restarts, all respecting pickup-before-drop, within a time budget.
+Distances between the stops get a budget of their own, pairs the routing
+API did not answer in time use the local estimate.
+"""
+import random
+import time
+
+from django.conf import settings
+
+from common_portal.utils import calculate_distance_matrix
+
+
+class Stop:
+    def __init__(self, order_id, kind, lat, lng):
+        self.order_id = order_id
+        self.kind = kind  # 'pickup' or 'drop'
+        self.lat = lat
+        self.lng = lng
+
+
+ON_BOARD_STATUSES = ['picked_up', 'on_the_way']
+
+
+def build_stops(orders):
+    """Pickup and drop stop of every order, only the drop once the parcel is on board"""
+    stops = []
+    for order in orders:
+        if order.status not in ON_BOARD_STATUSES:
+            stops.append(Stop(order.id, 'pickup', order.pickup_location_lat, order.pickup_location_long))
+        stops.append(Stop(order.id, 'drop', order.delivery_location_lat, order.delivery_location_long))
+    return stops
+
+
+def _precedence(stops):
+    """drop stop index -> index of its pickup stop, for orders with both"""
+    pickups = {stop.order_id: i for i, stop in enumerate(stops) if stop.kind == 'pickup'}
+    return {i: pickups[stop.order_id] for i, stop in enumerate(stops) if stop.kind == 'drop' and stop.order_id in pickups}
+
+
+def _feasible(route, precedence):
+    position = {node: i for i, node in enumerate(route)}
+    return all(position[pickup] < position[drop] for drop, pickup in precedence.items())
+
+
+def _length(route, cost):
+    # Node 0 is the driver's position, the route is open (no return leg).
+    total = cost[0][route[0]] if route else 0
+    for a, b in zip(route, route[1:]):
+        total += cost[a][b]
+    return total
+
+
+def _build(precedence, count, choose):
+    route, visited, current = [], set(), 0
+    while len(route) < count:
+        candidates = [
+            node for node in range(1, count + 1)
+            if node not in visited and (node not in precedence or precedence[node] in visited)
+        ]
+        current = choose(current, candidates)
+        route.append(current)
+        visited.add(current)
+    return route
+
+
+def nearest_neighbour(cost, precedence, count):
+    return _build(precedence, count, lambda current, candidates: min(candidates, key=lambda node: cost[current][node]))
+
+
+def random_route(precedence, count, rng):
+    return _build(precedence, count, lambda current, candidates: rng.choice(candidates))
+
+
+def improve(route, cost, precedence, deadline):
+    """2-opt, or-opt and exchange moves until none helps or the deadline passes"""
+    best = _length(route, cost)
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        n = len(route)
+        # 2-opt: reverse route[i:j]
+        for i in range(n - 1):
+            for j in range(i + 2, n + 1):
+                candidate = route[:i] + route[i:j][::-1] + route[j:]
+                length = _length(candidate, cost)
+                if length < best - 1e-9 and _feasible(candidate, precedence):
+                    route, best, improved = candidate, length, True
+            if time.monotonic() >= deadline:
+                return route
+        # or-opt: move a segment of 1-3 stops elsewhere
+        for size in (1, 2, 3):
+            for i in range(n - size + 1):
+                segment = route[i:i + size]
+                rest = route[:i] + route[i + size:]
+                for k in range(len(rest) + 1):
+                    if k == i:
+                        continue
+                    candidate = rest[:k] + segment + rest[k:]
+                    length = _length(candidate, cost)
+                    if length < best - 1e-9 and _feasible(candidate, precedence):
+                        route, best, improved = candidate, length, True
+                        break
+            if time.monotonic() >= deadline:
+                return route
+        # exchange: swap two stops, reaches orders the precedence blocks 2-opt from
+        for i in range(n - 1):
+            for j in range(i + 1, n):
+                candidate = route[:]
+                candidate[i], candidate[j] = candidate[j], candidate[i]
+                length = _length(candidate, cost)
+                if length < best - 1e-9 and _feasible(candidate, precedence):
+                    route, best, improved = candidate, length, True
+            if time.monotonic() >= deadline:
+                return route
+    return route
+
+
+def sequence_stops(start, stops, time_budget=None):
+    """
+    Order ``stops`` starting from ``start`` (lat, lng), in at most
+    ROUTE_SEQUENCING_MATRIX_TIMEOUT plus ``time_budget`` seconds.
+    Returns (stops in travel order, leg km list, leg minutes list).
+    """
+    if not stops:
+        return [], [], []
+    points = [start] + [(stop.lat, stop.lng) for stop in stops]
+    matrix = calculate_distance_matrix(points, points, timeout=settings.ROUTE_SEQUENCING_MATRIX_TIMEOUT)
+    deadline = time.monotonic() + (time_budget or settings.ROUTE_SEQUENCING_TIME_BUDGET)
+    # Unroutable pairs should never be chosen while another option exists.
+    distances = [[km if km is not None else float('inf') for km, _ in row] for row in matrix]
+    for i in range(len(points)):
+        distances[i][i] = 0
+
+    precedence = {drop + 1: pickup + 1 for drop, pickup in _precedence(stops).items()}
+    route = improve(nearest_neighbour(distances, precedence, len(stops)), distances, precedence, deadline)
+    # Local search stops in local optima, spend what is left of the budget
+    # on a few restarts from random feasible orders.
+    best = _length(route, distances)
+    rng = random.Random(0)
+    for _ in range(settings.ROUTE_SEQUENCING_RESTARTS):
+        if time.monotonic() >= deadline:
+            break
+        candidate = improve(random_route(precedence, len(stops), rng), distances, precedence, deadline)
+        length = _length(candidate, distances)
+        if length < best - 1e-9:
+            route, best = candidate, length
+
+    legs_km, legs_minutes = [], []
+    previous = 0
+    for node in route:
+        km, minutes = matrix[previous][node]
+        if km == 0:
+            minutes = 0  # same spot, e.g. the driver is already at the pickup
+        legs_km.append(km)
+        legs_minutes.append(minutes)
+        previous = node
+    return [stops[node - 1] for node in route], legs_km, legs_minutes
+
+
+def plan_route(start, orders, time_budget=None):
+    """The response payload of the driver route endpoint"""
+    stops, legs_km, legs_minutes = sequence_stops(start, build_stops(orders), time_budget)
+    elapsed = 0
+    total_km = 0
+    sequence = []
+    for stop, km, minutes in zip(stops, legs_km, legs_minutes):
+        total_km += km or 0
+        elapsed += (minutes or 0)
+        sequence.append({
+            "order_id": stop.order_id,
+            "type": stop.kind,
+            "lat": stop.lat,
+            "lng": stop.lng,
+            "leg_km": km,
+            "eta_minutes": elapsed,
+        })
+        elapsed += settings.ROUTE_STOP_MINUTES
+    return {
+        "start": {"lat": start[0], "lng": start[1]},
+        "sequence": sequence,
+        "total_km": round(total_km, 2),
+        "total_minutes": elapsed - settings.ROUTE_STOP_MINUTES if sequence else 0,
+    }
@@ -1,3 +1,314 @@
-from django.test import TestCase
+import random
+import time
+from itertools import permutations
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from account.models import UserAuth
+from common_portal.backends import HaversineRoutingBackend, Route
+from common_portal.geo import KM_PER_DEGREE_LAT
+from customer_portal.models import DeliveryRequest
+from . import geofence, live_eta, location_buffer, presence
+from .consumers import DriverLocationConsumer
+from .dispatch import apply_assignments, hungarian, solve_optimal
+from .locations import update_driver_position
+from .sequencing import build_stops, sequence_stops
 
 # Create your tests here.
+
+
+def make_order(customer, **fields):
+    fields = {
+        'status': 'confirmed',
+        'pickup_location_lat': 22.35, 'pickup_location_long': 91.82,
+        'delivery_location_lat': 22.37, 'delivery_location_long': 91.83,
+        **fields
+    }
+    return DeliveryRequest.objects.create(customer=customer, **fields)
+
+
+class HungarianTests(SimpleTestCase):
+    def brute_force(self, cost):
+        n, m = cost.shape
+        return min(sum(cost[i, cols[i]] for i in range(n)) for cols in permutations(range(m), n))
+
+    def test_assignment_is_optimal(self):
+        rng = np.random.default_rng(3)
+        for shape in [(1, 1), (3, 3), (5, 5), (4, 6), (6, 7)]:
+            for _ in range(5):
+                cost = rng.integers(0, 50, shape).astype(float)
+                assignment = hungarian(cost)
+                self.assertEqual(len(set(assignment.tolist())), shape[0])
+                self.assertEqual(cost[np.arange(shape[0]), assignment].sum(), self.brute_force(cost))
+
+    def test_pairs_above_max_cost_are_left_out(self):
+        cost = np.array([[1.0, 9.0], [9.0, 20.0], [2.0, 30.0]])
+        # Row 0 gives column 0 up to row 2, rows 1 and 2 are too far from column 1
+        self.assertEqual(sorted(solve_optimal(cost, max_cost=10)), [(0, 1), (2, 0)])
+
+
+class ApplyAssignmentsTests(TestCase):
+    def setUp(self):
+        self.customer = UserAuth.objects.create_user(email='customer@example.com', password='x', role='customer')
+        self.driver = UserAuth.objects.create_user(email='driver@example.com', password='x', role='driver')
+
+    def test_busy_driver_gets_no_second_order(self):
+        first, second = make_order(self.customer), make_order(self.customer)
+        self.assertEqual(apply_assignments([(first.id, self.driver.id)]), [(first.id, self.driver.id)])
+        # A second round that still saw the driver as free
+        self.assertEqual(apply_assignments([(second.id, self.driver.id)]), [])
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.assign_driver_id), ('confirmed', None))
+
+
+class RecordingBackend(HaversineRoutingBackend):
+    def __init__(self):
+        super().__init__()
+        self.timeouts = []
+
+    def matrix(self, origins, destinations, timeout=None):
+        self.timeouts.append(timeout)
+        return super().matrix(origins, destinations, timeout)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}, ROUTING_BACKENDS=['common_portal.backends.HaversineRoutingBackend'])
+class SequenceStopsTests(TestCase):
+    def orders(self, count, seed):
+        rng = random.Random(seed)
+        return [
+            DeliveryRequest(
+                id=f'S{i}', status=rng.choice(['assigned', 'assigned', 'picked_up']),
+                pickup_location_lat=22.3 + rng.random() / 10, pickup_location_long=91.8 + rng.random() / 10,
+                delivery_location_lat=22.3 + rng.random() / 10, delivery_location_long=91.8 + rng.random() / 10,
+            )
+            for i in range(count)
+        ]
+
+    def test_every_pickup_comes_before_its_drop(self):
+        for seed in range(5):
+            orders = self.orders(6, seed)
+            stops, legs_km, _ = sequence_stops((22.35, 91.85), build_stops(orders), time_budget=0.05)
+            self.assertEqual(len(stops), len(legs_km))
+            seen = {}
+            for position, stop in enumerate(stops):
+                seen.setdefault(stop.order_id, {})[stop.kind] = position
+            for order in orders:
+                visits = seen[order.id]
+                if order.status == 'picked_up':
+                    self.assertEqual(list(visits), ['drop'])
+                else:
+                    self.assertLess(visits['pickup'], visits['drop'])
+
+    @override_settings(ROUTE_SEQUENCING_MATRIX_TIMEOUT=0.3)
+    def test_matrix_fetch_has_its_own_timeout(self):
+        backend = RecordingBackend()
+        with mock.patch('common_portal.utils.get_routing_backend', return_value=backend):
+            sequence_stops((22.35, 91.85), build_stops(self.orders(3, 0)))
+        self.assertEqual(backend.timeouts, [0.3])
+
+
+class LiveEtaTests(TestCase):
+    def setUp(self):
+        customer = UserAuth.objects.create_user(email='customer@example.com', password='x', role='customer')
+        self.driver = UserAuth.objects.create_user(email='driver@example.com', password='x', role='driver')
+        self.orders = [make_order(customer, status='on_the_way', assign_driver=self.driver) for _ in range(3)]
+        self.timeouts = []
+        self.addCleanup(live_eta._local_state.clear)
+
+    def slow_route(self, *args, timeout=None, with_route=False):
+        self.timeouts.append(timeout)
+        time.sleep(0.15)
+        return 3.0, 10, Route(3.0, 10, 'test', timeout == 0)
+
+    def test_lookups_share_one_budget(self):
+        with mock.patch.object(live_eta, 'calculate_distance_and_time', self.slow_route), \
+                mock.patch.object(live_eta, 'push_eta') as push:
+            self.assertEqual(live_eta.refresh_live_eta(self.driver.id, 22.36, 91.82, budget=0.2), 3)
+        self.assertEqual(push.call_count, 3)
+        self.assertLessEqual(self.timeouts[0], 0.2)
+        self.assertEqual(self.timeouts[2], 0)
+        state = live_eta.load_state(self.driver.id)['orders']
+        # The order that only got the local estimate is routed again next time
+        self.assertEqual(sorted(order['routed_at'] is None for order in state.values()), [False, False, True])
+
+
+class BufferRedis:
+    """The Redis calls of taking buffered positions"""
+    def __init__(self, positions):
+        self.positions = {str(driver_id): ','.join(map(str, position)) for driver_id, position in positions.items()}
+        self.dirty = set(self.positions)
+
+    def spop(self, key, count):
+        taken, self.dirty = list(self.dirty), set()
+        return taken
+
+    def hmget(self, key, ids):
+        return [self.positions.get(driver_id) for driver_id in ids]
+
+
+class LocationFlushTests(TestCase):
+    def setUp(self):
+        self.driver = UserAuth.objects.create_user(email='driver@example.com', password='x', role='driver')
+        patcher = mock.patch.object(location_buffer, 'get_redis', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(location_buffer._unsaved.clear)
+        self.addCleanup(location_buffer._track_points.clear)
+
+    def test_newest_report_wins_over_redis(self):
+        client = BufferRedis({5: (22.35, 91.82, 10.0), 6: (22.35, 91.82, 10.0)})
+        location_buffer._unsaved.update({5: (22.30, 91.80, 5.0), 6: (22.36, 91.83, 15.0), 7: (22.37, 91.84, 1.0)})
+        with mock.patch.object(location_buffer, 'get_redis', return_value=client):
+            positions, ids = location_buffer._take_unsaved()
+        self.assertEqual(positions, {5: (22.35, 91.82, 10.0), 6: (22.36, 91.83, 15.0), 7: (22.37, 91.84, 1.0)})
+        # Only the positions that came from Redis go back to its dirty set on failure
+        self.assertEqual(ids, ['5'])
+
+    def test_failed_write_keeps_the_positions(self):
+        location_buffer._unsaved[self.driver.id] = (22.35, 91.82, 1.0)
+        location_buffer._track_points[self.driver.id] = [(22.35, 91.82, 1.0)]
+
+        def failing_cursor():
+            # A newer report arrives while the write is under way
+            location_buffer._unsaved[self.driver.id] = (22.36, 91.83, 2.0)
+            raise DatabaseError
+
+        with mock.patch.object(location_buffer, 'append_points', side_effect=DatabaseError), \
+                mock.patch.object(location_buffer.connection, 'cursor', failing_cursor):
+            with self.assertRaises(DatabaseError):
+                location_buffer.flush()
+        self.assertEqual(location_buffer._track_points, {self.driver.id: [(22.35, 91.82, 1.0)]})
+        self.assertEqual(location_buffer._unsaved, {self.driver.id: (22.36, 91.83, 2.0)})
+
+        with mock.patch.object(location_buffer, 'append_points') as append_points:
+            self.assertEqual(location_buffer.flush(), 1)
+        append_points.assert_called_once_with({self.driver.id: [(22.35, 91.82, 1.0)]})
+        self.driver.refresh_from_db()
+        self.assertEqual((self.driver.location_latitude, self.driver.location_longitude), (22.36, 91.83))
+        self.assertEqual(location_buffer._unsaved, {})
+
+
+class PublishRoundTests(SimpleTestCase):
+    def test_failed_broadcast_still_publishes(self):
+        self.addCleanup(location_buffer.take_pending)
+        location_buffer.record(7, 22.35, 91.82)
+        location_buffer.heartbeat(8)
+        with mock.patch.object(location_buffer, 'broadcast_positions', side_effect=ConnectionError), \
+                mock.patch.object(location_buffer, 'publish') as publish, \
+                mock.patch.object(location_buffer, 'check_positions') as check_positions, \
+                self.assertLogs('driver_portal.location_buffer', 'ERROR'):
+            async_to_sync(location_buffer.publish_round)()
+        pending, heartbeats = publish.call_args.args
+        self.assertEqual((list(pending), heartbeats), ([7], {8}))
+        check_positions.assert_called_once_with(pending)
+
+
+class ExpiringRedis:
+    """The few Redis calls presence makes, with key expiry on a fake clock"""
+    def __init__(self):
+        self.now = 0
+        self.values = {}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        pass
+
+    def set(self, key, value, ex=None):
+        self.values[key] = (value, self.now + ex if ex else None)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def live(self):
+        return {key: value for key, (value, expires) in self.values.items() if expires is None or expires > self.now}
+
+    def mget(self, keys):
+        live = self.live()
+        return [live.get(key) for key in keys]
+
+    def scan_iter(self, match, count=None):
+        return [key for key in self.live() if key.startswith(match.rstrip('*'))]
+
+
+class PresenceTests(SimpleTestCase):
+    def setUp(self):
+        self.client = ExpiringRedis()
+        patcher = mock.patch.object(presence, 'get_redis', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(PRESENCE_TTL=30)
+    def test_drivers_drop_out_without_heartbeats(self):
+        presence.mark_online([1, 2])
+        self.client.now = 20
+        presence.mark_online([2])
+        self.assertEqual(presence.online_among([1, 2, 3]), {1, 2})
+        self.client.now = 35
+        self.assertEqual(presence.online_among([1, 2, 3]), {2})
+        self.client.now = 50
+        self.assertEqual(presence.online_among([1, 2, 3]), set())
+
+    def test_disconnect_drops_unpublished_reports(self):
+        self.addCleanup(location_buffer.take_pending)
+        location_buffer.record(7, 22.35, 91.82)
+        location_buffer.heartbeat(7)
+        location_buffer.heartbeat(8)
+        presence.mark_online([7, 8])
+
+        consumer = DriverLocationConsumer()
+        consumer.driver_id = 7
+        with mock.patch('driver_portal.consumers.driver_index') as index:
+            async_to_sync(consumer.disconnect)(1000)
+        index.remove.assert_called_once_with(7)
+        self.assertEqual(presence.online_among([7, 8]), {8})
+
+        # The next publish neither marks the driver online nor indexes them again
+        with mock.patch.object(location_buffer, 'driver_index') as index:
+            self.assertEqual(location_buffer.publish(), 0)
+        index.update_many.assert_not_called()
+        self.assertEqual(presence.online_among([7, 8]), {8})
+
+
+@override_settings(GEOFENCE_RADIUS_M=75, GEOFENCE_EXIT_FACTOR=1.5, GEOFENCE_REFRESH_INTERVAL=3600)
+class GeofenceTests(SimpleTestCase):
+    def setUp(self):
+        geofence._table = geofence.FenceTable([(7, 'A1', 3, 'assigned', geofence.PICKUP, 22.35, 91.82)])
+        geofence._inside.clear()
+        self.addCleanup(geofence.reset_fences)
+        self.addCleanup(geofence._inside.clear)
+
+    def events_at(self, metres):
+        position = {7: (22.35 + metres / (KM_PER_DEGREE_LAT * 1000), 91.82, 0)}
+        return [event for _, _, event in geofence.detect(position)]
+
+    def test_exit_needs_the_wider_radius(self):
+        # Starting outside, then jitter around the edge of the 75 m fence
+        steps = [(200, []), (100, []), (60, ['enter']), (100, []), (80, []), (60, []), (130, ['exit']), (100, []), (70, ['enter'])]
+        for metres, expected in steps:
+            self.assertEqual(self.events_at(metres), expected, metres)
+
+
+class HttpPresenceTests(TestCase):
+    def setUp(self):
+        self.client = ExpiringRedis()
+        patcher = mock.patch.object(presence, 'get_redis', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_going_online_over_http_survives_the_presence_sync(self):
+        driver = UserAuth.objects.create_user(email='driver@example.com', password='x', role='driver')
+        UserAuth.objects.filter(id=driver.id).update(is_online=True)
+        driver.is_online = True
+        update_driver_position(driver)
+        self.assertEqual(presence.sync_presence(), (0, 0))
+        self.assertTrue(UserAuth.objects.get(id=driver.id).is_online)
+
+        driver.is_online = False
+        update_driver_position(driver)
+        self.assertEqual(presence.online_among([driver.id]), set())
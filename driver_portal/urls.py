@@ -4,4 +4,5 @@ from .views import *
 urlpatterns = [
     path('earning_history/', DriverEarningHistoryView.as_view(), name='earning_history'),
     path('single_earning_history/<int:pk>/', DriverEarningHistoryView.as_view(), name='single_earning_history'),
+    path('presence/', DriverPresenceView.as_view(), name='driver_presence'),
 ]
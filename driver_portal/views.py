@@ -5,6 +5,7 @@ from customer_portal.models import DeliveryRequest
 from .models import *
 from account.models import UserAuth
 from .serializers import *
+from .presence import online_among
 
 class RateDriverView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -52,3 +53,24 @@ class DriverEarningHistoryView(APIView):
             history = DriverEarningHistory.objects.filter(driver=driver)
         serializer = DriverEarningHistorySerializer(history, many=True)
         return Response({"status":"success","data":serializer.data}, status=status.HTTP_200_OK)
+
+
+class DriverPresenceView(APIView):
+    """
+    Which of ?ids=1,2,3 are online drivers, from socket heartbeats
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    max_ids = 500
+
+    def get(self, request):
+        try:
+            ids = [int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()]
+        except ValueError:
+            return Response({"status":"error","message": "ids must be a comma separated list of user ids."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.max_ids:
+            return Response({"status":"error","message": f"At most {self.max_ids} ids per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+        online = online_among(ids)
+        if online is None:
+            online = set(UserAuth.objects.filter(id__in=ids, role='driver', is_online=True).values_list('id', flat=True))
+        return Response({"status":"success","data":{str(user_id): user_id in online for user_id in ids}}, status=status.HTTP_200_OK)
@@ -22,3 +22,23 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             "data": event.get("data", {}),
             "created_at": event["created_at"],
         }))
+
+    async def send_eta_update(self, event):
+        await self.send(text_data=json.dumps({
+            "type": "eta_update",
+            "order_id": event["order_id"],
+            "distance_km": event["distance_km"],
+            "eta_minutes": event["eta_minutes"],
+            "arrives_at": event["arrives_at"],
+            "updated_at": event["updated_at"],
+        }))
+
+    async def send_geofence_event(self, event):
+        await self.send(text_data=json.dumps({
+            "type": "geofence_event",
+            "order_id": event["order_id"],
+            "fence": event["fence"],
+            "event": event["event"],
+            "status": event["status"],
+            "applied": event["applied"],
+        }))
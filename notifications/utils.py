@@ -5,7 +5,6 @@ from channels.layers import get_channel_layer
 from .models import Notification, NotificationRecipient
 
 User = get_user_model()
-channel_layer = get_channel_layer()
 
 def create_notification(title, message, data=None, recipient_ids=None, send_to_all=False):
     data = data or {}
@@ -33,6 +32,7 @@ def create_notification(title, message, data=None, recipient_ids=None, send_to_a
     NotificationRecipient.objects.bulk_create(relations)
 
     # 🔔 Send to WebSocket for real-time updates
+    channel_layer = get_channel_layer()
     for user in users:
         async_to_sync(channel_layer.group_send)(
             f"user_{user.id}_notifications",